@@ -0,0 +1,261 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault('BATCH_SIZE', '1000')
+
+import csv_scanner
+import db
+import handlers
+from synthetic import FakeDatabase, generate_msisdns, generate_registry, write_registry_csv
+
+# Файл базовых значений и допустимое замедление относительно него
+BASELINE_FILE = 'bench_baseline.json'
+DEFAULT_THRESHOLD = 0.25
+
+# Количество итераций калибровочного цикла
+CALIBRATION_LOOPS = 1000000
+
+
+def calibrate(repeat: int = 5) -> float:
+    """
+    Измеряет время калибровочного цикла на чистом Python: лучшее из repeat запусков.
+
+    Время тестов делится на время этого цикла, поэтому относительное время
+    можно сравнивать между запусками на машинах разной скорости.
+
+    Параметры:
+    repeat (int): Количество запусков.
+
+    Возвращает:
+    float: Время цикла в секундах.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        total = 0
+        for i in range(CALIBRATION_LOOPS):
+            total += i * i % 7
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(function: Callable[[], int], repeat: int, setup: Optional[Callable[[], None]] = None,
+            database: Optional[FakeDatabase] = None) -> Dict[str, float]:
+    """
+    Измеряет время выполнения функции: лучшее из repeat запусков.
+
+    Параметры:
+    function (Callable[[], int]): Функция, возвращающая количество обработанных строк.
+    repeat (int): Количество запусков.
+    setup (Optional[Callable[[], None]]): Подготовка перед каждым запуском (не измеряется).
+    database (Optional[FakeDatabase]): База данных, обращения к которой подсчитываются.
+
+    Возвращает:
+    Dict[str, float]: Время в секундах, строки, строк в секунду и обращения к базе данных за один запуск.
+    """
+    best = None
+    rows = 0
+    round_trips = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        if database:
+            database.calls.clear()
+            database.inserted.clear()
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            rows = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        round_trips = database.round_trips if database else 0
+    return {'seconds': best, 'rows': rows, 'rows_per_second': rows / best if best else 0.0,
+            'round_trips': round_trips}
+
+
+def run_benchmarks(codes: int, rows_per_code: int, msisdns: int, lookups: int, repeat: int,
+                   seed: int) -> Dict[str, Dict[str, float]]:
+    """
+    Выполняет набор тестов производительности на синтетических данных.
+
+    Параметры:
+    codes (int): Количество кодов АВС/DEF в реестре.
+    rows_per_code (int): Количество диапазонов в коде.
+    msisdns (int): Количество номеров.
+    lookups (int): Количество номеров для bin_search.
+    repeat (int): Количество запусков каждого теста.
+    seed (int): Начальное значение генератора случайных чисел.
+
+    Возвращает:
+    Dict[str, Dict[str, float]]: Результаты по имени теста.
+    """
+    df = generate_registry(codes, rows_per_code, seed)
+    phone_numbers = generate_msisdns(df, msisdns, seed)
+    numbers = [phone_number[0] for phone_number in phone_numbers]
+    rows = list(df[['АВС/ DEF', 'От', 'До', 'Емкость']].itertuples(index=False, name=None))
+    records = [handlers.form_tuple(pset_id, prefix, 608, 'bench')
+               for pset_id, prefix in enumerate(
+                   prefix for code, low, high, _ in rows for prefix in handlers.range_to_prefixes(str(code), low, high))]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry_path = os.path.join(tmp_dir, 'DEF-bench.csv')
+        write_registry_csv(df, registry_path)
+
+        def clear_scan_cache() -> None:
+            csv_scanner._verdicts.clear()
+            csv_scanner._digests.clear()
+
+        def bin_search() -> int:
+            for number in numbers[:lookups]:
+                handlers.bin_search(df, number)
+            return min(lookups, len(numbers))
+
+        def batch_lookup() -> int:
+            handlers.batch_lookup(df, numbers)
+            return len(numbers)
+
+        def form_prefix() -> int:
+            for code, low, high, capacity in rows:
+                handlers.form_prefix(str(code), low, high, capacity)
+            return len(rows)
+
+        results['bin_search'] = measure(bin_search, repeat)
+        results['batch_lookup'] = measure(batch_lookup, repeat)
+        results['form_prefix'] = measure(form_prefix, repeat)
+        results['is_safe_csv_file'] = measure(lambda: csv_scanner.is_safe_csv_file(registry_path) and len(rows), repeat,
+                                              setup=clear_scan_cache)
+        output_path = os.path.join(tmp_dir, 'out.csv')
+        results['write_to_csv'] = measure(lambda: handlers.write_to_csv(records, output_path) or len(records), repeat)
+
+        database = FakeDatabase()
+        pooled_connection = db.pooled_connection
+        db.pooled_connection = database.pooled_connection
+        try:
+            results['insert_prefix_records'] = measure(
+                lambda: db.insert_prefix_records(records) and len(database.inserted), repeat, database=database)
+            results['insert_csv_standart_data_parallel'] = measure(
+                lambda: db.insert_csv_standart_data_parallel(registry_path) and len(database.inserted), repeat,
+                setup=clear_scan_cache, database=database)
+        finally:
+            db.pooled_connection = pooled_connection
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """
+    Сравнивает результаты с базовыми значениями.
+
+    Регрессией считается большее количество обращений к базе данных, а
+    также относительное время (см. calibrate) больше базового более чем на
+    threshold, если в базовых значениях оно есть.
+
+    Параметры:
+    results (Dict[str, Dict[str, float]]): Результаты тестов.
+    baseline (Dict[str, Dict[str, float]]): Базовые значения.
+    threshold (float): Допустимое относительное замедление.
+
+    Возвращает:
+    List[str]: Описания регрессий.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if 'relative' in base and result['relative'] > base['relative'] * (1 + threshold):
+            regressions.append(f"{name}: относительное время {result['relative']:.3f} против {base['relative']:.3f} "
+                               f"(+{result['relative'] / base['relative'] - 1:.0%}, порог {threshold:.0%})")
+        if result['round_trips'] > base['round_trips']:
+            regressions.append(f"{name}: обращений к базе данных {result['round_trips']} "
+                               f"против {base['round_trips']}")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> None:
+    """
+    Выводит таблицу результатов.
+
+    Параметры:
+    results (Dict[str, Dict[str, float]]): Результаты тестов.
+    baseline (Dict[str, Dict[str, float]]): Базовые значения.
+    """
+    print(f"{'Тест':36} {'Время, с':>10} {'Строк':>8} {'Строк/с':>12} {'Обращений':>10} {'Изменение':>10}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        change = f"{result['relative'] / base['relative'] - 1:+.0%}" if base and base.get('relative') else '-'
+        print(f"{name:36} {result['seconds']:10.4f} {result['rows']:8d} {result['rows_per_second']:12.0f} "
+              f"{result['round_trips']:10d} {change:>10}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Запускает тесты производительности и сравнивает их с базовыми значениями.
+
+    Параметры:
+    argv (Optional[List[str]]): Аргументы командной строки.
+
+    Возвращает:
+    int: 0, если регрессий нет, иначе 1.
+    """
+    parser = argparse.ArgumentParser(description="Тесты производительности на синтетических данных.")
+    parser.add_argument("--codes", type=int, default=20, help="количество кодов АВС/DEF в реестре")
+    parser.add_argument("--rows-per-code", type=int, default=500, help="количество диапазонов в коде")
+    parser.add_argument("--msisdns", type=int, default=20000, help="количество номеров")
+    parser.add_argument("--lookups", type=int, default=500, help="количество номеров для bin_search")
+    parser.add_argument("--repeat", type=int, default=3, help="количество запусков каждого теста")
+    parser.add_argument("--seed", type=int, default=1, help="начальное значение генератора случайных чисел")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="файл базовых значений")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="допустимое замедление (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как базовые значения")
+    parser.add_argument("--round-trips-only", action="store_true",
+                        help="сохранить только количество обращений к базе данных (для bench_baseline.json в репозитории)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    calibration = calibrate()
+    results = run_benchmarks(args.codes, args.rows_per_code, args.msisdns, args.lookups, args.repeat, args.seed)
+    for result in results.values():
+        result['relative'] = result['seconds'] / calibration
+    print(f"Калибровочный цикл: {calibration:.4f} с")
+
+    params = {'codes': args.codes, 'rows_per_code': args.rows_per_code, 'msisdns': args.msisdns,
+              'lookups': args.lookups, 'seed': args.seed}
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as file:
+            stored = json.load(file)
+        if stored.get('params') == params:
+            baseline = stored['results']
+        else:
+            print(f"Базовые значения {args.baseline} получены с другими параметрами и не используются")
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        # Абсолютное время зависит от машины и не сохраняется
+        saved = {name: {'relative': result['relative'], 'round_trips': result['round_trips']}
+                 for name, result in results.items()}
+        if args.round_trips_only:
+            saved = {name: {'round_trips': result['round_trips']} for name, result in saved.items()}
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump({'params': params, 'results': saved}, file, ensure_ascii=False, indent=2)
+        print(f"Базовые значения сохранены в {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"Регрессия: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import os
+import re
+import codecs
+import hashlib
+import logging
+import threading
+import metrics
+from collections import OrderedDict
+from typing import List, NamedTuple
+
+# Подозрительные паттерны, объединенные в одно регулярное выражение
+SUSPICIOUS_PATTERN = re.compile(
+    r"\b(?:SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXECUTE IMMEDIATE|EXEC|EVAL|INTO OUTFILE|UNION|JOIN|WHERE)\b"
+    r"|\b(?:os|sys)\.",
+    flags=re.IGNORECASE,
+)
+
+# Размер блока чтения файла в байтах
+CHUNK_SIZE = 1024 * 1024
+
+# Количество записей в каждом кэше: файлов реестра несколько, а в режиме watch
+# каждая новая версия файла добавляла бы запись, поэтому старые записи вытесняются
+CACHE_SIZE = 64
+
+
+class LRUCache(OrderedDict):
+    """
+    Словарь ограниченного размера: при переполнении удаляется запись, к которой дольше всего не обращались.
+
+    Файлы проверяются и из потоков сервиса поиска, поэтому get и запись выполняются под блокировкой.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self:
+                return default
+            self.move_to_end(key)
+            return self[key]
+
+    def __setitem__(self, key, value) -> None:
+        with self.lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while len(self) > self.maxsize:
+                self.popitem(last=False)
+
+
+# Результаты проверки по хэшу содержимого и хэши по (путь, размер, время изменения)
+_verdicts: LRUCache = LRUCache(CACHE_SIZE)
+_digests: LRUCache = LRUCache(CACHE_SIZE)
+
+
+class Finding(NamedTuple):
+    """
+    Найденный подозрительный фрагмент.
+
+    row (int): Номер строки файла, начиная с 1 (строка заголовка - 1).
+    column (int): Позиция фрагмента в строке, начиная с 1.
+    match (str): Найденный фрагмент.
+    line (str): Строка файла целиком.
+    """
+    row: int
+    column: int
+    match: str
+    line: str
+
+
+class ScanResult(NamedTuple):
+    """
+    Результат проверки CSV-файла.
+
+    safe (bool): True, если подозрительные паттерны не найдены.
+    digest (str): SHA-256 содержимого файла.
+    findings (List[Finding]): Найденные подозрительные фрагменты.
+    cached (bool): True, если результат взят из кэша.
+    """
+    safe: bool
+    digest: str
+    findings: List[Finding]
+    cached: bool = False
+
+
+def file_digest(file_path: str) -> str:
+    """
+    Вычисляет SHA-256 содержимого файла. Для неизменившегося файла хэш берется из кэша.
+
+    Параметры:
+    file_path (str): Путь к файлу.
+
+    Возвращает:
+    str: Шестнадцатеричное представление хэша.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _digests[key] = digest
+    return digest
+
+
+def _scan_block(block: str, first_row: int, findings: List[Finding]) -> None:
+    """
+    Ищет подозрительные паттерны в блоке целых строк.
+
+    Параметры:
+    block (str): Текст, состоящий из целых строк файла.
+    first_row (int): Номер первой строки блока в файле.
+    findings (List[Finding]): Список, в который добавляются найденные фрагменты.
+    """
+    row = first_row
+    position = 0
+    for match in SUSPICIOUS_PATTERN.finditer(block):
+        row += block.count('\n', position, match.start())
+        position = match.start()
+        line_start = block.rfind('\n', 0, position) + 1
+        line_end = block.find('\n', position)
+        line = block[line_start:line_end if line_end != -1 else len(block)].rstrip('\r')
+        findings.append(Finding(row, position - line_start + 1, match.group(0), line))
+
+
+def scan_csv_file(csv_path: str) -> ScanResult:
+    """
+    Проверяет CSV-файл на наличие подозрительных паттернов за один проход.
+
+    Файл читается блоками по CHUNK_SIZE байт, каждый блок проверяется одним
+    скомпилированным выражением. Результат сохраняется по хэшу содержимого,
+    поэтому повторная проверка неизменившегося файла не требует сканирования.
+
+    Параметры:
+    csv_path (str): Путь к CSV-файлу.
+
+    Возвращает:
+    ScanResult: Результат проверки.
+    """
+    digest = file_digest(csv_path)
+    cached = _verdicts.get(digest)
+    if cached is not None:
+        metrics.count('csv_scan_cache_hits')
+        return cached._replace(cached=True)
+    metrics.count('csv_scan_cache_misses')
+
+    findings: List[Finding] = []
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    row = 1
+    tail = ''
+    with open(csv_path, 'rb') as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            text = tail + decoder.decode(chunk, final=not chunk)
+            cut = text.rfind('\n') + 1 if chunk else len(text)
+            block, tail = text[:cut], text[cut:]
+            _scan_block(block, row, findings)
+            row += block.count('\n')
+            if not chunk:
+                break
+
+    result = ScanResult(not findings, digest, findings)
+    _verdicts[digest] = result
+    logging.info(f"Файл {csv_path} проверен, найдено подозрительных фрагментов: {len(findings)}")
+    return result
+
+
+def is_safe_csv_file(csv_path: str) -> bool:
+    """
+    Проверяет безопасность CSV-файла на наличие подозрительных паттернов.
+
+    Параметры:
+    csv_path (str): Путь к CSV-файлу.
+
+    Returns:
+    bool: True, если CSV-файл безопасен, False в противном случае.
+    """
+    logging.info(f"Проверка безопасности CSV файла: {csv_path}")
+
+    try:
+        result = scan_csv_file(csv_path)
+    except Exception as e:
+        logging.error(f"Ошибка при проверке CSV-файла: {e}")
+        logging.error("Обнаружены подозрительные паттерны в CSV-файле")
+        return False
+
+    if result.cached:
+        logging.info(f"Результат проверки взят из кэша (SHA-256: {result.digest})")
+    for finding in result.findings:
+        logging.warning(f"Подозрительный паттерн '{finding.match}' найден в строке {finding.row}, "
+                        f"позиция {finding.column}: {finding.line}")
+
+    if result.safe:
+        logging.info("CSV-файл прошел проверку на безопасность")
+    else:
+        logging.error("Обнаружены подозрительные паттерны в CSV-файле")
+
+    return result.safe
@@ -0,0 +1,177 @@
+import time
+import signal
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from decouple import config
+import downloader
+import metrics
+import storage
+from csv_scanner import file_digest, is_safe_csv_file
+from handlers import handle_data, load_registry
+from pipeline import ask, download_files, export_metrics, push_to_git, registry_files
+
+
+# Время жизни справочника регионов в режиме watch, если REGION_CACHE_TTL не задан (0)
+WATCH_REGION_CACHE_TTL = 3600
+
+# Количество циклов подряд с ошибкой, после которого режим watch останавливается
+MAX_CYCLE_ERRORS = 5
+
+
+class WatchDaemon:
+    """
+    Фоновый режим: реестр опрашивается по расписанию без вопросов пользователю.
+
+    Между циклами в памяти сохраняются хранилище (пул подключений Oracle или
+    файл SQLite), разобранный реестр и справочник регионов. В каждом цикле выполняются только этапы, входные
+    данные которых изменились: TEASR_DEF и реестр перезагружаются при изменении
+    файлов реестра, префиксы строятся заново при изменении реестра или номеров.
+    """
+
+    def __init__(self, file_urls: List[str], local_file_path: Optional[str], nuser: str, interval: float) -> None:
+        """
+        Параметры:
+        file_urls (List[str]): Ссылки на файлы реестра.
+        local_file_path (Optional[str]): Локальный файл реестра на случай ошибки скачивания (USE_LOCAL_FILE).
+        nuser (str): Имя пользователя для NAVI_USER.
+        interval (float): Интервал опроса в секундах.
+        """
+        self.file_urls = file_urls
+        self.local_file_path = local_file_path
+        self.nuser = nuser
+        self.interval = interval
+        self.file_names: List[str] = []
+        self.digests: Dict[str, str] = {}
+        self.registry = None
+        self.processed: Optional[Tuple[Tuple[Tuple[str, str], ...], str]] = None
+        # Процесс работает неделями: справочник регионов без срока жизни не увидел бы новых регионов
+        region_cache_ttl = config('REGION_CACHE_TTL', default=0, cast=float) or WATCH_REGION_CACHE_TTL
+        self.backend = storage.get_backend()
+        self.region_cache = self.backend.region_cache(ttl=region_cache_ttl)
+        self.stop_event = threading.Event()
+        self.cycles = 0
+        self.max_errors = config('WATCH_MAX_ERRORS', default=MAX_CYCLE_ERRORS, cast=int)
+        self.errors = 0
+
+    def refresh_registry(self, file_names: List[str]) -> bool:
+        """
+        Загружает TEASR_DEF и реестр, если файлы реестра изменились.
+
+        Параметры:
+        file_names (List[str]): Файлы реестра.
+
+        Возвращает:
+        bool: True, если в памяти актуальный реестр.
+        """
+        digests = {file_name: file_digest(file_name) for file_name in file_names}
+        if digests == self.digests and self.registry is not None:
+            return True
+        with metrics.stage('safety_scan') as stage:
+            safe = all(is_safe_csv_file(file_name) for file_name in file_names)
+            stage.rows = len(file_names)
+        if not safe:
+            logging.error("CSV файл не прошел проверку на безопасность.")
+            return False
+        if not self.backend.load_teasr_def(file_names):
+            logging.error("Не удалось загрузить TEASR_DEF, реестр будет загружен в следующем цикле")
+            return False
+        self.registry = load_registry(file_names)
+        self.file_names = file_names
+        self.digests = digests
+        return True
+
+    def run_cycle(self) -> None:
+        """
+        Выполняет один цикл опроса.
+        """
+        # Неизменившиеся файлы (NOT_MODIFIED) остаются на диске и используются как есть
+        with metrics.stage('download') as stage:
+            download_results = download_files(self.file_urls)
+            stage.rows = sum(1 for result in download_results if result)
+        metrics.count('download_bytes', sum(result.size for result in download_results if result))
+        # Без файла хотя бы одного реестра TEASR_DEF и префиксы построились бы по части реестра,
+        # поэтому цикл пропускается, а в памяти остается прежний реестр
+        file_names = registry_files(self.file_urls, download_results, self.local_file_path, interactive=False)
+        if file_names is None:
+            logging.error("Файлы реестра недоступны, цикл пропущен")
+            return
+        if not self.refresh_registry(file_names):
+            return
+
+        with metrics.stage('msisdn_fetch') as stage:
+            phone_numbers = self.backend.get_all_msisdn()
+            stage.rows = len(phone_numbers)
+        msisdn_digest = hashlib.sha256('\n'.join(sorted(row[0] for row in phone_numbers)).encode()).hexdigest()
+        state = (tuple(sorted(self.digests.items())), msisdn_digest)
+        if state == self.processed:
+            logging.info("Реестр и номера не изменились, построение префиксов не требуется")
+            return
+
+        if handle_data(self.file_names, nuser=self.nuser, registry=self.registry, phone_numbers=phone_numbers,
+                       region_cache=self.region_cache):
+            self.processed = state
+            for result in download_results:
+                if result:
+                    downloader.mark_processed(result.file_name)
+            if ask("", "GIT_PUSH", interactive=False):
+                push_to_git()
+
+    def stop(self, *args) -> None:
+        """
+        Останавливает опрос после завершения текущего цикла.
+        """
+        logging.info("Получен сигнал остановки режима watch")
+        self.stop_event.set()
+
+    def run(self) -> None:
+        """
+        Опрашивает реестр каждые interval секунд до получения SIGINT/SIGTERM.
+        """
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        logging.info(f"Запущен режим watch, интервал опроса {self.interval} с")
+        try:
+            while not self.stop_event.is_set():
+                started = time.monotonic()
+                metrics.start_run()
+                try:
+                    self.run_cycle()
+                    self.errors = 0
+                except (Exception, SystemExit):
+                    # Ошибка цикла не останавливает режим, цикл повторяется после интервала;
+                    # handle_data сообщает об ошибке через sys.exit, поэтому перехватывается и SystemExit
+                    logging.exception("Ошибка в цикле режима watch")
+                    metrics.count('watch_cycle_errors')
+                    self.errors += 1
+                    if self.errors >= self.max_errors:
+                        logging.error(f"Режим watch остановлен после {self.errors} циклов подряд с ошибкой")
+                        print(f"Режим watch остановлен после {self.errors} циклов подряд с ошибкой")
+                        export_metrics()
+                        break
+                self.cycles += 1
+                metrics.count('watch_cycles')
+                export_metrics()
+                elapsed = time.monotonic() - started
+                logging.info(f"Цикл {self.cycles} режима watch завершен за {elapsed:.3f} с")
+                self.stop_event.wait(max(0.0, self.interval - elapsed))
+        finally:
+            storage.close_backend()
+            logging.info("Режим watch остановлен")
+
+
+def watch(file_urls: List[str], local_file_path: Optional[str] = None) -> None:
+    """
+    Запускает фоновый режим с настройками NAVI_USER и POLL_INTERVAL.
+
+    Параметры:
+    file_urls (List[str]): Ссылки на файлы реестра.
+    local_file_path (Optional[str]): Локальный файл реестра.
+    """
+    nuser = config('NAVI_USER', default='')
+    if not nuser:
+        logging.error("Для режима watch требуется параметр NAVI_USER")
+        print("Для режима watch требуется параметр NAVI_USER")
+        return
+    WatchDaemon(file_urls, local_file_path, nuser, config('POLL_INTERVAL', default=3600, cast=float)).run()
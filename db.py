@@ -4,9 +4,14 @@ import csv
 from decouple import config
 import sys
 import os
-import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Tuple, List, Optional
+from typing import Tuple, List, NamedTuple, Optional, Dict, Iterator, Iterable
+import metrics
+from csv_scanner import is_safe_csv_file
+from tables import CSV_DATE_FORMAT, CSV_DATETIME_FORMAT, latest_prefix_actions, read_registry_rows, shard_rows_by_code
 
 
 # Настройка логгирования
@@ -23,16 +28,41 @@ def setup_logging(log_folder: str) -> None:
     logging.basicConfig(filename=log_file_path, level=logging.INFO, format='%(asctime)s - %(message)s')
 
 
-setup_logging("logs")
+class DbCredentials(NamedTuple):
+    """
+    Учетные данные для подключения к базе данных.
+
+    username (str): Имя пользователя.
+    password (str): Пароль.
+    dsn (str): DSN подключения.
+    """
+    username: str
+    password: str
+    dsn: str
+
+
+# Учетные данные, прочитанные при первом подключении
+_credentials: Optional[DbCredentials] = None
+
+
+def get_credentials() -> DbCredentials:
+    """
+    Возвращает учетные данные для подключения к базе данных, читая их из конфигурации при первом обращении.
 
-# Учетные данные для подключения к базе данных
-try:
-    username: str = config("DB_USERNAME")
-    password: str = config("DB_PASSWORD")
-    dsn: str = config("DB_DSN")
-except Exception as e:
-    logging.error(f"Ошибка при чтении учетных данных: {e}")
-    sys.exit(1)
+    Returns:
+    DbCredentials: Учетные данные.
+
+    Raises:
+    sys.exit(1): В случае отсутствия учетных данных в конфигурации.
+    """
+    global _credentials
+    if _credentials is None:
+        try:
+            _credentials = DbCredentials(config("DB_USERNAME"), config("DB_PASSWORD"), config("DB_DSN"))
+        except Exception as e:
+            logging.error(f"Ошибка при чтении учетных данных: {e}")
+            sys.exit(1)
+    return _credentials
 
 
 def set_cfg_ora_clnt() -> None:
@@ -67,7 +97,8 @@ def connect_db() -> Tuple[ora.Connection, ora.Cursor]:
     """
     logging.info("Подключение к базе данных")
     try:
-        connection = ora.connect(user=username, password=password, dsn=dsn)
+        credentials = get_credentials()
+        connection = ora.connect(user=credentials.username, password=credentials.password, dsn=credentials.dsn)
         cursor = connection.cursor()
         logging.info("Подключение к базе данных успешно установлено")
         return connection, cursor
@@ -96,6 +127,143 @@ def close_db(connection: ora.Connection, cursor: ora.Cursor) -> None:
     logging.info("Подключение к базе данных закрыто")
 
 
+# Общий пул сессий Oracle и статистика выдачи подключений
+_pool: Optional[ora.ConnectionPool] = None
+pool_stats: Dict[str, float] = {"acquired": 0, "hits": 0, "misses": 0, "wait_time": 0.0}
+
+
+def get_pool() -> ora.ConnectionPool:
+    """
+    Возвращает общий пул сессий Oracle, создавая его при первом обращении.
+
+    Returns:
+    ora.ConnectionPool: Пул сессий.
+
+    Raises:
+    sys.exit(1): В случае ошибки создания пула.
+    """
+    global _pool
+    if _pool is None:
+        logging.info("Создание пула подключений к базе данных")
+        credentials = get_credentials()
+        try:
+            _pool = ora.create_pool(
+                user=credentials.username,
+                password=credentials.password,
+                dsn=credentials.dsn,
+                min=config("DB_POOL_MIN", default=1, cast=int),
+                max=config("DB_POOL_MAX", default=4, cast=int),
+                increment=config("DB_POOL_INCREMENT", default=1, cast=int),
+                stmtcachesize=config("DB_STMT_CACHE_SIZE", default=50, cast=int),
+                getmode=ora.POOL_GETMODE_WAIT,
+            )
+            logging.info("Пул подключений к базе данных создан")
+        except ora.DatabaseError as e:
+            error, = e.args
+            logging.error(f"Ошибка базы данных: {error.code}, {error.message}")
+            sys.exit(1)
+        except Exception as e:
+            logging.error(f"Ошибка: {e}")
+            sys.exit(1)
+    return _pool
+
+
+class CountingCursor:
+    """
+    Курсор, учитывающий обращения к базе данных в метрике db_round_trips.
+
+    Учитываются вызовы execute и executemany, количество переданных строк
+    executemany учитывается в метрике db_rows_sent. Остальные атрибуты и
+    методы передаются исходному курсору.
+    """
+
+    def __init__(self, cursor: ora.Cursor) -> None:
+        object.__setattr__(self, "_cursor", cursor)
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, statement: str, *args, **kwargs):
+        metrics.count("db_round_trips")
+        return self._cursor.execute(statement, *args, **kwargs)
+
+    def executemany(self, statement: str, parameters, *args, **kwargs):
+        metrics.count("db_round_trips")
+        metrics.count("db_rows_sent", parameters if isinstance(parameters, int) else len(parameters))
+        return self._cursor.executemany(statement, parameters, *args, **kwargs)
+
+
+@contextmanager
+def pooled_connection() -> Iterator[Tuple[ora.Connection, ora.Cursor]]:
+    """
+    Выдает подключение и курсор из общего пула и возвращает подключение в пул по завершении.
+
+    Returns:
+    Iterator[Tuple[ora.Connection, ora.Cursor]]: Кортеж с объектами подключения и курсора.
+
+    Raises:
+    sys.exit(1): В случае ошибки получения подключения из пула.
+    """
+    pool = get_pool()
+    opened = pool.opened
+    started = time.perf_counter()
+    try:
+        connection = pool.acquire()
+    except ora.DatabaseError as e:
+        error, = e.args
+        logging.error(f"Ошибка базы данных: {error.code}, {error.message}")
+        sys.exit(1)
+    pool_stats["wait_time"] += time.perf_counter() - started
+    pool_stats["acquired"] += 1
+    if pool.opened > opened:
+        pool_stats["misses"] += 1
+    else:
+        pool_stats["hits"] += 1
+
+    cursor = CountingCursor(connection.cursor())
+    try:
+        yield connection, cursor
+    finally:
+        cursor.close()
+        pool.release(connection)
+
+
+def get_pool_stats() -> Dict[str, float]:
+    """
+    Возвращает статистику выдачи подключений из пула.
+
+    Returns:
+    Dict[str, float]: Количество выдач, попаданий, промахов (открытий новых сессий)
+    и суммарное время ожидания подключения в секундах.
+    """
+    stats = dict(pool_stats)
+    if _pool is not None:
+        stats["opened"] = _pool.opened
+        stats["busy"] = _pool.busy
+    return stats
+
+
+def close_pool() -> None:
+    """
+    Закрывает общий пул сессий и записывает статистику его использования в лог.
+    """
+    global _pool
+    if _pool is not None:
+        stats = get_pool_stats()
+        metrics.set_hit_ratio("pool", stats["hits"], stats["misses"])
+        logging.info(f"Статистика пула подключений: выдано {stats['acquired']}, попаданий {stats['hits']}, "
+                     f"промахов {stats['misses']}, ожидание {stats['wait_time']:.3f} с")
+        _pool.close(force=True)
+        _pool = None
+        logging.info("Пул подключений к базе данных закрыт")
+
+
 def execute_sql(cursor: ora.Cursor, sql: str, params: Optional[dict] = None) -> None:
     """
     Выполняет SQL-запрос.
@@ -124,148 +292,387 @@ def execute_sql(cursor: ora.Cursor, sql: str, params: Optional[dict] = None) ->
         raise
 
 
-def create_temp_table() -> None:
+# Синоним реестра, которым пользуются читатели, и две таблицы, на которые он указывает попеременно
+TEASR_DEF_TABLE = "TEASR_DEF"
+TEASR_DEF_TABLES = ("TEASR_DEF_A", "TEASR_DEF_B")
+
+
+def drop_table_sql(table_name: str) -> str:
+    """
+    Формирует PL/SQL-блок удаления таблицы, не падающий при ее отсутствии.
+
+    Параметры:
+    table_name (str): Имя таблицы в схеме BIS.
+
+    Returns:
+    str: PL/SQL-блок.
+    """
+    return f"""
+        BEGIN
+            EXECUTE IMMEDIATE 'DROP TABLE "BIS"."{table_name}" PURGE';
+        EXCEPTION
+            WHEN OTHERS THEN
+                IF SQLCODE != -942 THEN
+                    RAISE;
+                END IF;
+        END;
+        """
+
+
+def create_temp_table(table_name: str = TEASR_DEF_TABLE) -> bool:
     """
     Создает временную таблицу в базе данных.
 
+    Параметры:
+    table_name (str): Имя таблицы в схеме BIS.
+
+    Returns:
+    bool: True, если таблица создана.
+    """
+    logging.info(f"Создание временной таблицы {table_name}")
+    try:
+        with pooled_connection() as (connection, cursor):
+            create_table_sql = f"""
+                CREATE TABLE "BIS"."{table_name}" (
+                     "DEF" VARCHAR2(20), 
+                     "ST" VARCHAR2(20), 
+                     "EN" VARCHAR2(20), 
+                     "CO" VARCHAR2(20), 
+                     "OP" VARCHAR2(200), 
+                     "DIR" VARCHAR2(500), 
+                     "INN" VARCHAR2(130)
+                     )
+                """
+            execute_sql(cursor, drop_table_sql(table_name))
+            logging.info("Существующая таблица удалена, если она была")
+            execute_sql(cursor, create_table_sql)
+            logging.info("Таблица для данных CSV создана")
+        return True
+
+    except Exception as e:
+        logging.error(f"Ошибка: {e}")
+        print(f"Ошибка: {e}")
+        return False
+
+
+def truncate_table(table_name: str) -> bool:
+    """
+    Очищает таблицу.
+
+    Параметры:
+    table_name (str): Имя таблицы в схеме BIS.
+
+    Returns:
+    bool: True, если таблица очищена.
+    """
+    logging.warning(f"Очистка таблицы {table_name}")
+    try:
+        with pooled_connection() as (connection, cursor):
+            execute_sql(cursor, f'TRUNCATE TABLE "BIS"."{table_name}"')
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка: {e}")
+        print(f"Ошибка: {e}")
+        return False
+
+
+def get_active_teasr_def_table() -> Optional[str]:
+    """
+    Определяет таблицу, на которую указывает синоним TEASR_DEF.
+
+    Returns:
+    Optional[str]: Имя таблицы или None, если TEASR_DEF - не синоним (таблица
+    режима recreate или реестр еще не загружался).
+
     Raises:
-    Exception: В случае ошибки при создании таблицы.
+    Exception: Ошибка базы данных передается вызывающему.
     """
-    logging.info("Создание временной таблицы")
-    connection, cursor = None, None
+    with pooled_connection() as (connection, cursor):
+        execute_sql(cursor, """SELECT "TABLE_NAME" FROM "ALL_SYNONYMS"
+                               WHERE "OWNER" = 'BIS' AND "SYNONYM_NAME" = :synonym_name""",
+                    {'synonym_name': TEASR_DEF_TABLE})
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def drop_teasr_def_synonym() -> bool:
+    """
+    Удаляет синоним TEASR_DEF режима swap перед созданием таблицы TEASR_DEF в режиме recreate.
+
+    Returns:
+    bool: True, если синоним удален или его не было.
+    """
+    drop_synonym_sql = f"""
+        BEGIN
+            EXECUTE IMMEDIATE 'DROP SYNONYM "BIS"."{TEASR_DEF_TABLE}"';
+        EXCEPTION
+            WHEN OTHERS THEN
+                IF SQLCODE != -1434 THEN
+                    RAISE;
+                END IF;
+        END;
+        """
     try:
-        connection, cursor = connect_db()
-
-        drop_table_sql = """
-            BEGIN
-                EXECUTE IMMEDIATE 'DROP TABLE "BIS"."TEASR_DEF"';
-            EXCEPTION
-                WHEN OTHERS THEN
-                    IF SQLCODE != -942 THEN
-                        RAISE;
-                    END IF;
-            END;
-            """
-        create_table_sql = """
-            CREATE TABLE "BIS"."TEASR_DEF" (
-                 "DEF" VARCHAR2(20), 
-                 "ST" VARCHAR2(20), 
-                 "EN" VARCHAR2(20), 
-                 "CO" VARCHAR2(20), 
-                 "OP" VARCHAR2(200), 
-                 "DIR" VARCHAR2(500), 
-                 "INN" VARCHAR2(130)
-                 )
-            """
-        execute_sql(cursor, drop_table_sql)
-        logging.info("Существующая таблица удалена, если она была")
-        execute_sql(cursor, create_table_sql)
-        logging.info("Таблица для данных CSV создана")
+        with pooled_connection() as (connection, cursor):
+            execute_sql(cursor, drop_synonym_sql)
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка: {e}")
+        print(f"Ошибка: {e}")
+        return False
+
+
+def build_staging_indexes(table_name: str) -> bool:
+    """
+    Строит индекс по коду и началу диапазона на загруженной промежуточной таблице.
 
+    Индекс строится без записи в журнал повторов (NOLOGGING) и переводится
+    в режим LOGGING после подмены (см. swap_staging_table).
+
+    Параметры:
+    table_name (str): Имя промежуточной таблицы в схеме BIS.
+
+    Returns:
+    bool: True, если индекс построен.
+    """
+    logging.info(f"Построение индекса таблицы {table_name}")
+    try:
+        with pooled_connection() as (connection, cursor):
+            execute_sql(cursor, f"""CREATE INDEX "BIS"."{table_name}_IX"
+                                    ON "BIS"."{table_name}" ("DEF", "ST", "EN") NOLOGGING""")
+        return True
     except Exception as e:
         logging.error(f"Ошибка: {e}")
         print(f"Ошибка: {e}")
-    finally:
-        close_db(connection, cursor)
+        return False
 
 
-def is_safe_csv_file(csv_path: str) -> bool:
+def copy_table_grants(cursor: ora.Cursor, source_table: str, target_table: str) -> int:
     """
-    Проверяет безопасность CSV-файла на наличие подозрительных паттернов.
+    Выдает на таблицу target_table те же объектные привилегии, что выданы на source_table.
+
+    Синоним TEASR_DEF не имеет собственных привилегий: запросы других схем
+    проверяются по привилегиям таблицы, на которую он указывает. Промежуточная
+    таблица создается заново при каждой загрузке, поэтому привилегии
+    переносятся с текущей таблицы перед каждым переключением синонима.
 
     Параметры:
-    csv_path (str): Путь к CSV-файлу.
+    cursor (ora.Cursor): Курсор подключения.
+    source_table (str): Таблица, привилегии которой копируются.
+    target_table (str): Таблица, на которую выдаются привилегии.
 
     Returns:
-    bool: True, если CSV-файл безопасен, False в противном случае.
+    int: Количество выданных привилегий.
     """
-    logging.info(f"Проверка безопасности CSV файла: {csv_path}")
-    suspicious_patterns = [
-        r"\bSELECT\b", r"\bINSERT\b", r"\bUPDATE\b", r"\bDELETE\b",
-        r"\bDROP\b", r"\bCREATE\b", r"\bALTER\b", r"\bEXEC\b", r"\bEVAL\b",
-        r"\bos\.", r"\bsys\.", r"\bINTO OUTFILE\b", r"\bUNION\b", r"\bJOIN\b",
-        r"\bWHERE\b", r"\bEXECUTE IMMEDIATE\b"
-    ]
+    execute_sql(cursor, """SELECT "GRANTEE", "PRIVILEGE", "GRANTABLE" FROM "ALL_TAB_PRIVS"
+                           WHERE "TABLE_SCHEMA" = 'BIS' AND "TABLE_NAME" = :table_name""",
+                {'table_name': source_table})
+    grants = cursor.fetchall()
+    for grantee, privilege, grantable in grants:
+        grantee_sql = grantee if grantee == 'PUBLIC' else f'"{grantee}"'
+        execute_sql(cursor, f'GRANT {privilege} ON "BIS"."{target_table}" TO {grantee_sql}'
+                            f'{" WITH GRANT OPTION" if grantable == "YES" else ""}')
+    logging.info(f"Привилегии {source_table} выданы на {target_table}: {len(grants)}")
+    return len(grants)
+
+
+def swap_staging_table(table_name: str, active_table: Optional[str]) -> bool:
+    """
+    Переключает синоним TEASR_DEF на загруженную промежуточную таблицу.
+
+    CREATE OR REPLACE SYNONYM подменяет синоним одной операцией словаря
+    данных: в отличие от переименования таблиц, нет момента, когда TEASR_DEF
+    не существует. Прежняя таблица остается до следующей загрузки, поэтому
+    начатые запросы дорабатывают с прежними данными. Если TEASR_DEF - таблица
+    (первый запуск после режима recreate), она удаляется перед созданием
+    синонима: только в этот раз реестр недоступен между двумя командами.
+    Перед переключением на промежуточную таблицу выдаются привилегии
+    текущей таблицы (см. copy_table_grants), чтобы другие схемы не потеряли доступ.
 
-    safe = True
+    Параметры:
+    table_name (str): Загруженная промежуточная таблица.
+    active_table (Optional[str]): Таблица, на которую синоним указывает сейчас (см. get_active_teasr_def_table).
 
+    Returns:
+    bool: True, если синоним переключен (в том числе если индекс не удалось перевести в режим LOGGING).
+    """
+    logging.info(f"Переключение синонима {TEASR_DEF_TABLE} на таблицу {table_name}")
+    try:
+        with pooled_connection() as (connection, cursor):
+            copy_table_grants(cursor, active_table or TEASR_DEF_TABLE, table_name)
+            if active_table is None:
+                logging.warning(f"{TEASR_DEF_TABLE} заменяется синонимом, прежняя таблица удаляется")
+                execute_sql(cursor, drop_table_sql(TEASR_DEF_TABLE))
+            execute_sql(cursor, f'CREATE OR REPLACE SYNONYM "BIS"."{TEASR_DEF_TABLE}" FOR "BIS"."{table_name}"')
+    except Exception as e:
+        logging.error(f"Ошибка: {e}")
+        print(f"Ошибка: {e}")
+        return False
+    # Синоним уже указывает на новую таблицу: ошибка перевода индекса в LOGGING не отменяет загрузку
     try:
-        with open(csv_path, newline='', encoding='utf-8') as csvfile:
-            csvreader = csv.DictReader(csvfile, delimiter=';')
+        with pooled_connection() as (connection, cursor):
+            execute_sql(cursor, f'ALTER INDEX "BIS"."{table_name}_IX" LOGGING')
+    except Exception as e:
+        logging.warning(f"Не удалось перевести индекс {table_name}_IX в режим LOGGING: {e}")
+        metrics.count("teasr_def_index_logging_errors")
+    return True
+
 
-            for row in csvreader:
-                for field_name, field_value in row.items():
-                    for pattern in suspicious_patterns:
-                        if re.search(pattern, field_value, flags=re.IGNORECASE):
-                            logging.warning(f"Подозрительный паттерн найден в поле '{field_name}': {field_value}")
-                            safe = False
+def load_teasr_def(file_paths: List[str]) -> bool:
+    """
+    Загружает файлы реестра в таблицу TEASR_DEF.
+
+    В режиме TEASR_DEF_LOAD_MODE=swap (по умолчанию) TEASR_DEF - синоним одной
+    из таблиц TEASR_DEF_TABLES. Данные загружаются в другую таблицу, после
+    загрузки строится индекс и синоним переключается на нее. В режиме recreate
+    таблица TEASR_DEF удаляется и создается заново, как раньше, а если
+    загрузка какого-либо файла не удалась, очищается. Файлы
+    загружаются параллельно в LOAD_WORKERS потоков (insert_csv_standart_data_parallel).
+
+    Таблица загружается обычной вставкой: прямая вставка (APPEND_VALUES)
+    блокирует таблицу целиком и выстроила бы потоки загрузки в очередь,
+    поэтому таблица создается в режиме LOGGING.
+
+    Параметры:
+    file_paths (List[str]): Пути к CSV файлам реестра.
 
+    Returns:
+    bool: True, если данные загружены.
+    """
+    load_mode = config("TEASR_DEF_LOAD_MODE", default="swap")
+    if load_mode == "recreate":
+        if not drop_teasr_def_synonym() or not create_temp_table():
+            return False
+        if all([insert_csv_standart_data_parallel(file_path) for file_path in file_paths]):
+            return True
+        # Потоки загрузки фиксируют свои части независимо: частично загруженный реестр не оставляется
+        truncate_table(TEASR_DEF_TABLE)
+        return False
+
+    started = time.perf_counter()
+    try:
+        active_table = get_active_teasr_def_table()
     except Exception as e:
-        logging.error(f"Ошибка при проверке CSV-файла: {e}")
-        safe = False
+        logging.error(f"Не удалось определить текущую таблицу {TEASR_DEF_TABLE}: {e}")
+        return False
+    staging_table = TEASR_DEF_TABLES[1] if active_table == TEASR_DEF_TABLES[0] else TEASR_DEF_TABLES[0]
+    if not create_temp_table(staging_table):
+        return False
+    if not all([insert_csv_standart_data_parallel(file_path, staging_table) for file_path in file_paths]):
+        logging.error(f"Загрузка в {staging_table} не завершена, таблица {TEASR_DEF_TABLE} не изменена")
+        return False
+    if not build_staging_indexes(staging_table):
+        return False
+    loaded = time.perf_counter()
+    if not swap_staging_table(staging_table, active_table):
+        return False
+    swapped = time.perf_counter()
+    logging.info(f"Таблица {TEASR_DEF_TABLE} обновлена ({staging_table}): загрузка {loaded - started:.3f} с, "
+                 f"подмена {swapped - loaded:.3f} с")
+    return True
+
+
+# SQL вставки строки реестра и типы привязываемых переменных
+TEASR_DEF_INSERT_SQL = """INSERT INTO "BIS"."{table_name}" ("DEF", "ST", "EN", "CO", "OP", "DIR",  "INN") VALUES (:1, :2, :3, :4, :5, :6, :7)"""
+TEASR_DEF_INPUT_SIZES = (20, ora.DB_TYPE_NUMBER, ora.DB_TYPE_NUMBER, ora.DB_TYPE_NUMBER, 200, 500, 130)
+
+
+def load_registry_shard(rows: List[tuple], table_name: str, batch_size: int,
+                        worker: int) -> Tuple[int, List[Tuple[tuple, str]], float]:
+    """
+    Загружает часть строк реестра через отдельное подключение из пула.
 
-    if safe:
-        logging.info("CSV-файл прошел проверку на безопасность")
-    else:
-        logging.error("Обнаружены подозрительные паттерны в CSV-файле")
+    Строки, отклоненные базой данных, не прерывают загрузку пакета и
+    возвращаются вместе с текстом ошибки.
+
+    Параметры:
+    rows (List[tuple]): Строки для вставки.
+    table_name (str): Имя таблицы реестра в схеме BIS.
+    batch_size (int): Размер пакета executemany.
+    worker (int): Номер потока загрузки.
 
-    return safe
+    Returns:
+    Tuple[int, List[Tuple[tuple, str]], float]: Количество загруженных строк,
+    отклоненные строки с ошибками и время загрузки в секундах.
+    """
+    started = time.perf_counter()
+    rejects = []
+    sql = TEASR_DEF_INSERT_SQL.format(table_name=table_name)
+    with pooled_connection() as (connection, cursor):
+        cursor.setinputsizes(*TEASR_DEF_INPUT_SIZES)
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            cursor.executemany(sql, batch, batcherrors=True)
+            for error in cursor.getbatcherrors():
+                rejects.append((batch[error.offset], error.message))
+        connection.commit()
+    elapsed = time.perf_counter() - started
+    loaded = len(rows) - len(rejects)
+    logging.info(f"Поток загрузки {worker}: загружено {loaded} строк, отклонено {len(rejects)}, "
+                 f"{loaded / elapsed if elapsed else 0:.0f} строк/с")
+    return loaded, rejects, elapsed
 
 
-def insert_csv_standart_data(file_path: str) -> None:
+def insert_csv_standart_data_parallel(file_path: str, table_name: str = TEASR_DEF_TABLE,
+                                      workers: Optional[int] = None) -> bool:
     """
-    Загружает данные из CSV файла в базу данных.
+    Загружает данные из CSV файла в базу данных параллельно через несколько подключений.
+
+    Строки распределяются по потокам по коду АВС/DEF. Отклоненные строки
+    записываются в файл '<имя файла>_reject.csv' вместо прерывания загрузки.
 
     Параметры:
     file_path (str): Путь к CSV файлу.
+    table_name (str): Имя таблицы реестра в схеме BIS.
+    workers (Optional[int]): Количество потоков загрузки. По умолчанию LOAD_WORKERS.
+
+    Returns:
+    bool: True, если данные загружены.
     """
-    logging.info(f"Загрузка данных из CSV файла: {file_path}")
+    logging.info(f"Параллельная загрузка данных из CSV файла: {file_path}")
     if not os.path.isfile(file_path):
         logging.error(f"Файл {file_path} не существует.")
         print(f"Файл {file_path} не существует.")
-        return
+        return False
 
     if not file_path.lower().endswith('.csv'):
         logging.error(f"Файл {file_path} не является CSV файлом.")
         print(f"Файл {file_path} не является CSV файлом.")
-        return
+        return False
 
     if not is_safe_csv_file(file_path):
         logging.error("CSV файл не прошел проверку на безопасность.")
         print("CSV файл не прошел проверку на безопасность.")
-        return
+        return False
 
-    connection, cursor = None, None
     try:
-        connection, cursor = connect_db()
-
-        with open(file_path, newline='', encoding='utf-8') as csvfile:
-            csv_reader = csv.reader(csvfile, delimiter=';')
-            next(csv_reader)  # Пропускаем заголовок, если он есть
-            batch_size = config('BATCH_SIZE', cast=int)
-            sql = """INSERT INTO "BIS"."TEASR_DEF" ("DEF", "ST", "EN", "CO", "OP", "DIR",  "INN") VALUES (:1, :2, :3, :4, :5, :6, :7)"""
-            data = []
-            for line in csv_reader:
-                if len(line) >= 8:  # Проверка на минимальное количество элементов в строке
-                    prefix, start_range, end_range, capacity, operator, region, _, inn = line
-                    try:
-                        start_range = int(start_range)
-                        end_range = int(end_range)
-                        capacity = int(capacity)
-                        data.append((prefix, start_range, end_range, capacity, operator, region, inn))
-                    except ValueError:
-                        logging.warning(f"Неверный формат данных в строке: {line}")
-                        continue
-
-                    if len(data) % batch_size == 0:
-                        cursor.executemany(sql, data)
-                        data = []
-
-            if data:
-                cursor.executemany(sql, data)
-
-        connection.commit()
-        logging.info(f"Данные из файла {file_path} успешно загружены в базу данных")
+        workers = workers or config('LOAD_WORKERS', default=4, cast=int)
+        batch_size = config('BATCH_SIZE', cast=int)
+        rejects: List[Tuple[list, str]] = []
+        shards = shard_rows_by_code(read_registry_rows(file_path, rejects), workers)
+
+        started = time.perf_counter()
+        with metrics.stage("teasr_def_load") as stage:
+            with ThreadPoolExecutor(max_workers=len(shards) or 1) as executor:
+                results = list(executor.map(load_registry_shard, shards, [table_name] * len(shards),
+                                            [batch_size] * len(shards), range(1, len(shards) + 1)))
+            stage.rows = sum(result[0] for result in results)
+        elapsed = time.perf_counter() - started
+
+        loaded = stage.rows
+        for result in results:
+            rejects.extend((list(row), message) for row, message in result[1])
+        if rejects:
+            reject_path = f"{os.path.splitext(file_path)[0]}_reject.csv"
+            with open(reject_path, 'w', newline='', encoding='utf-8') as reject_file:
+                writer = csv.writer(reject_file, delimiter=';')
+                for row, message in rejects:
+                    writer.writerow(list(row) + [message])
+            logging.warning(f"Отклонено строк: {len(rejects)}, см. файл {reject_path}")
+        metrics.count("teasr_def_rejected_rows", len(rejects))
+        logging.info(f"Данные из файла {file_path} загружены в {table_name}: {loaded} строк за {elapsed:.3f} с "
+                     f"({loaded / elapsed if elapsed else 0:.0f} строк/с, потоков {len(shards)})")
+        return True
 
     except ora.DatabaseError as e:
         error, = e.args
@@ -274,8 +681,7 @@ def insert_csv_standart_data(file_path: str) -> None:
     except Exception as e:
         logging.error(f"Ошибка при загрузке данных из файла: {e}")
         print(f"Ошибка при загрузке данных из файла: {e}")
-    finally:
-        close_db(connection, cursor)
+    return False
 
 
 def get_drct_id(name_csv: str) -> List[Tuple]:
@@ -289,23 +695,45 @@ def get_drct_id(name_csv: str) -> List[Tuple]:
     List[Tuple]: Список кортежей с результатами запроса.
     """
     logging.info(f"Получение DRCT_DRCT_ID для NAME_CSV: {name_csv}")
-    connection, cursor = None, None
     result = []
 
     try:
-        connection, cursor = connect_db()
-        query = "SELECT DRCT_DRCT_ID FROM BIS.TEASR_PREFIX_DIRECTIONS WHERE NAME_CSV = :name_csv"
-        execute_sql(cursor, query, {'name_csv': name_csv})
-        result = cursor.fetchall()
+        with pooled_connection() as (connection, cursor):
+            query = "SELECT DRCT_DRCT_ID FROM BIS.TEASR_PREFIX_DIRECTIONS WHERE NAME_CSV = :name_csv"
+            execute_sql(cursor, query, {'name_csv': name_csv})
+            result = cursor.fetchall()
     except Exception as e:
         logging.error(f"Ошибка: {e}")
         print(f"Ошибка: {e}")
-    finally:
-        close_db(connection, cursor)
 
     return result
 
 
+def get_all_drct_ids() -> List[Tuple]:
+    """
+    Получает весь справочник NAME_CSV -> DRCT_DRCT_ID одной выборкой.
+
+    Returns:
+    List[Tuple]: Список кортежей (NAME_CSV, DRCT_DRCT_ID).
+
+    Raises:
+    Exception: Ошибка базы данных передается вызывающему, чтобы пустой
+    справочник не был принят за загруженный (см. RegionDirectoryCache.load).
+    """
+    logging.info("Получение справочника регионов TEASR_PREFIX_DIRECTIONS")
+    try:
+        with pooled_connection() as (connection, cursor):
+            cursor.arraysize = 5000
+            cursor.prefetchrows = 5000
+            query = "SELECT NAME_CSV, DRCT_DRCT_ID FROM BIS.TEASR_PREFIX_DIRECTIONS"
+            execute_sql(cursor, query)
+            return cursor.fetchall()
+    except Exception as e:
+        logging.error(f"Ошибка: {e}")
+        print(f"Ошибка: {e}")
+        raise
+
+
 def get_all_msisdn() -> List[Tuple]:
     """
     Получает все строки из таблицы TEASR_PREFIX_MSISDN.
@@ -314,22 +742,42 @@ def get_all_msisdn() -> List[Tuple]:
     List[Tuple]: Список кортежей с результатами запроса.
     """
     logging.info("Получение всех строк из таблицы TEASR_PREFIX_MSISDN")
-    connection, cursor = None, None
     result = []
 
     try:
-        connection, cursor = connect_db()
-        query = """
-            SELECT MSISDN_C
-            FROM BIS.TEASR_PREFIX_MSISDN
-            WHERE LENGTH(MSISDN_C) = 10 AND MSISDN_C NOT LIKE '%[^0-9]%'
-        """
-        execute_sql(cursor, query)
-        result = cursor.fetchall()
+        with pooled_connection() as (connection, cursor):
+            query = """
+                SELECT MSISDN_C
+                FROM BIS.TEASR_PREFIX_MSISDN
+                WHERE LENGTH(MSISDN_C) = 10 AND MSISDN_C NOT LIKE '%[^0-9]%'
+            """
+            execute_sql(cursor, query)
+            result = cursor.fetchall()
     except Exception as e:
         logging.error(f"Ошибка: {e}")
-    finally:
-        close_db(connection, cursor)
+
+    return result
+
+
+def get_prefix_sets_prefixes() -> List[str]:
+    """
+    Получает все префиксы таблицы PREFIX_SETS одной выборкой.
+
+    Returns:
+    List[str]: Префиксы.
+    """
+    logging.info("Получение префиксов из таблицы PREFIX_SETS")
+    result = []
+
+    try:
+        with pooled_connection() as (connection, cursor):
+            cursor.arraysize = 10000
+            cursor.prefetchrows = 10000
+            execute_sql(cursor, "SELECT PREFIX FROM BIS.PREFIX_SETS WHERE PREFIX IS NOT NULL")
+            result = [str(row[0]) for row in cursor.fetchall()]
+    except Exception as e:
+        logging.error(f"Ошибка: {e}")
+        print(f"Ошибка: {e}")
 
     return result
 
@@ -342,24 +790,22 @@ def execute_max_pset_id_query() -> int:
     int: Максимальное значение PSET_ID.
     """
     logging.info("Получение максимального PSET_ID из двух таблиц")
-    connection, cursor = None, None
     try:
-        connection, cursor = connect_db()
-
-        # Выполнение первого запроса
-        cursor.execute("SELECT MAX(PSET_ID) FROM BIS.PREFIX_SETS")
-        max_pset_id = cursor.fetchone()[0] or 0
+        with pooled_connection() as (connection, cursor):
+            # Выполнение первого запроса
+            cursor.execute("SELECT MAX(PSET_ID) FROM BIS.PREFIX_SETS")
+            max_pset_id = cursor.fetchone()[0] or 0
 
-        # Выполнение второго запроса
-        cursor.execute("SELECT MAX(PSET_ID) FROM BIS.TEASR_PREFIX_SETS_EXP_CSV")
-        max_teasr_pset_id = cursor.fetchone()[0] or 0
+            # Выполнение второго запроса
+            cursor.execute("SELECT MAX(PSET_ID) FROM BIS.TEASR_PREFIX_SETS_EXP_CSV")
+            max_teasr_pset_id = cursor.fetchone()[0] or 0
 
-        # Логика обновления переменной c
-        c = max(max_pset_id, max_teasr_pset_id)
+            # Логика обновления переменной c
+            c = max(max_pset_id, max_teasr_pset_id)
 
-        logging.info(f"Максимальное значение PSET_ID: {c}")
+            logging.info(f"Максимальное значение PSET_ID: {c}")
 
-        return c
+            return c
 
     except ora.DatabaseError as e:
         error, = e.args
@@ -368,27 +814,131 @@ def execute_max_pset_id_query() -> int:
     except Exception as e:
         logging.error(f"Ошибка: {e}")
         print(f"Ошибка: {e}")
-    finally:
-        close_db(connection, cursor)
 
 
-def is_prefix_exists(cursor: ora.Cursor, prefix: str) -> bool:
+def get_existing_prefixes(cursor: ora.Cursor) -> Dict[str, Tuple[str, str]]:
     """
-    Проверяет существование PREFIX в таблице.
+    Получает последнее выгруженное действие каждого префикса из таблицы TEASR_PREFIX_SETS_EXP_CSV одной выборкой.
+
+    Последним считается действие с наибольшим PSET_ID. Запись пропускается,
+    только если совпадает с последним действием префикса (ACTION и
+    DRCT_DRCT_ID): так повторная выгрузка пропускается, а удаление префикса,
+    смена его региона и повторное добавление после удаления - нет.
 
     Параметры:
     cursor (ora.Cursor): Объект курсора базы данных.
-    prefix (str): Значение PREFIX для проверки.
 
     Returns:
-    bool: True, если PREFIX существует, False в противном случае.
+    Dict[str, Tuple[str, str]]: PREFIX -> (ACTION, DRCT_DRCT_ID) последнего действия.
     """
-    logging.info(f"Проверка существования PREFIX: {prefix}")
-    query = "SELECT 1 FROM \"BIS\".\"TEASR_PREFIX_SETS_EXP_CSV\" WHERE \"PREFIX\" = :prefix"
-    cursor.execute(query, [prefix])
-    exists = cursor.fetchone() is not None
-    logging.info(f"PREFIX {'существует' if exists else 'не существует'}")
-    return exists
+    logging.info("Получение существующих PREFIX из таблицы TEASR_PREFIX_SETS_EXP_CSV")
+    cursor.arraysize = 10000
+    cursor.prefetchrows = 10000
+    execute_sql(cursor, PREFIX_SETS_LATEST_SQL)
+    prefixes = latest_prefix_actions(cursor.fetchall())
+    logging.info(f"Получено существующих PREFIX: {len(prefixes)}")
+    return prefixes
+
+
+# Последнее действие каждого префикса в TEASR_PREFIX_SETS_EXP_CSV
+PREFIX_SETS_LATEST_SQL = """SELECT "PREFIX", "ACTION", "DRCT_DRCT_ID" FROM (
+                               SELECT "PREFIX", "ACTION", "DRCT_DRCT_ID",
+                                      ROW_NUMBER() OVER (PARTITION BY "PREFIX" ORDER BY "PSET_ID" DESC) AS "RN"
+                               FROM "BIS"."TEASR_PREFIX_SETS_EXP_CSV")
+                           WHERE "RN" = 1"""
+
+
+PREFIX_SETS_INSERT_SQL = """INSERT INTO "BIS"."TEASR_PREFIX_SETS_EXP_CSV" ("PSET_ID", "NUMBER_HISTORY", "OPER_OPER_ID", "PREFIX", "START_DATE",
+                               "END_DATE", "NAVI_USER", "NAVI_DATE", "DRCT_DRCT_ID", "CIT_CIT_ID",
+                               "COU_COU_ID", "PSET_COMMENT", "ODRC_ODRC_ID", "ZONE_ZONE_ID", "AOB_AOB_ID",
+                               "RTCM_RTCM_ID", "ACTION") VALUES (:1, :2, :3, :4, :5, :6, :7, :8, :9, :10, 
+                               :11, :12, :13, :14, :15, :16, :17)"""
+PREFIX_SETS_INPUT_SIZES = (ora.DB_TYPE_NUMBER, ora.DB_TYPE_NUMBER, ora.DB_TYPE_NUMBER, 20, ora.DB_TYPE_DATE,
+                           ora.DB_TYPE_DATE, 100, ora.DB_TYPE_DATE, ora.DB_TYPE_NUMBER, ora.DB_TYPE_NUMBER,
+                           ora.DB_TYPE_NUMBER, 200, ora.DB_TYPE_NUMBER, ora.DB_TYPE_NUMBER, ora.DB_TYPE_NUMBER,
+                           ora.DB_TYPE_NUMBER, 10)
+
+def parse_prefix_record(line: List[str]) -> tuple:
+    """
+    Приводит строку CSV файла префиксов к типам столбцов TEASR_PREFIX_SETS_EXP_CSV.
+
+    Параметры:
+    line (List[str]): Поля строки CSV.
+
+    Returns:
+    tuple: Запись с числами, датами и строками.
+
+    Raises:
+    ValueError: Если поле не удается преобразовать.
+    """
+    def number(value: str) -> Optional[int]:
+        return int(value) if value != '' else None
+
+    (pset_id, number_history, oper_oper_id, prefix, start_date, end_date, navi_user, navi_date, drct_drct_id,
+     cit_cit_id, cou_cou_id, pset_comment, odrc_odrc_id, zone_zone_id, aob_aob_id, rtcm_rtcm_id, action) = line
+    return (number(pset_id), number(number_history), number(oper_oper_id), prefix,
+            datetime.strptime(start_date, CSV_DATE_FORMAT), datetime.strptime(end_date, CSV_DATE_FORMAT), navi_user,
+            datetime.strptime(navi_date, CSV_DATETIME_FORMAT), number(drct_drct_id), number(cit_cit_id),
+            number(cou_cou_id), pset_comment, number(odrc_odrc_id), number(zone_zone_id), number(aob_aob_id),
+            number(rtcm_rtcm_id), action)
+
+
+def insert_prefix_records(records: Iterable[tuple], source: str = "сформированных записей") -> bool:
+    """
+    Загружает записи префиксов в таблицу TEASR_PREFIX_SETS_EXP_CSV.
+
+    Записи передаются с родными типами (int, datetime, str) и вставляются
+    пакетами с заранее объявленными типами привязки. Записи, совпадающие
+    с последним выгруженным действием префикса (см. get_existing_prefixes),
+    пропускаются.
+
+    Параметры:
+    records (Iterable[tuple]): Записи в порядке столбцов PREFIX_SETS_COLUMNS.
+    source (str): Источник записей для сообщений в логе.
+
+    Returns:
+    bool: True, если записи загружены.
+    """
+    try:
+        with pooled_connection() as (connection, cursor):
+            batch_size = config('BATCH_SIZE', cast=int)
+            existing_prefixes = get_existing_prefixes(cursor)
+            cursor.setinputsizes(*PREFIX_SETS_INPUT_SIZES)
+            data = []
+            skipped = 0
+            inserted = 0
+            for record in records:
+                prefix, drct_drct_id, action = str(record[3]), record[8], record[16]
+                latest_action = (action, '' if drct_drct_id is None else str(drct_drct_id))
+                if existing_prefixes.get(prefix) == latest_action:
+                    logging.warning(f"Значение PREFIX '{prefix}' ({action}) уже существует в таблице. Строка пропущена.")
+                    skipped += 1
+                    continue
+                data.append(record[:3] + (prefix,) + record[4:])
+                existing_prefixes[prefix] = latest_action
+                if len(data) == batch_size:
+                    cursor.executemany(PREFIX_SETS_INSERT_SQL, data)
+                    inserted += len(data)
+                    data = []
+
+            if data:
+                cursor.executemany(PREFIX_SETS_INSERT_SQL, data)
+                inserted += len(data)
+
+            connection.commit()
+            logging.info(f"Пропущено строк с существующим PREFIX: {skipped}")
+            logging.info(f"Данные из {source} успешно загружены в базу данных: {inserted} строк")
+            print(f"Данные из {source} успешно загружены в базу данных")
+        return True
+
+    except ora.DatabaseError as e:
+        error, = e.args
+        logging.error(f"Ошибка базы данных: {error.code}, {error.message}")
+        print(f"Ошибка базы данных: {error.code}, {error.message}")
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке данных: {e}")
+        print(f"Ошибка при загрузке данных: {e}")
+    return False
 
 
 def insert_csv_updated_data(file_path: str) -> None:
@@ -414,55 +964,21 @@ def insert_csv_updated_data(file_path: str) -> None:
         print("CSV файл не прошел проверку на безопасность.")
         return
 
-    connection, cursor = None, None
     try:
-        connection, cursor = connect_db()
-
+        records = []
         with open(file_path, newline='', encoding='utf-8') as csvfile:
             csv_reader = csv.reader(csvfile, delimiter=',')
             headers = next(csv_reader)  # Пропускаем заголовок
-            batch_size = config('BATCH_SIZE', cast=int)
-            sql = """INSERT INTO "BIS"."TEASR_PREFIX_SETS_EXP_CSV" ("PSET_ID", "NUMBER_HISTORY", "OPER_OPER_ID", "PREFIX", "START_DATE",
-                                           "END_DATE", "NAVI_USER", "NAVI_DATE", "DRCT_DRCT_ID", "CIT_CIT_ID",
-                                           "COU_COU_ID", "PSET_COMMENT", "ODRC_ODRC_ID", "ZONE_ZONE_ID", "AOB_AOB_ID",
-                                           "RTCM_RTCM_ID", "ACTION") VALUES (:1, :2, :3, :4, :5, :6, :7, :8, :9, :10, 
-                                           :11, :12, :13, :14, :15, :16, :17)"""
-            data = []
             for line in csv_reader:
                 if len(line) == 17:  # Проверка на количество элементов в строке
-                    pset_id, number_history, oper_oper_id, prefix, start_date, end_date, navi_user, navi_date, drct_drct_id, cit_cit_id, cou_cou_id, pset_comment, odrc_odrc_id, zone_zone_id, aob_aob_id, rtcm_rtcm_id, action = line
-                    if is_prefix_exists(cursor, prefix):
-                        logging.warning(f"Значение PREFIX '{prefix}' уже существует в таблице. Строка пропущена.")
-                        continue
                     try:
-                        start_date = datetime.strptime(start_date, '%d-%m-%Y')
-                        end_date = datetime.strptime(end_date, '%d-%m-%Y')
-                        navi_date = datetime.strptime(navi_date, '%d-%m-%Y %H:%M:%S')
-                        data.append((pset_id, number_history, oper_oper_id, prefix, start_date, end_date, navi_user,
-                                     navi_date, drct_drct_id,
-                                     cit_cit_id, cou_cou_id, pset_comment, odrc_odrc_id, zone_zone_id, aob_aob_id,
-                                     rtcm_rtcm_id, action))
+                        records.append(parse_prefix_record(line))
                     except ValueError as e:
                         logging.warning(f"Неверный формат данных в строке: {line}. Ошибка: {e}")
                         continue
-                    if len(data) % batch_size == 0:
-                        cursor.executemany(sql, data)
-                        data = []
-
-            if data:
-                cursor.executemany(sql, data)
-
-        connection.commit()
-        logging.info(f"Данные из файла {file_path} успешно загружены в базу данных")
-        print(f"Данные из файла {file_path} успешно загружены в базу данных")
-
-    except ora.DatabaseError as e:
-        error, = e.args
-        logging.error(f"Ошибка базы данных: {error.code}, {error.message}")
-        print(f"Ошибка базы данных: {error.code}, {error.message}")
     except Exception as e:
         logging.error(f"Ошибка при загрузке данных из файла: {e}")
         print(f"Ошибка при загрузке данных из файла: {e}")
-    finally:
-        close_db(connection, cursor)
+        return
 
+    insert_prefix_records(records, f"файла {file_path}")
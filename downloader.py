@@ -0,0 +1,217 @@
+import os
+import json
+import logging
+import http.client
+import urllib.error
+import urllib.request
+from typing import NamedTuple
+
+# Размер блока при потоковом скачивании в байтах
+CHUNK_SIZE = 256 * 1024
+
+# Статусы скачивания
+DOWNLOADED = 'downloaded'
+RESUMED = 'resumed'
+NOT_MODIFIED = 'not_modified'
+
+
+class DownloadResult(NamedTuple):
+    """
+    Результат скачивания файла.
+
+    file_name (str): Путь к файлу.
+    status (str): DOWNLOADED, RESUMED или NOT_MODIFIED.
+    size (int): Количество байт, полученных в этом запросе.
+    """
+    file_name: str
+    status: str
+    size: int
+
+
+def _read_meta(meta_path: str) -> dict:
+    """
+    Читает сохраненные ETag/Last-Modified.
+
+    Параметры:
+    meta_path (str): Путь к файлу метаданных.
+
+    Возвращает:
+    dict: Метаданные или пустой словарь, если файла нет или он поврежден.
+    """
+    try:
+        with open(meta_path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(meta_path: str, url: str, headers) -> None:
+    """
+    Сохраняет ETag/Last-Modified ответа сервера.
+
+    Параметры:
+    meta_path (str): Путь к файлу метаданных.
+    url (str): Ссылка на файл.
+    headers: Заголовки ответа.
+    """
+    meta = {'url': url, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+    with open(meta_path, 'w', encoding='utf-8') as file:
+        json.dump(meta, file)
+
+
+def mark_processed(file_name: str) -> None:
+    """
+    Отмечает скачанную версию файла (ETag/Last-Modified) как обработанную.
+
+    Ответ 304 означает только, что файл не изменился с последнего скачивания;
+    обработка пропускается, только если эта версия уже была успешно
+    обработана (см. is_processed). Поэтому отметку нужно ставить после
+    успешной загрузки в базу данных и построения префиксов.
+
+    Параметры:
+    file_name (str): Путь к скачанному файлу.
+    """
+    meta = _read_meta(f"{file_name}.meta.json")
+    if meta:
+        with open(f"{file_name}.processed.json", 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+
+
+def is_processed(file_name: str) -> bool:
+    """
+    Проверяет, обработана ли текущая скачанная версия файла.
+
+    Параметры:
+    file_name (str): Путь к скачанному файлу.
+
+    Возвращает:
+    bool: True, если отметка обработки совпадает с метаданными последнего скачивания.
+    """
+    meta = _read_meta(f"{file_name}.meta.json")
+    return bool(meta) and _read_meta(f"{file_name}.processed.json") == meta
+
+
+def _remove(path: str) -> None:
+    """
+    Удаляет файл, если он существует.
+
+    Параметры:
+    path (str): Путь к файлу.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _expected_size(headers, offset: int):
+    """
+    Ожидаемый полный размер файла по заголовкам ответа.
+
+    Для докачки (206) размер берется из Content-Range 'bytes a-b/total',
+    иначе - из Content-Length.
+
+    Параметры:
+    headers: Заголовки ответа.
+    offset (int): Позиция докачки или 0.
+
+    Возвращает:
+    int: Размер файла в байтах или None, если сервер его не сообщил.
+    """
+    content_range = headers.get('Content-Range')
+    if offset and content_range:
+        total = content_range.rpartition('/')[2].strip()
+        if total.isdigit():
+            return int(total)
+    content_length = headers.get('Content-Length')
+    if content_length and content_length.strip().isdigit():
+        return offset + int(content_length)
+    return None
+
+
+def download(file_url: str, file_name: str, chunk_size: int = CHUNK_SIZE) -> DownloadResult:
+    """
+    Скачивает файл потоково во временный файл и атомарно переименовывает его.
+
+    Если файл уже был скачан, запрос отправляется с If-None-Match/If-Modified-Since
+    и ответ 304 возвращается со статусом NOT_MODIFIED. Незавершенное скачивание
+    (файл '<file_name>.part') продолжается запросом Range с проверкой If-Range.
+    Файл заменяется, только если размер '<file_name>.part' совпадает с
+    Content-Length (при докачке - с полным размером из Content-Range); иначе
+    '<file_name>.part' сохраняется для докачки при следующем запуске.
+    Запросы выполняются через urllib.request.urlopen, поэтому учитывают
+    установленный прокси-opener.
+
+    Параметры:
+    file_url (str): Прямая ссылка на файл.
+    file_name (str): Путь, по которому сохраняется файл.
+    chunk_size (int): Размер блока записи в байтах.
+
+    Возвращает:
+    DownloadResult: Результат скачивания.
+
+    Raises:
+    urllib.error.URLError: В случае сетевой ошибки, ответа сервера с ошибкой или
+    неполного получения файла.
+    """
+    meta_path = f"{file_name}.meta.json"
+    part_path = f"{file_name}.part"
+    part_meta_path = f"{part_path}.meta.json"
+
+    headers = {}
+    meta = _read_meta(meta_path)
+    if os.path.exists(file_name) and meta.get('url') == file_url:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    part_meta = _read_meta(part_meta_path)
+    validator = part_meta.get('etag') or part_meta.get('last_modified')
+    if offset and part_meta.get('url') == file_url and validator:
+        headers['Range'] = f"bytes={offset}-"
+        headers['If-Range'] = validator
+    else:
+        offset = 0
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(file_url, headers=headers))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            logging.info(f"Файл {file_name} не изменился на сервере")
+            return DownloadResult(file_name, NOT_MODIFIED, 0)
+        if e.code == 416 and offset:
+            logging.warning(f"Сервер отклонил докачку файла {file_name}, файл будет скачан заново")
+            _remove(part_path)
+            _remove(part_meta_path)
+            return download(file_url, file_name, chunk_size)
+        raise
+
+    with response:
+        resumed = bool(offset) and response.status == 206
+        if not resumed:
+            offset = 0
+            _write_meta(part_meta_path, file_url, response.headers)
+        expected_size = _expected_size(response.headers, offset)
+        size = 0
+        with open(part_path, 'ab' if resumed else 'wb') as file:
+            try:
+                for chunk in iter(lambda: response.read(chunk_size), b''):
+                    file.write(chunk)
+                    size += len(chunk)
+            except http.client.IncompleteRead as e:
+                file.write(e.partial)
+                size += len(e.partial)
+            file.flush()
+            os.fsync(file.fileno())
+
+    part_size = os.path.getsize(part_path)
+    if expected_size is not None and part_size != expected_size:
+        logging.warning(f"Файл {file_name} получен не полностью: {part_size} из {expected_size} байт, "
+                        f"файл {part_path} сохранен для докачки")
+        raise urllib.error.URLError(f"файл {file_name} получен не полностью: {part_size} из {expected_size} байт")
+
+    os.replace(part_path, file_name)
+    os.replace(part_meta_path, meta_path)
+    status = RESUMED if resumed else DOWNLOADED
+    logging.info(f"Файл {file_name} скачан ({status}): получено {size} байт, докачка с позиции {offset}")
+    return DownloadResult(file_name, status, size)
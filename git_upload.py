@@ -7,18 +7,44 @@ import time
 import datetime
 import gc
 import sys
-from typing import Callable, Optional
+from typing import Callable, NamedTuple, Optional
 
-# Путь к локальному CSV файлу, который нужно отправить
-csv_file_path: str = config('FILE_FOR_PUSH_NAME')
-
-# Путь к целевому локальному репозиторию
+# Путь к рабочему дереву, в котором готовится новая ветка
 target_repo_path: str = 'tmp/test'
 
-# URL удалённого репозитория
-remote_repo_url: str = config('GIT_URL')
-remote_branch: str = config('SRC_REMOTE_BRANCH')
-new_branch_name: str = config('NEW_REMOTE_BRANCH')
+# Папка целевого репозитория, в которую добавляются файлы
+base_directory: str = os.path.join('components', 'base')
+
+
+class GitSettings(NamedTuple):
+    """
+    Настройки отправки файла в удалённый репозиторий.
+
+    csv_file_path (str): Путь к локальному CSV файлу, который нужно отправить.
+    remote_repo_url (str): URL удалённого репозитория.
+    remote_branch (str): Ветка, от которой создается новая ветка.
+    new_branch_name (str): Имя новой ветки.
+    mirror_path (str): Путь к постоянному зеркалу удалённого репозитория.
+    fetch_depth (int): Глубина истории, получаемой из удалённого репозитория.
+    """
+    csv_file_path: str
+    remote_repo_url: str
+    remote_branch: str
+    new_branch_name: str
+    mirror_path: str
+    fetch_depth: int
+
+
+def get_settings() -> GitSettings:
+    """
+    Читает настройки отправки файла из конфигурации.
+
+    Возвращает:
+    GitSettings: Настройки отправки файла.
+    """
+    return GitSettings(config('FILE_FOR_PUSH_NAME'), config('GIT_URL'), config('SRC_REMOTE_BRANCH'),
+                       config('NEW_REMOTE_BRANCH'), config('GIT_MIRROR_PATH', default='git_mirror'),
+                       config('GIT_FETCH_DEPTH', default=1, cast=int))
 
 
 def handle_remove_readonly(func: Callable, path: str, exc: Optional[Exception]) -> None:
@@ -57,37 +83,121 @@ def delete_tmp_folder(folder_path: str, max_retries: int = 5, delay: int = 2) ->
         print(f"Папка {folder_path} не существует.")
 
 
+def update_mirror(settings: GitSettings) -> git.Repo:
+    """
+    Обновляет постоянное зеркало удалённого репозитория, создавая его при первом запуске.
+
+    Зеркало - bare-репозиторий с историей глубины fetch_depth только для ветки
+    remote_branch. При повторных запусках из удалённого репозитория получаются
+    только новые коммиты этой ветки.
+
+    Параметры:
+    settings (GitSettings): Настройки отправки файла.
+
+    Возвращает:
+    git.Repo: Репозиторий зеркала.
+    """
+    refspec = f"+refs/heads/{settings.remote_branch}:refs/heads/{settings.remote_branch}"
+    if os.path.isdir(settings.mirror_path):
+        try:
+            mirror = git.Repo(settings.mirror_path)
+            if mirror.remotes.origin.url != settings.remote_repo_url:
+                mirror.remotes.origin.set_url(settings.remote_repo_url)
+            mirror.git.fetch('origin', refspec, depth=settings.fetch_depth, prune=True)
+            print(f"Зеркало {settings.mirror_path} обновлено.")
+            return mirror
+        except (git.exc.InvalidGitRepositoryError, git.exc.GitCommandError, ValueError) as e:
+            print(f"Зеркало {settings.mirror_path} повреждено и будет создано заново: {e}")
+            delete_tmp_folder(settings.mirror_path)
+
+    mirror = git.Repo.clone_from(settings.remote_repo_url, settings.mirror_path, bare=True,
+                                 branch=settings.remote_branch, single_branch=True, depth=settings.fetch_depth,
+                                 filter='blob:none')
+    # Рабочие деревья зеркала извлекаются разреженно по шаблонам из info/sparse-checkout
+    mirror.git.config('core.sparseCheckout', 'true')
+    print(f"Создано зеркало {settings.mirror_path}.")
+    return mirror
+
+
+def remove_worktree(mirror: git.Repo, worktree_path: str) -> None:
+    """
+    Удаляет рабочее дерево зеркала и записи об удалённых рабочих деревьях.
+
+    Параметры:
+    mirror (git.Repo): Репозиторий зеркала.
+    worktree_path (str): Путь к рабочему дереву.
+    """
+    if os.path.exists(worktree_path):
+        try:
+            mirror.git.worktree('remove', '--force', os.path.abspath(worktree_path))
+        except git.exc.GitCommandError:
+            delete_tmp_folder(worktree_path)
+    mirror.git.worktree('prune')
+
+
+def prepare_worktree(mirror: git.Repo, settings: GitSettings, sparse_path: str) -> git.Repo:
+    """
+    Создает рабочее дерево новой ветки от remote_branch с разреженным извлечением.
+
+    В рабочее дерево извлекается только папка sparse_path.
+
+    Параметры:
+    mirror (git.Repo): Репозиторий зеркала.
+    settings (GitSettings): Настройки отправки файла.
+    sparse_path (str): Папка репозитория, которая извлекается в рабочее дерево.
+
+    Возвращает:
+    git.Repo: Репозиторий рабочего дерева.
+    """
+    remove_worktree(mirror, target_repo_path)
+    mirror.git.worktree('add', '--no-checkout', '-B', settings.new_branch_name, os.path.abspath(target_repo_path),
+                        settings.remote_branch)
+    target_repo = git.Repo(target_repo_path)
+    os.makedirs(os.path.join(target_repo.git_dir, 'info'), exist_ok=True)
+    with open(os.path.join(target_repo.git_dir, 'info', 'sparse-checkout'), 'w', encoding='utf-8') as file:
+        file.write(f"/{sparse_path.replace(os.sep, '/')}/\n")
+    target_repo.git.reset('--hard')
+    return target_repo
+
+
 def upload_to_git_via_ssh() -> None:
     """
-    Копирует файл в локальный репозиторий и отправляет его в удалённый репозиторий на новую ветку.
+    Копирует файл в рабочее дерево новой ветки и отправляет его в удалённый репозиторий.
+
+    Вместо полного клонирования используется постоянное зеркало (GIT_MIRROR_PATH),
+    обновляемое инкрементально, и разреженное рабочее дерево, в которое
+    извлекается только папка нового файла в components/base.
     """
     try:
+        settings = get_settings()
+        csv_file_path = settings.csv_file_path
+
         # Проверка существования файла
         if not os.path.exists(csv_file_path):
             print(f"Файл {csv_file_path} не существует")
             return
 
-        # Удаление старого репозитория, если он существует
-        delete_tmp_folder('tmp')
-
-        # Клонирование целевого репозитория
+        # Обновление зеркала целевого репозитория
         try:
-            target_repo = git.Repo.clone_from(remote_repo_url, target_repo_path, branch=remote_branch)
+            mirror = update_mirror(settings)
         except git.exc.GitCommandError as e:
             print(f"Ошибка при клонировании репозитория: {e}")
             return
 
-        # Создание новой ветки
-        new_branch = target_repo.create_head(new_branch_name)
-        target_repo.head.reference = new_branch
-        target_repo.head.reset(index=True, working_tree=True)
-
         # Получение текущей даты и времени
         current_time = datetime.datetime.now()
         formatted_time = current_time.strftime("%Y%m%d%H%M")
+        relative_directory = os.path.join(base_directory, formatted_time)
+
+        # Создание новой ветки в разреженном рабочем дереве
+        try:
+            target_repo = prepare_worktree(mirror, settings, relative_directory)
+        except git.exc.GitCommandError as e:
+            print(f"Ошибка при подготовке ветки {settings.new_branch_name}: {e}")
+            return
 
         # Создание директории для файла
-        target_directory = os.path.join(target_repo_path, 'components', 'base', formatted_time)
+        target_directory = os.path.join(target_repo_path, relative_directory)
         os.makedirs(target_directory, exist_ok=True)
 
         # Копирование файла в целевой репозиторий
@@ -100,31 +210,37 @@ def upload_to_git_via_ssh() -> None:
 
         # Проверка изменений в репозитории
         try:
-            target_repo.git.add(A=True)
+            target_repo.git.add(relative_directory.replace(os.sep, '/'))
             if target_repo.is_dirty():
                 # Коммит изменений
-                target_repo.index.commit(f"Add {csv_file_path}")
+                target_repo.git.commit(m=f"Add {csv_file_path}")
 
                 # Пуш изменений в новую ветку
                 origin = target_repo.remotes.origin
-                origin.push(refspec=f"HEAD:refs/heads/{new_branch_name}")
-                print(f"Файл {csv_file_path} успешно запушен в {remote_repo_url} на ветку {new_branch_name}")
+                push_info = origin.push(refspec=f"HEAD:refs/heads/{settings.new_branch_name}")
+                failed = git.remote.PushInfo.ERROR | git.remote.PushInfo.REJECTED | git.remote.PushInfo.REMOTE_REJECTED
+                if any(info.flags & failed for info in push_info):
+                    print(f"Ошибка при отправке ветки {settings.new_branch_name}: "
+                          f"{'; '.join(info.summary.strip() for info in push_info)}")
+                else:
+                    print(f"Файл {csv_file_path} успешно запушен в {settings.remote_repo_url} "
+                          f"на ветку {settings.new_branch_name}")
             else:
                 print("Нет изменений для коммита.")
         except git.exc.GitCommandError as e:
             print(f"Ошибка при выполнении git-команды: {e}")
 
-        # Закрытие репозитория и сборка мусора
+        # Удаление рабочего дерева и его папки; зеркало сохраняется для следующего запуска
         target_repo.close()
+        remove_worktree(mirror, target_repo_path)
+        delete_tmp_folder(os.path.dirname(target_repo_path))
+        mirror.close()
         gc.collect()
 
     except Exception as e:
         print(f"Произошла ошибка: {e}")
         sys.exit(1)
 
-    # Удаление временной папки после завершения работы
-    delete_tmp_folder('tmp')
-
 
 # Пример использования
 if __name__ == "__main__":
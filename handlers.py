@@ -1,10 +1,37 @@
 import pandas as pd
+import numpy as np
 import logging
-from db import get_drct_id, get_all_msisdn, execute_max_pset_id_query, insert_csv_updated_data
+import metrics
+from registry_cache import read_registry_file
+from snapshot import RegistrySnapshot, diff_registry, load_snapshot, save_snapshot
+from tables import RegionDirectoryCache
+from storage import get_backend
+from writers import DEFAULT_CHUNK_ROWS, write_records
+from prefix_trie import COVERED, DUPLICATE, PrefixConflict, PrefixTrie, log_conflicts, validate_prefix_file
 from datetime import datetime
 import os
 from decouple import config
 import sys
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+# Период действия формируемых префиксов
+START_DATE = datetime(2000, 1, 1)
+END_DATE = datetime(2999, 12, 31)
+
+# Файл реестра по умолчанию
+DEFAULT_REGISTRY_FILES = ['DEF-9xx.csv']
+
+# Множитель для перевода кода АВС/DEF и номера внутри кода в единый десятизначный ключ
+RANGE_FACTOR = 10 ** 7
+
+# Длина номера телефона без кода страны
+NUMBER_LENGTH = 10
+
+# Максимальное число диапазонов в кэше построенных префиксов
+PREFIX_CACHE_SIZE = 4096
 
 def setup_logging(log_folder: str) -> None:
     """
@@ -58,6 +85,144 @@ def bin_search(df: pd.DataFrame, phone_number: str) -> pd.Series:
         logging.error(f'Ошибка при бинарном поиске: {e}')
         sys.exit(1)
 
+def load_registry(file_paths: List[str]) -> pd.DataFrame:
+    """
+    Читает файлы реестра (ABC-3xx, ABC-4xx, ABC-8xx, DEF-9xx) в единую таблицу.
+
+    Если REGISTRY_CACHE включен, разобранный файл берется из двоичного кэша
+    рядом с файлом (см. registry_cache.read_registry_file).
+
+    Параметры:
+    file_paths (List[str]): Пути к CSV файлам реестра.
+
+    Возвращает:
+    pd.DataFrame: Объединенный реестр, отсортированный по коду и началу диапазона.
+    """
+    try:
+        use_cache = config('REGISTRY_CACHE', default=True, cast=bool)
+        with metrics.stage('registry_load') as stage:
+            frames = [read_registry_file(file_path, use_cache) for file_path in file_paths]
+            # Каждый файл уже отсортирован (parse_registry_file, кэш), сортируется только объединение
+            df = frames[0]
+            if len(frames) > 1:
+                df = pd.concat(frames, ignore_index=True).sort_values(by=['АВС/ DEF', 'От'], kind='stable',
+                                                                      ignore_index=True)
+            stage.rows = len(df)
+        logging.info(f'Реестр загружен из файлов {file_paths}: {len(df)} строк')
+        return df
+    except Exception as e:
+        logging.error(f'Ошибка при чтении реестра: {e}')
+        sys.exit(1)
+
+def registry_keys(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Переводит диапазоны реестра в отсортированные целочисленные ключи начала и конца.
+
+    Параметры:
+    df (pd.DataFrame): DataFrame с данными реестра.
+
+    Возвращает:
+    Tuple[np.ndarray, np.ndarray, np.ndarray]: Ключи начала и конца диапазонов в порядке возрастания
+    и позиции соответствующих строк в исходном DataFrame.
+    """
+    codes = df['АВС/ DEF'].astype(np.int64).to_numpy()
+    starts = codes * RANGE_FACTOR + df['От'].astype(np.int64).to_numpy()
+    ends = codes * RANGE_FACTOR + df['До'].astype(np.int64).to_numpy()
+    order = np.argsort(starts, kind='stable')
+    return starts[order], ends[order], order
+
+def batch_lookup(df: pd.DataFrame, phone_numbers: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Находит строки реестра для всего массива номеров за один векторный проход.
+
+    Параметры:
+    df (pd.DataFrame): DataFrame с данными реестра.
+    phone_numbers (Iterable[str]): Десятизначные номера телефонов.
+
+    Возвращает:
+    Tuple[np.ndarray, np.ndarray]: Позиции найденных строк в DataFrame (-1 для ненайденных номеров)
+    и маска найденных номеров.
+    """
+    try:
+        starts, ends, order = registry_keys(df)
+        numbers = pd.to_numeric(pd.Series(list(phone_numbers), dtype=object), errors='coerce')
+        valid = numbers.notna().to_numpy()
+        keys = numbers.fillna(-1).to_numpy(dtype=np.int64)
+
+        positions = np.searchsorted(starts, keys, side='right') - 1
+        found = valid & (positions >= 0)
+        found[found] = keys[found] <= ends[positions[found]]
+
+        row_indices = np.full(len(keys), -1, dtype=np.int64)
+        row_indices[found] = order[positions[found]]
+        return row_indices, found
+    except Exception as e:
+        logging.error(f'Ошибка при пакетном поиске номеров: {e}')
+        sys.exit(1)
+
+def range_to_prefixes(prefix: str, low: str, high: str) -> list:
+    """
+    Строит минимальный набор префиксов, покрывающий диапазон номеров.
+
+    Диапазон разбирается по разрядам границ: на каждом шаге от текущего начала
+    берется наибольший выровненный блок из 10^k номеров, не выходящий за конец
+    диапазона. Число шагов не превышает 18 на разряд и не зависит от емкости.
+
+    Параметры:
+    prefix (str): Префикс.
+    low (str): Нижний диапазон.
+    high (str): Верхний диапазон.
+
+    Возвращает:
+    list: Список префиксов в порядке возрастания.
+    """
+    try:
+        width = len(low)
+        start = int(prefix + low)
+        end = int(prefix + high)
+        prefixes = []
+        while start <= end:
+            digits = 0
+            while digits < width and start % 10 ** (digits + 1) == 0 and start + 10 ** (digits + 1) - 1 <= end:
+                digits += 1
+            prefixes.append(start // 10 ** digits)
+            start += 10 ** digits
+        return prefixes
+    except Exception as e:
+        logging.error(f'Ошибка при построении префиксов диапазона: {e}')
+        sys.exit(1)
+
+@lru_cache(maxsize=PREFIX_CACHE_SIZE)
+def cached_range_prefixes(prefix: str, low: str, high: str) -> tuple:
+    """
+    Возвращает префиксы диапазона из кэша (код, От, До), строя их при промахе.
+
+    При однократном запуске каждый диапазон реестра встречается один раз и
+    кэш не дает попаданий. Кэш рассчитан на режим watch (daemon.WatchDaemon):
+    процесс живет между циклами, и при повторном построении неизменившиеся
+    диапазоны реестра берутся из кэша.
+
+    Параметры:
+    prefix (str): Префикс.
+    low (str): Нижний диапазон.
+    high (str): Верхний диапазон.
+
+    Возвращает:
+    tuple: Префиксы в порядке возрастания.
+    """
+    return tuple(range_to_prefixes(prefix, low, high))
+
+def log_prefix_cache_stats() -> None:
+    """
+    Записывает в лог статистику кэша построенных префиксов.
+    """
+    info = cached_range_prefixes.cache_info()
+    requests = info.hits + info.misses
+    hit_rate = info.hits / requests if requests else 0.0
+    metrics.set_hit_ratio('prefix', info.hits, info.misses)
+    logging.info(f'Кэш префиксов: попаданий {info.hits}, промахов {info.misses}, '
+                 f'доля попаданий {hit_rate:.1%}, записей {info.currsize}/{info.maxsize}')
+
 def compress_numbers(numbers: list) -> list:
     """
     Сжимает последовательные номера в список префиксов.
@@ -109,27 +274,33 @@ def compress_str(prefix: str, low: str, high: str) -> list:
         logging.error(f'Ошибка при сжатии строки: {e}')
         sys.exit(1)
 
-def write_to_csv(data: set, file_path: str) -> None:
+def write_to_csv(data: Iterable[tuple], file_path: str) -> None:
     """
-    Записывает данные в CSV файл с помощью pandas.
+    Записывает данные, отсортированные по PREFIX, в файл формата OUTPUT_FORMAT.
+
+    Записи сортируются частями по OUTPUT_CHUNK_ROWS, поэтому потребление
+    памяти не зависит от количества записей (см. writers.write_records).
+    При VALIDATE_OUTPUT=True записанный файл проверяется на повторяющиеся
+    и перекрывающиеся префиксы (см. prefix_trie.validate_prefix_file).
 
     Параметры:
-    data (set): Множество кортежей, где каждый кортеж содержит данные.
+    data (Iterable[tuple]): Кортежи с данными (см. form_tuple).
     file_path (str): Путь к файлу, в который нужно записать данные.
     """
     try:
-        df = pd.DataFrame(list(data), columns=['PSET_ID', 'NUMBER_HISTORY', 'OPER_OPER_ID', 'PREFIX', 'START_DATE',
-                                               'END_DATE', 'NAVI_USER', 'NAVI_DATE', 'DRCT_DRCT_ID', 'CIT_CIT_ID',
-                                               'COU_COU_ID', 'PSET_COMMENT', 'ODRC_ODRC_ID', 'ZONE_ZONE_ID', 'AOB_AOB_ID',
-                                               'RTCM_RTCM_ID', 'ACTION'])
-
-        df = df.sort_values(by='PREFIX')
-        df.to_csv(file_path, index=False)
+        output_format = config('OUTPUT_FORMAT', default='csv')
+        with metrics.stage('csv_export') as stage:
+            stats = write_records(data, file_path, output_format,
+                                  config('OUTPUT_CHUNK_ROWS', default=DEFAULT_CHUNK_ROWS, cast=int))
+            stage.rows = stats.rows
+        metrics.count('output_bytes', stats.size)
+        if config('VALIDATE_OUTPUT', default=False, cast=bool):
+            log_conflicts(validate_prefix_file(file_path, output_format), f'файл {file_path}')
     except Exception as e:
         logging.error(f'Ошибка при записи в CSV: {e}')
         sys.exit(1)
 
-def form_tuple(pset_id: int, prefix: str, region_id: int, nuser: str) -> tuple:
+def form_tuple(pset_id: int, prefix: str, region_id: int, nuser: str, action: str = 'MERGE') -> tuple:
     """
     Формирует кортеж с данными для записи в CSV.
 
@@ -138,6 +309,7 @@ def form_tuple(pset_id: int, prefix: str, region_id: int, nuser: str) -> tuple:
     prefix (str): Префикс.
     region_id (int): Идентификатор региона.
     nuser (str): Имя пользователя.
+    action (str): Действие над префиксом: 'MERGE' или 'DELETE'.
 
     Возвращает:
     tuple: Кортеж с данными.
@@ -145,10 +317,10 @@ def form_tuple(pset_id: int, prefix: str, region_id: int, nuser: str) -> tuple:
     try:
         number_history = 1
         oper_oper_id = 0
-        start_date = '01-01-2000'
-        end_date = '31-12-2999'
+        start_date = START_DATE
+        end_date = END_DATE
         navi_user = nuser
-        navi_date = datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+        navi_date = datetime.now().replace(microsecond=0)
         cit_cit_id = 0
         cou_cou_id = 0
         pset_comment = 'ВЗН'
@@ -156,7 +328,6 @@ def form_tuple(pset_id: int, prefix: str, region_id: int, nuser: str) -> tuple:
         zone_zone_id = 0
         aob_aob_id = None
         rtcm_rtcm_id = None
-        action = 'MERGE'
         tup = (pset_id, number_history, oper_oper_id, prefix, start_date, end_date, navi_user, navi_date, region_id,
                cit_cit_id, cou_cou_id, pset_comment, odrc_odrc_id, zone_zone_id, aob_aob_id, rtcm_rtcm_id, action)
         return tup
@@ -164,6 +335,100 @@ def form_tuple(pset_id: int, prefix: str, region_id: int, nuser: str) -> tuple:
         logging.error(f'Ошибка при формировании кортежа: {e}')
         sys.exit(1)
 
+def prefix_spans(prefixes: Iterable[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Вычисляет диапазоны номеров, покрываемые префиксами.
+
+    Префикс длины L покрывает 10^(NUMBER_LENGTH - L) номеров.
+
+    Параметры:
+    prefixes (Iterable[int]): Префиксы.
+
+    Возвращает:
+    Tuple[np.ndarray, np.ndarray]: Первый и последний номер, покрываемые каждым префиксом.
+    """
+    values = np.fromiter(prefixes, dtype=np.int64)
+    lengths = np.char.str_len(values.astype(str))
+    sizes = 10 ** (NUMBER_LENGTH - lengths).astype(np.int64)
+    starts = values * sizes
+    return starts, starts + sizes - 1
+
+def verify_prefixes(rows: pd.DataFrame, prefixes: List[list]) -> pd.DataFrame:
+    """
+    Проверяет покрытие диапазонов реестра префиксами для всех строк за один векторный проход.
+
+    Для каждой строки проверяется, что префиксы отсортированы, не пересекаются,
+    не оставляют пропусков и покрывают ровно диапазон от 'От' до 'До'.
+
+    Параметры:
+    rows (pd.DataFrame): Строки реестра со столбцами 'АВС/ DEF', 'От', 'До', 'Емкость'.
+    prefixes (List[list]): Списки префиксов для каждой строки в том же порядке.
+
+    Возвращает:
+    pd.DataFrame: Отчет по строкам с индексом rows и столбцами prefixes (число префиксов),
+    covered (покрыто номеров), capacity, unsorted, overlaps, holes (число нарушений
+    между соседними префиксами), start_ok, end_ok и итоговым ok.
+    """
+    try:
+        counts = np.fromiter((len(row_prefixes) for row_prefixes in prefixes), dtype=np.int64, count=len(prefixes))
+        row_ids = np.repeat(np.arange(len(prefixes)), counts)
+        starts, ends = prefix_spans(itertools.chain.from_iterable(prefixes))
+
+        same_row = row_ids[1:] == row_ids[:-1]
+        gaps = starts[1:] - ends[:-1] - 1
+        next_row_ids = row_ids[1:]
+
+        def count_by_row(flags: np.ndarray) -> np.ndarray:
+            return np.bincount(next_row_ids[same_row & flags], minlength=len(prefixes))
+
+        codes = rows['АВС/ DEF'].astype(np.int64).to_numpy()
+        expected_starts = codes * RANGE_FACTOR + rows['От'].astype(np.int64).to_numpy()
+        expected_ends = codes * RANGE_FACTOR + rows['До'].astype(np.int64).to_numpy()
+
+        has_prefixes = counts > 0
+        first = np.cumsum(counts) - counts
+        last = np.cumsum(counts) - 1
+        start_ok = np.zeros(len(prefixes), dtype=bool)
+        end_ok = np.zeros(len(prefixes), dtype=bool)
+        start_ok[has_prefixes] = starts[first[has_prefixes]] == expected_starts[has_prefixes]
+        end_ok[has_prefixes] = ends[last[has_prefixes]] == expected_ends[has_prefixes]
+
+        report = pd.DataFrame({
+            'prefixes': counts,
+            'covered': np.bincount(row_ids, weights=ends - starts + 1, minlength=len(prefixes)).astype(np.int64),
+            'capacity': rows['Емкость'].astype(np.int64).to_numpy(),
+            'unsorted': count_by_row(starts[1:] < starts[:-1]),
+            'overlaps': count_by_row(gaps < 0),
+            'holes': count_by_row(gaps > 0),
+            'start_ok': start_ok,
+            'end_ok': end_ok,
+        }, index=rows.index)
+        report['ok'] = (report['start_ok'] & report['end_ok'] & (report['covered'] == report['capacity'])
+                        & (report[['unsorted', 'overlaps', 'holes']].sum(axis=1) == 0))
+        return report
+    except Exception as e:
+        logging.error(f'Ошибка при проверке покрытия префиксов: {e}')
+        sys.exit(1)
+
+def log_prefix_report(report: pd.DataFrame) -> bool:
+    """
+    Записывает в лог итог проверки префиксов и строки с нарушениями.
+
+    Параметры:
+    report (pd.DataFrame): Отчет verify_prefixes.
+
+    Возвращает:
+    bool: True, если все строки прошли проверку.
+    """
+    failed = report[~report['ok']]
+    for row_index, row in failed.iterrows():
+        logging.error(f'Ошибка при проверке префиксов строки {row_index}: префиксов {row["prefixes"]}, '
+                      f'покрыто {row["covered"]} из {row["capacity"]}, неупорядоченных {row["unsorted"]}, '
+                      f'пересечений {row["overlaps"]}, пропусков {row["holes"]}, '
+                      f'начало {"верно" if row["start_ok"] else "неверно"}, конец {"верно" if row["end_ok"] else "неверно"}')
+    logging.info(f'Проверено строк реестра: {len(report)}, с ошибками: {len(failed)}')
+    return failed.empty
+
 def check_prefix(numbers: list, capacity: int, end: str) -> bool:
     """
     Проверяет корректность построения префиксов.
@@ -177,35 +442,17 @@ def check_prefix(numbers: list, capacity: int, end: str) -> bool:
     bool: True если корректно, иначе False.
     """
     try:
-        arr = numbers.copy()
-        count = 0
-        m = len(arr)
-        for i in range(m):
-            if i != len(arr) - 1:
-                cur_l = str(arr[i])
-                if len(cur_l) < 10:
-                    cur_l += '0' * (10 - len(cur_l))
-                cur_r = str(arr[i + 1])
-                if len(cur_r) < 10:
-                    cur_r += '0' * (10 - len(cur_r))
-                tmp = int(cur_r) - int(cur_l)
-                count += tmp
-            else:
-                cur_l = str(arr[i])
-                if len(cur_l) < 10:
-                    cur_l += '0' * (10 - len(cur_l))
-                cur_r = str(arr[i])[:3] + end
-                if len(cur_r) < 10:
-                    cur_r = '0' * (10 - len(cur_r)) + cur_r
-                tmp = int(cur_r) - int(cur_l)
-                count += tmp
-        count += 1
-        return count == capacity
+        if not numbers:
+            return False
+        starts, ends = prefix_spans(numbers)
+        contiguous = bool(np.all(starts[1:] == ends[:-1] + 1))
+        last_number = int(str(numbers[-1])[:3] + end)
+        return contiguous and ends[-1] == last_number and ends[-1] - starts[0] + 1 == capacity
     except Exception as e:
         logging.error(f'Ошибка при проверке префиксов: {e}')
         sys.exit(1)
 
-def form_prefix(prefix: str, low: str, high: str, capacity: int) -> list:
+def form_prefix(prefix: str, low: str, high: str, capacity: int, verify: bool = True) -> list:
     """
     Формирует список префиксов.
 
@@ -214,14 +461,16 @@ def form_prefix(prefix: str, low: str, high: str, capacity: int) -> list:
     low (str): Нижний диапазон.
     high (str): Верхний диапазон.
     capacity (int): Емкость.
+    verify (bool): Проверять ли префиксы сразу. При пакетной обработке проверка
+    выполняется для всех строк через verify_prefixes.
 
     Возвращает:
     list: Список префиксов.
     """
     try:
-        numbers = compress_str(prefix, low, high)
-        for _ in range(10):
-            numbers = compress_numbers(numbers)
+        numbers = range_to_prefixes(prefix, low, high)
+        if not verify:
+            return numbers
         if check_prefix(numbers, capacity, high):
             logging.info('Все префиксы корректны')
         else:
@@ -232,62 +481,259 @@ def form_prefix(prefix: str, low: str, high: str, capacity: int) -> list:
         logging.error(f'Ошибка при формировании префиксов: {e}')
         sys.exit(1)
 
-def handle_data() -> None:
+def group_rows(row_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Группирует номера по строкам реестра в порядке первого появления строки.
+
+    Параметры:
+    row_indices (np.ndarray): Позиции строк реестра для найденных номеров.
+
+    Возвращает:
+    Tuple[np.ndarray, np.ndarray]: Уникальные позиции строк и число номеров в каждой строке.
     """
-    Основная функция для обработки данных и записи их в CSV.
+    rows, first_seen, counts = np.unique(row_indices, return_index=True, return_counts=True)
+    order = np.argsort(first_seen, kind='stable')
+    return rows[order], counts[order]
+
+def plan_incremental(snapshot: RegistrySnapshot, df: pd.DataFrame, msisdns: np.ndarray,
+                     row_indices: np.ndarray, matched: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Определяет строки реестра, префиксы которых нужно добавить или удалить по сравнению со снимком.
+
+    Префиксы пересчитываются только для добавленных и измененных строк реестра
+    и для строк, в которые попали новые номера. Префиксы удаленных строк,
+    в которые попадали ранее обработанные номера, удаляются.
+
+    Параметры:
+    snapshot (RegistrySnapshot): Снимок предыдущего запуска.
+    df (pd.DataFrame): Новый реестр.
+    msisdns (np.ndarray): Номера текущего запуска.
+    row_indices (np.ndarray): Позиции строк нового реестра для номеров.
+    matched (np.ndarray): Маска найденных номеров.
+
+    Возвращает:
+    Tuple[np.ndarray, np.ndarray]: Позиции строк нового реестра для MERGE
+    и позиции строк снимка для DELETE (с повторами, по одной на номер).
+    """
+    diff = diff_registry(snapshot.registry, df)
+    dirty = diff.added | diff.changed
+    new_msisdns = ~np.isin(msisdns, snapshot.msisdns)
+    merge_mask = matched & (new_msisdns | dirty[np.where(matched, row_indices, 0)])
+    logging.info(f'Новых номеров: {new_msisdns.sum()}, номеров для пересчета: {merge_mask.sum()}')
+
+    old_indices, old_matched = batch_lookup(snapshot.registry, snapshot.msisdns)
+    delete_mask = old_matched & diff.removed[np.where(old_matched, old_indices, 0)]
+    return row_indices[merge_mask], old_indices[delete_mask]
+
+def add_row_records(df: pd.DataFrame, row_indices: np.ndarray, action: str, region_cache: RegionDirectoryCache,
+                    nuser: str, pset_id: int, prefix_trie: PrefixTrie, arr: set,
+                    conflicts: List[PrefixConflict]) -> Tuple[int, List[int], List[tuple]]:
+    """
+    Формирует записи для префиксов строк реестра.
+
+    Повторно сформированный префикс пропускается. Префикс MERGE, покрытый
+    более коротким уже сформированным префиксом, пропускается, а префикс,
+    покрывающий более длинные, добавляется; оба случая попадают в conflicts.
+    Префиксы DELETE внутри префиксов MERGE не пропускаются: так удаляются
+    более мелкие префиксы, замененные укрупненной строкой реестра.
+
+    Префиксы добавляются в prefix_trie от коротких к длинным, поэтому
+    покрытый префикс пропускается независимо от порядка строк реестра.
+    Записи формируются в порядке строк, PSET_ID назначаются по порядку.
+
+    Параметры:
+    df (pd.DataFrame): Реестр.
+    row_indices (np.ndarray): Позиции строк реестра (по одной на номер).
+    action (str): Действие над префиксами: 'MERGE' или 'DELETE'.
+    region_cache (RegionDirectoryCache): Кэш справочника регионов.
+    nuser (str): Имя пользователя для NAVI_USER.
+    pset_id (int): Текущий PSET_ID.
+    prefix_trie (PrefixTrie): Уже добавленные префиксы. Пополняется.
+    arr (set): Сформированные записи. Пополняется.
+    conflicts (List[PrefixConflict]): Конфликты префиксов MERGE. Пополняется.
+
+    Возвращает:
+    Tuple[int, List[int], List[tuple]]: Следующий PSET_ID, обработанные позиции строк и их префиксы.
+    """
+    processed_rows, processed_prefixes = [], []
+    candidates = []  # (префикс, регион) в порядке строк реестра
+    rows, row_counts = group_rows(row_indices)
+    for row_index, msisdn_count in zip(rows, row_counts):
+        result_str = df.iloc[row_index]
+        try:
+            prefix = str(result_str['АВС/ DEF'])
+            low = result_str['От']
+            high = result_str['До']
+            region = result_str['Регион']
+        except KeyError as e:
+            logging.error(f'Ключ {e} отсутствует в result_str')
+            sys.exit(1)
+        except Exception as e:
+            logging.error(f'Ошибка при доступе к элементам result_str: {e}')
+            sys.exit(1)
+        region_id = region_cache.get(region)
+        if region_id is None:
+            continue
+        new_prefix = cached_range_prefixes(prefix, low, high)
+        logging.info(f'Строка реестра {prefix} {low}-{high} ({action}): номеров {msisdn_count}, префиксов {len(new_prefix)}')
+        processed_rows.append(row_index)
+        processed_prefixes.append(new_prefix)
+        candidates.extend((prefix_value, region_id) for prefix_value in new_prefix)
+
+    # Сортировка устойчивая: из одинаковых префиксов добавляется встретившийся первым
+    accepted = set()
+    for position in sorted(range(len(candidates)), key=lambda position: len(str(candidates[position][0]))):
+        prefix_value, region_id = candidates[position]
+        conflict = prefix_trie.insert(str(prefix_value), region_id)
+        if conflict and conflict.kind == DUPLICATE:
+            continue
+        if conflict and action == 'MERGE':
+            conflicts.append(conflict)
+            if conflict.kind == COVERED:
+                continue
+        accepted.add(position)
+
+    for position, (prefix_value, region_id) in enumerate(candidates):
+        if position not in accepted:
+            continue
+        tup = form_tuple(pset_id, prefix_value, region_id, nuser, action)
+        if tup:
+            pset_id += 1
+            arr.add(tup)
+    return pset_id, processed_rows, processed_prefixes
+
+def check_prefix_sets(records: Iterable[tuple], existing_prefixes: Iterable[str]) -> List[PrefixConflict]:
+    """
+    Проверяет префиксы MERGE на перекрытие с префиксами таблицы PREFIX_SETS.
+
+    Совпадение с существующим префиксом не считается конфликтом (запись
+    обновляется), конфликтом считается префикс, покрытый более коротким
+    существующим или покрывающий более длинные существующие.
+
+    Параметры:
+    records (Iterable[tuple]): Сформированные записи (см. form_tuple).
+    existing_prefixes (Iterable[str]): Префиксы таблицы PREFIX_SETS.
+
+    Возвращает:
+    List[PrefixConflict]: Конфликты.
+    """
+    existing = PrefixTrie()
+    existing.load(existing_prefixes)
+    conflicts = []
+    for record in records:
+        if record[16] == 'MERGE':
+            conflict = existing.check(str(record[3]))
+            if conflict and conflict.kind != DUPLICATE:
+                conflicts.append(conflict)
+    log_conflicts(conflicts, 'PREFIX_SETS')
+    return conflicts
+
+def handle_data(registry_files: Optional[List[str]] = None, nuser: Optional[str] = None,
+                registry: Optional[pd.DataFrame] = None, phone_numbers: Optional[List[Tuple]] = None,
+                region_cache: Optional[RegionDirectoryCache] = None) -> bool:
+    """
+    Основная функция для обработки данных, записи их в базу данных и в CSV.
+
+    Сформированные записи передаются в хранилище DB_BACKEND (см. storage.get_backend) напрямую, CSV файл
+    FILE_FOR_PUSH_NAME записывается параллельно, если EXPORT_CSV=True.
+
+    При INCREMENTAL=True реестр сравнивается со снимком предыдущего запуска
+    (папка SNAPSHOT_DIR), и записи формируются только для изменений:
+    MERGE для добавленных и измененных строк и новых номеров, DELETE для
+    префиксов удаленных строк.
+
+    Уже загруженные реестр, номера и справочник регионов можно передать
+    параметрами, тогда они не читаются повторно (используется в режиме watch).
+
+    Параметры:
+    registry_files (Optional[List[str]]): Файлы реестра. По умолчанию DEFAULT_REGISTRY_FILES.
+    nuser (Optional[str]): Имя пользователя для NAVI_USER. По умолчанию берется из NAVI_USER или запрашивается.
+    registry (Optional[pd.DataFrame]): Загруженный реестр (см. load_registry).
+    phone_numbers (Optional[List[Tuple]]): Номера в формате [('9000000000',), ...].
+    region_cache (Optional[RegionDirectoryCache]): Справочник регионов.
+
+    Возвращает:
+    bool: True, если записи переданы в базу данных.
     """
     try:
         setup_logging('./logs')
 
-        file_path = 'DEF-9xx.csv'
-        df = pd.read_csv(file_path, delimiter=';', dtype={'От': str, 'До': str})
-        phone_numbers = get_all_msisdn()  # Вызов номеров в формате [('9000000000',), ('9999999999',)]
+        backend = get_backend()
+        df = registry if registry is not None else load_registry(registry_files or DEFAULT_REGISTRY_FILES)
+        if phone_numbers is None:
+            with metrics.stage('msisdn_fetch') as stage:
+                phone_numbers = backend.get_all_msisdn()  # Вызов номеров в формате [('9000000000',), ('9999999999',)]
+                stage.rows = len(phone_numbers)
         logging.info('На построение префиксов поступили следующие номера: %s', phone_numbers)
+        incremental = config('INCREMENTAL', default=False, cast=bool)
+        snapshot_dir = config('SNAPSHOT_DIR', default='snapshot')
+        snapshot = load_snapshot(snapshot_dir) if incremental else None
         arr = set()
+        msisdns = np.array([phone_number[0] for phone_number in phone_numbers], dtype=object)
+        processed_msisdns = msisdns
         if phone_numbers:
-            nuser = input('Введите имя пользователя для NAVI_USER: ')
-            pset_id = execute_max_pset_id_query()
-            prefix_set = set()
-            for phone_number in phone_numbers:
-                result_str = bin_search(df, phone_number[0])
-                if result_str is None:
-                    logging.warning(f'Для номера {phone_number[0]} не найден соответствующий префикс')
-                    continue
-                try:
-                    prefix = str(result_str['АВС/ DEF'])
-                    low = result_str['От']
-                    high = result_str['До']
-                    region = result_str['Регион']
-                    capacity = result_str['Емкость']
-                except KeyError as e:
-                    logging.error(f'Ключ {e} отсутствует в result_str')
-                    sys.exit(1)
-                except Exception as e:
-                    logging.error(f'Ошибка при доступе к элементам result_str: {e}')
-                    sys.exit(1)
-                try:
-                    region_id = get_drct_id(region)[0][0]
-                except IndexError:
-                    logging.warning(f'Регион {region} отсутствует в справочнике')
-                    continue
-                new_prefix = form_prefix(prefix, low, high, capacity)
-                for i in range(len(new_prefix)):
-                    if new_prefix[i] not in prefix_set:
-                        tup = form_tuple(pset_id, new_prefix[i], region_id, nuser)
-                        if tup:
-                            pset_id += 1
-                            arr.add(tup)
-                            prefix_set.add(new_prefix[i])
+            nuser = nuser or config('NAVI_USER', default='') or input('Введите имя пользователя для NAVI_USER: ')
+            pset_id = backend.get_max_pset_id()
+            prefix_trie = PrefixTrie()
+            conflicts = []
+            if region_cache is None:
+                region_cache_ttl = config('REGION_CACHE_TTL', default=0, cast=float)
+                region_cache = backend.region_cache(ttl=region_cache_ttl or None)
+                region_cache.load()
+            with metrics.stage('lookup') as stage:
+                row_indices, matched = batch_lookup(df, msisdns)
+                stage.rows = len(msisdns)
+            for phone_number in msisdns[~matched]:
+                logging.warning(f'Для номера {phone_number} не найден соответствующий префикс')
+            logging.info(f'Найдено номеров: {matched.sum()}, строк реестра: {len(np.unique(row_indices[matched]))}')
+
+            if snapshot is not None:
+                merge_rows, delete_rows = plan_incremental(snapshot, df, msisdns, row_indices, matched)
+            else:
+                merge_rows, delete_rows = row_indices[matched], np.empty(0, dtype=np.int64)
+
+            with metrics.stage('prefix_generation') as stage:
+                pset_id, verified_rows, verified_prefixes = add_row_records(df, merge_rows, 'MERGE', region_cache,
+                                                                            nuser, pset_id, prefix_trie, arr,
+                                                                            conflicts)
+                if len(delete_rows):
+                    # Префиксы, снова попавшие в MERGE, не удаляются
+                    pset_id, _, _ = add_row_records(snapshot.registry, delete_rows, 'DELETE', region_cache,
+                                                    nuser, pset_id, prefix_trie, arr, conflicts)
+                stage.rows = len(arr)
+            # В снимок попадают только номера обработанных строк: строки, пропущенные из-за
+            # отсутствия региона в справочнике, обрабатываются повторно в следующем запуске
+            skipped_rows = np.setdiff1d(merge_rows, verified_rows)
+            processed_msisdns = msisdns[matched & ~np.isin(row_indices, skipped_rows)]
+            region_cache.log_stats()
+            log_prefix_cache_stats()
+            log_conflicts(conflicts, 'сформированные префиксы')
+            if config('PREFIX_SETS_CHECK', default=False, cast=bool):
+                check_prefix_sets(arr, backend.get_prefix_sets_prefixes())
+            if verified_rows:
+                log_prefix_report(verify_prefixes(df.iloc[verified_rows], verified_prefixes))
             if not arr:
                 logging.warning('Не удалось сформировать данные для записи в CSV')
 
         else:
             logging.warning('Номера не найдены')
 
-        file_path = config('FILE_FOR_PUSH_NAME')
-        print(file_path)
-        write_to_csv(arr, file_path)
-        insert_csv_updated_data(file_path)
+        # Запись файла и загрузка в базу данных читают записи независимыми итераторами:
+        # файл сортируется частями в write_records, а загрузка идет пакетами по BATCH_SIZE
+        export_csv = config('EXPORT_CSV', default=True, cast=bool)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            if export_csv:
+                file_path = config('FILE_FOR_PUSH_NAME')
+                print(file_path)
+                export = executor.submit(write_to_csv, iter(arr), file_path)
+            with metrics.stage('insert') as stage:
+                inserted = backend.insert_prefix_records(iter(arr))
+                stage.rows = len(arr) if inserted else 0
+            if export_csv:
+                export.result()
+        if incremental and inserted:
+            save_snapshot(snapshot_dir, df, processed_msisdns)
+        return inserted
     except Exception as e:
         logging.error(f'Ошибка в функции handle_data: {e}')
         sys.exit(1)
@@ -0,0 +1,483 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+from decouple import config, Csv
+import metrics
+from handlers import NUMBER_LENGTH, load_registry, registry_keys
+from prefix_trie import is_digits
+
+# Максимальное количество номеров в одном пакетном запросе
+MAX_BATCH_SIZE = 100000
+# Максимальный размер тела пакетного запроса в байтах (с запасом на MAX_BATCH_SIZE номеров в JSON)
+MAX_BODY_SIZE = 4 * 1024 * 1024
+
+
+class LookupResult(NamedTuple):
+    """
+    Результат поиска номера в реестре.
+    """
+    msisdn: str
+    operator: str
+    region: str
+    inn: str
+    drct_id: Optional[int]
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+
+def _text(value) -> str:
+    """
+    Приводит значение столбца реестра к строке (пустая строка для отсутствующих значений).
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def is_msisdn(value: str) -> bool:
+    """
+    Проверяет, что строка - десятизначный номер из цифр 0-9.
+    """
+    return len(value) == NUMBER_LENGTH and is_digits(value)
+
+
+class RegistryIndex:
+    """
+    Неизменяемый индекс диапазонов реестра для поиска номеров.
+
+    Диапазоны хранятся отсортированными целочисленными ключами начала и конца
+    (код * 10^7 + номер внутри кода), атрибуты строк - кортежами в том же
+    порядке. Индекс не изменяется после построения, поэтому читается из
+    любого числа потоков без блокировок; новый реестр загружается в новый
+    индекс (см. LookupService.swap).
+    """
+
+    __slots__ = ('starts', 'ends', '_starts_list', '_ends_list', 'operators', 'regions', 'inns', 'drct_ids', 'version',
+                 'built_at')
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, operators: Tuple[str, ...], regions: Tuple[str, ...],
+                 inns: Tuple[str, ...], drct_ids: Tuple[Optional[int], ...], version: int = 0) -> None:
+        """
+        Параметры:
+        starts (np.ndarray): Ключи начала диапазонов в порядке возрастания.
+        ends (np.ndarray): Ключи конца диапазонов.
+        operators (Tuple[str, ...]): Операторы диапазонов.
+        regions (Tuple[str, ...]): Регионы диапазонов.
+        inns (Tuple[str, ...]): ИНН операторов.
+        drct_ids (Tuple[Optional[int], ...]): DRCT_DRCT_ID регионов (None, если региона нет в справочнике).
+        version (int): Номер версии индекса.
+        """
+        starts.flags.writeable = False
+        ends.flags.writeable = False
+        self.starts = starts
+        self.ends = ends
+        # Поиск одного номера через bisect по спискам быстрее, чем np.searchsorted для скаляра
+        self._starts_list = starts.tolist()
+        self._ends_list = ends.tolist()
+        self.operators = operators
+        self.regions = regions
+        self.inns = inns
+        self.drct_ids = drct_ids
+        self.version = version
+        self.built_at = time.time()
+
+    @classmethod
+    def from_registry(cls, df: pd.DataFrame, directory: Optional[Dict[str, int]] = None,
+                      version: int = 0) -> 'RegistryIndex':
+        """
+        Строит индекс по реестру.
+
+        Параметры:
+        df (pd.DataFrame): Реестр (см. handlers.load_registry).
+        directory (Optional[Dict[str, int]]): Справочник регионов NAME_CSV -> DRCT_DRCT_ID.
+        version (int): Номер версии индекса.
+
+        Возвращает:
+        RegistryIndex: Индекс.
+        """
+        directory = directory or {}
+        starts, ends, order = registry_keys(df)
+        rows = df.iloc[order]
+        regions = tuple(_text(region) for region in rows['Регион'])
+        return cls(starts, ends,
+                   operators=tuple(_text(operator) for operator in rows['Оператор']),
+                   regions=regions,
+                   inns=tuple(_text(inn) for inn in rows['ИНН']),
+                   drct_ids=tuple(directory.get(region) for region in regions),
+                   version=version)
+
+    def __len__(self) -> int:
+        return len(self._starts_list)
+
+    def _result(self, msisdn: str, position: int) -> LookupResult:
+        return LookupResult(msisdn, self.operators[position], self.regions[position], self.inns[position],
+                            self.drct_ids[position])
+
+    def lookup(self, msisdn: str) -> Optional[LookupResult]:
+        """
+        Находит диапазон реестра для номера.
+
+        Параметры:
+        msisdn (str): Десятизначный номер.
+
+        Возвращает:
+        Optional[LookupResult]: Результат или None, если номер не входит ни в один диапазон.
+        """
+        if not is_msisdn(msisdn):
+            return None
+        key = int(msisdn)
+        position = bisect.bisect_right(self._starts_list, key) - 1
+        if position < 0 or key > self._ends_list[position]:
+            return None
+        return self._result(msisdn, position)
+
+    def lookup_many(self, msisdns: Iterable[str]) -> List[Optional[LookupResult]]:
+        """
+        Находит диапазоны реестра для массива номеров за один векторный проход.
+
+        Параметры:
+        msisdns (Iterable[str]): Десятизначные номера.
+
+        Возвращает:
+        List[Optional[LookupResult]]: Результаты в порядке номеров (None для ненайденных).
+        """
+        msisdns = list(msisdns)
+        valid = np.array([is_msisdn(msisdn) for msisdn in msisdns], dtype=bool)
+        keys = np.array([int(msisdn) if ok else -1 for msisdn, ok in zip(msisdns, valid)], dtype=np.int64)
+        positions = np.searchsorted(self.starts, keys, side='right') - 1
+        found = valid & (positions >= 0)
+        found[found] = keys[found] <= self.ends[positions[found]]
+        return [self._result(msisdn, position) if ok else None
+                for msisdn, position, ok in zip(msisdns, positions.tolist(), found.tolist())]
+
+
+class LookupService:
+    """
+    Сервис поиска оператора, региона, ИНН и DRCT_DRCT_ID по номеру.
+
+    Запросы читают текущий индекс по ссылке, загрузка нового реестра строит
+    новый индекс и подменяет ссылку одним присваиванием. Запрос, начавшийся
+    до подмены, дорабатывает со старым индексом, поэтому ответ никогда не
+    строится по частично загруженному реестру.
+    """
+
+    def __init__(self, file_paths: List[str], directory_loader: Optional[Callable[[], List[Tuple]]] = None) -> None:
+        """
+        Параметры:
+        file_paths (List[str]): Файлы реестра.
+        directory_loader (Optional[Callable[[], List[Tuple]]]): Функция чтения справочника регионов
+        [(NAME_CSV, DRCT_DRCT_ID), ...]. None - DRCT_DRCT_ID не определяется.
+        """
+        self.file_paths = file_paths
+        self.directory_loader = directory_loader
+        self._index: Optional[RegistryIndex] = None
+        self._load_lock = threading.Lock()
+        self._file_state: Optional[Tuple[Tuple[str, int, int], ...]] = None
+
+    @property
+    def index(self) -> RegistryIndex:
+        """
+        Текущий индекс.
+
+        Raises:
+        RuntimeError: Если реестр еще не загружен.
+        """
+        index = self._index
+        if index is None:
+            raise RuntimeError("Реестр не загружен")
+        return index
+
+    def swap(self, index: RegistryIndex) -> None:
+        """
+        Подменяет текущий индекс.
+
+        Параметры:
+        index (RegistryIndex): Новый индекс.
+        """
+        self._index = index
+        metrics.set_gauge('lookup_index_ranges', len(index))
+        metrics.set_gauge('lookup_index_version', index.version)
+        logging.info(f"Индекс реестра версии {index.version} подключен: {len(index)} диапазонов")
+
+    def _stat_files(self) -> Tuple[Tuple[str, int, int], ...]:
+        return tuple((file_path, stat.st_size, stat.st_mtime_ns)
+                     for file_path, stat in ((file_path, os.stat(file_path)) for file_path in self.file_paths))
+
+    def reload(self) -> bool:
+        """
+        Перечитывает реестр и справочник регионов и подменяет индекс.
+
+        Если загрузка не удалась, продолжает работать прежний индекс.
+
+        Возвращает:
+        bool: True, если индекс подменен.
+        """
+        with self._load_lock:
+            started = time.perf_counter()
+            try:
+                file_state = self._stat_files()
+                df = load_registry(self.file_paths)
+                directory = {}
+                if self.directory_loader:
+                    for name_csv, drct_id in self.directory_loader():
+                        directory.setdefault(name_csv, drct_id)
+                version = self._index.version + 1 if self._index is not None else 1
+                index = RegistryIndex.from_registry(df, directory, version)
+            except (Exception, SystemExit) as e:
+                logging.error(f"Не удалось загрузить реестр для сервиса поиска: {e!r}")
+                metrics.count('lookup_reload_errors')
+                return False
+            self._file_state = file_state
+            self.swap(index)
+            logging.info(f"Реестр для сервиса поиска загружен за {time.perf_counter() - started:.3f} с")
+            return True
+
+    def reload_if_changed(self) -> bool:
+        """
+        Перечитывает реестр, если размер или время изменения файлов реестра изменились.
+
+        Возвращает:
+        bool: True, если индекс подменен.
+        """
+        try:
+            if self._stat_files() == self._file_state:
+                return False
+        except OSError as e:
+            logging.warning(f"Файлы реестра недоступны: {e}")
+            return False
+        return self.reload()
+
+    def lookup(self, msisdn: str) -> Optional[LookupResult]:
+        """
+        Находит оператора, регион, ИНН и DRCT_DRCT_ID номера.
+
+        Параметры:
+        msisdn (str): Десятизначный номер.
+
+        Возвращает:
+        Optional[LookupResult]: Результат или None, если номер не найден.
+        """
+        return self.index.lookup(msisdn)
+
+    def lookup_many(self, msisdns: Iterable[str]) -> List[Optional[LookupResult]]:
+        """
+        Находит оператора, регион, ИНН и DRCT_DRCT_ID для массива номеров.
+
+        Параметры:
+        msisdns (Iterable[str]): Десятизначные номера.
+
+        Возвращает:
+        List[Optional[LookupResult]]: Результаты в порядке номеров (None для ненайденных).
+        """
+        return self.index.lookup_many(msisdns)
+
+    def status(self) -> dict:
+        """
+        Возвращает состояние сервиса: версию индекса, количество диапазонов и время построения.
+        """
+        index = self._index
+        if index is None:
+            return {'ready': False}
+        return {'ready': True, 'version': index.version, 'ranges': len(index), 'built_at': index.built_at}
+
+
+class LookupRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP интерфейс сервиса поиска.
+
+    GET /lookup?msisdn=9000000000 - поиск одного номера (404, если номер не найден),
+    POST /lookup с телом {"msisdns": [...]} - пакетный поиск,
+    номер не из десяти цифр 0-9 - 400.
+    GET /status - состояние сервиса, POST /reload - перечитать реестр.
+    """
+
+    service: LookupService = None
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self) -> str:
+        # У подключений через Unix-сокет нет адреса клиента
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        try:
+            if url.path == '/status':
+                self.send_json(200, self.service.status())
+            elif url.path == '/lookup':
+                msisdn = parse_qs(url.query).get('msisdn', [''])[0]
+                if not is_msisdn(msisdn):
+                    self.send_json(400, {'msisdn': msisdn, 'error': 'expected a 10-digit msisdn'})
+                    return
+                metrics.count('lookup_requests')
+                result = self.service.lookup(msisdn)
+                if result is None:
+                    self.send_json(404, {'msisdn': msisdn, 'error': 'not found'})
+                else:
+                    self.send_json(200, result.to_dict())
+            else:
+                self.send_json(404, {'error': 'unknown path'})
+        except RuntimeError as e:
+            self.send_json(503, {'error': str(e)})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        try:
+            if url.path == '/reload':
+                self.send_json(200 if self.service.reload() else 500, self.service.status())
+            elif url.path == '/lookup':
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    self.send_json(400, {'error': 'invalid Content-Length'})
+                    self.close_connection = True
+                    return
+                if length > MAX_BODY_SIZE:
+                    # Тело не читается, поэтому соединение дальше использовать нельзя
+                    self.send_json(413, {'error': f'request body exceeds {MAX_BODY_SIZE} bytes'})
+                    self.close_connection = True
+                    return
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    body = None
+                msisdns = body.get('msisdns') if isinstance(body, dict) else None
+                if not isinstance(msisdns, list) or not all(isinstance(msisdn, str) for msisdn in msisdns):
+                    self.send_json(400, {'error': 'expected {"msisdns": ["9000000000", ...]}'})
+                    return
+                if len(msisdns) > MAX_BATCH_SIZE:
+                    self.send_json(413, {'error': f'no more than {MAX_BATCH_SIZE} msisdns per request'})
+                    return
+                invalid = next((msisdn for msisdn in msisdns if not is_msisdn(msisdn)), None)
+                if invalid is not None:
+                    self.send_json(400, {'msisdn': invalid, 'error': 'expected a 10-digit msisdn'})
+                    return
+                metrics.count('lookup_requests')
+                metrics.count('lookup_batch_msisdns', len(msisdns))
+                results = self.service.lookup_many(msisdns)
+                self.send_json(200, {'results': [result.to_dict() if result else None for result in results]})
+            else:
+                self.send_json(404, {'error': 'unknown path'})
+        except RuntimeError as e:
+            self.send_json(503, {'error': str(e)})
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    """
+    HTTP сервер на Unix-сокете (curl --unix-socket <путь> http://localhost/lookup?msisdn=...).
+    """
+
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def make_handler(service: LookupService) -> type:
+    """
+    Создает класс обработчика HTTP запросов, привязанный к сервису.
+
+    Параметры:
+    service (LookupService): Сервис поиска.
+
+    Возвращает:
+    type: Подкласс LookupRequestHandler.
+    """
+    return type('BoundLookupRequestHandler', (LookupRequestHandler,), {'service': service})
+
+
+def start_servers(service: LookupService, host: Optional[str], port: int,
+                  socket_path: Optional[str]) -> List[socketserver.BaseServer]:
+    """
+    Запускает HTTP сервер на TCP порту и (или) на Unix-сокете в фоновых потоках.
+
+    Параметры:
+    service (LookupService): Сервис поиска.
+    host (Optional[str]): Адрес TCP сервера. Пустое значение - TCP сервер не запускается.
+    port (int): Порт TCP сервера (0 - любой свободный).
+    socket_path (Optional[str]): Путь к Unix-сокету. Пустое значение - сервер на сокете не запускается.
+
+    Возвращает:
+    List[socketserver.BaseServer]: Запущенные серверы.
+    """
+    handler = make_handler(service)
+    servers = []
+    if host:
+        servers.append(ThreadingHTTPServer((host, port), handler))
+    if socket_path:
+        servers.append(UnixHTTPServer(socket_path, handler))
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info(f"Сервис поиска принимает запросы на {server.server_address}")
+    return servers
+
+
+def serve() -> None:
+    """
+    Запускает сервис поиска с настройками LOOKUP_REGISTRY_FILES, LOOKUP_HOST, LOOKUP_PORT,
+    LOOKUP_SOCKET и LOOKUP_RELOAD_INTERVAL до получения SIGINT/SIGTERM.
+
+    Справочник регионов читается из хранилища DB_BACKEND, если LOOKUP_DRCT_IDS=True.
+    Файлы реестра проверяются каждые LOOKUP_RELOAD_INTERVAL секунд, при их
+    изменении индекс перестраивается и подменяется без остановки сервиса.
+    """
+    import signal
+    import storage
+
+    directory_loader = None
+    if config('LOOKUP_DRCT_IDS', default=True, cast=bool):
+        directory_loader = storage.get_backend().get_all_drct_ids
+    servers = []
+    try:
+        service = LookupService(config('LOOKUP_REGISTRY_FILES', default='DEF-9xx.csv', cast=Csv()), directory_loader)
+        if not service.reload():
+            logging.error("Сервис поиска не запущен: реестр не загружен")
+            print("Сервис поиска не запущен: реестр не загружен")
+            return
+
+        servers = start_servers(service, config('LOOKUP_HOST', default='127.0.0.1'),
+                                config('LOOKUP_PORT', default=8080, cast=int), config('LOOKUP_SOCKET', default=''))
+        stop_event = threading.Event()
+        signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+        signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+        reload_interval = config('LOOKUP_RELOAD_INTERVAL', default=60, cast=float)
+        while not stop_event.wait(reload_interval):
+            service.reload_if_changed()
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+        # Пул подключений Oracle или файл SQLite справочника регионов
+        storage.close_backend()
+        logging.info("Сервис поиска остановлен")
@@ -1,11 +1,14 @@
 import os
-import urllib.request
+import argparse
 import logging
 from datetime import datetime
-from decouple import config
-import db
-import git_upload
-from handlers import handle_data
+from decouple import config, Csv, UndefinedValueError
+import downloader
+import metrics
+from pipeline import ask, configure_proxy, download_files, export_metrics, push_to_git, registry_files
+
+# Модули storage, handlers и git_upload (а с ними oracledb, pandas и GitPython)
+# импортируются только командами, которым они нужны
 
 def setup_logging(log_folder):
     """
@@ -23,142 +26,151 @@ def setup_logging(log_folder):
     log_file_path = os.path.join(log_folder, f"prf{log_file_name}.log")
     logging.basicConfig(filename=log_file_path, level=logging.INFO, format='%(asctime)s - %(message)s')
 
-def download_file(file_url):
+def download_registry(file_urls, local_file_path=None):
     """
-    Скачивание файла по указанной прямой ссылке.
+    Скачивание файлов реестра. Для файла, который не удалось скачать, используется
+    предыдущая версия или локальная копия (см. pipeline.registry_files).
 
     Параметры:
-    file_url (str): Прямая ссылка на файл.
+    file_urls (list): Список прямых ссылок на файлы.
+    local_file_path (str): Путь к папке или файлу с локальными копиями реестра.
 
     Возвращает:
-    str: Имя скачанного файла, если загрузка успешна, иначе None.
+    list: Файлы реестра для обработки или None, если обработка не требуется или невозможна.
     """
-    try:
-        file_name = os.path.basename(urllib.parse.urlparse(file_url).path)
-
-        with urllib.request.urlopen(file_url) as file_response:
-            with open(file_name, "wb") as file:
-                file.write(file_response.read())
-            logging.info(f"Скачан файл: {file_name}")
-            print(f"Скачан файл: {file_name}")
-
-        return file_name
-
-    except urllib.error.URLError as e:
-        if hasattr(e, 'code') and e.code == 404:
-            logging.error(f"Ошибка: Файл не найден по указанному URL. [URLError] {e.reason}")
-            print("Ошибка: Файл не найден по указанному URL.")
-        elif isinstance(e.reason, ConnectionResetError):
-            logging.error(f"Ошибка: Нет подключения к интернету.[URLError] {e.reason}")
-            print("Ошибка: Нет подключения к интернету.")
-        elif 'EOF occurred in violation of protocol' in str(e.reason):
-            logging.error(f"Ошибка: Произошел разрыв соединения SSL. [URLError] {e.reason}")
-            print("Ошибка: Произошел разрыв соединения SSL.")
-        else:
-            logging.error(f"Ошибка: Ошибка сети. Проверьте интернет соединение [URLError] {e.reason}")
-            print(f"Ошибка: {e.reason}")
-    except urllib.error.HTTPError as e:
-        logging.error(f"HTTP ошибка: {e}")
-        print(f"HTTP ошибка: {e}")
-    except Exception as e:
-        logging.error(f"Ошибка при выполнении запроса: {e}")
-        print(f"Ошибка при выполнении запроса: {e}")
-
-    return None
-
-def configure_proxy():
+    with metrics.stage("download") as stage:
+        download_results = download_files(file_urls)
+        stage.rows = sum(1 for result in download_results if result)
+    metrics.count("download_bytes", sum(result.size for result in download_results if result))
+    file_names = registry_files(file_urls, download_results, local_file_path)
+    if file_names is None:
+        return None
+    # Файл, не изменившийся на сервере, обрабатывается повторно, если прошлая обработка не завершилась успешно
+    if (all(not result or result.status == downloader.NOT_MODIFIED for result in download_results)
+            and all(downloader.is_processed(file_name) for file_name in file_names)):
+        logging.info("Реестр не изменился, обработка не требуется")
+        print("Реестр не изменился, обработка не требуется.")
+        return None
+    return file_names
+
+def process_registry(file_names):
+    """
+    Загрузка файлов реестра в базу данных и построение префиксов.
+
+    Параметры:
+    file_names (list): Файлы реестра.
+
+    Возвращает:
+    bool: True, если префиксы построены и переданы в базу данных.
     """
-    Настройка прокси для urllib на основе конфигурации в .env файле, с учетом логина и пароля.
+    import storage
+    from csv_scanner import is_safe_csv_file
+    from handlers import handle_data
+
+    with metrics.stage("safety_scan") as stage:
+        safe = all(is_safe_csv_file(file_name) for file_name in file_names)
+        stage.rows = len(file_names)
+    if safe:
+        try:
+            if not storage.get_backend().load_teasr_def(file_names):
+                logging.error("Не удалось загрузить реестр в TEASR_DEF, построение префиксов отменено")
+                print("Не удалось загрузить реестр в TEASR_DEF, построение префиксов отменено")
+                return False
+            return handle_data(file_names)
+        except Exception as e:
+            logging.error(f"Ошибка при работе с базой данных: {e}")
+            print(f"Ошибка при работе с базой данных: {e}")
+        finally:
+            storage.close_backend()
+    else:
+        logging.error("CSV файл не прошел проверку на безопасность.")
+        print("CSV файл не прошел проверку на безопасность.")
+    return False
+
+def parse_args(argv=None):
+    """
+    Разбор аргументов командной строки.
+
+    Параметры:
+    argv (list): Аргументы командной строки. По умолчанию sys.argv[1:].
+
+    Возвращает:
+    argparse.Namespace: Аргументы, command - выбранная команда ('run' по умолчанию).
     """
-    use_proxy = config("USE_PROXY", default=False, cast=bool)
-    if use_proxy:
-        proxy_url = config("PROXY_URL", default="")
-        proxy_username = config("PROXY_USERNAME", default="")
-        proxy_password = config("PROXY_PASSWORD", default="")
-
-        if proxy_url:
-            try:
-                if proxy_username and proxy_password:
-                    proxy_handler = urllib.request.ProxyHandler({
-                        "http": f"http://{proxy_username}:{proxy_password}@{proxy_url}",
-                        "https": f"https://{proxy_username}:{proxy_password}@{proxy_url}",
-                    })
-                else:
-                    proxy_handler = urllib.request.ProxyHandler({
-                        "http": proxy_url,
-                        "https": proxy_url,
-                    })
-                opener = urllib.request.build_opener(proxy_handler)
-                urllib.request.install_opener(opener)
-                logging.info("Прокси настроен")
-            except Exception as e:
-                logging.error("Ошибка: Некорректные данные прокси.")
-                print("Ошибка: Некорректные данные прокси.")
-        else:
-            logging.error("Ошибка: URL прокси не указан в конфигурации.")
-            print("Ошибка: URL прокси не указан в конфигурации.")
-
-def main():
+    parser = argparse.ArgumentParser(description="Скачивание реестра, построение префиксов и отправка файла в Git.")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("run", help="Полный цикл: скачивание, загрузка в базу данных, построение префиксов, отправка в Git")
+    subparsers.add_parser("download", help="Только скачивание файлов реестра")
+    subparsers.add_parser("push", help="Только отправка файла FILE_FOR_PUSH_NAME в Git")
+    subparsers.add_parser("watch", help="Фоновый режим: опрос реестра каждые POLL_INTERVAL секунд без вопросов")
+    subparsers.add_parser("serve", help="Сервис поиска оператора и региона по номеру (HTTP и Unix-сокет)")
+    args = parser.parse_args(argv)
+    args.command = args.command or "run"
+    return args
+
+def main(argv=None):
     """
     Основная функция для выполнения сценария скачивания файла и записи логов.
 
-    Действия:
+    Команды:
+    run (по умолчанию) - полный цикл, download - только скачивание, push - только отправка в Git,
+    watch - фоновый режим (см. daemon.WatchDaemon), serve - сервис поиска по номеру (см. lookup.LookupService).
+
+    Действия команды run:
     1. Читает настройки из конфигурационного файла.
     2. Настраивает логирование.
     3. Настраивает прокси, если включен.
-    4. Скачивает файл по указанной прямой ссылке.
-    5. Если файл скачан, создает временную таблицу в базе данных.
-    6. Загружает данные из CSV файла в базу данных.
+    4. Параллельно скачивает файлы реестра по указанным прямым ссылкам. Если ни один файл не изменился, завершает работу.
+    5. Если файлы скачаны, создает временную таблицу в базе данных.
+    6. Загружает данные из CSV файлов в базу данных.
     7. Выводит сообщение о завершении загрузки.
+
+    Параметры:
+    argv (list): Аргументы командной строки. По умолчанию sys.argv[1:].
     """
+    command = parse_args(argv).command
     try:
-        file_url = config("FILE_URL")
         log_folder = config("LOG_FOLDER")
-        local_file_path = config("LOCAL_FILE_PATH", default=None)
-    except KeyError as e:
+        if command not in ("push", "serve"):
+            file_urls = config("FILE_URLS", default="", cast=Csv()) or [config("FILE_URL")]
+            local_file_path = config("LOCAL_FILE_PATH", default=None)
+    except UndefinedValueError as e:
         logging.error(f"Ошибка конфигурации: отсутствует параметр {e}")
         print(f"Ошибка конфигурации: отсутствует параметр {e}")
         return
 
-    db.set_cfg_ora_clnt()
     setup_logging(log_folder)
     configure_proxy()
-    file_name = download_file(file_url)
-
-    if not file_name and local_file_path:
-        user_input = input("Не удалось скачать файл. Хотите использовать локальный файл? (y/n): ").strip().lower()
-        if user_input in ('y', 'yes'):
-            if os.path.exists(local_file_path):
-                file_name = local_file_path
-                logging.info(f"Используется локальный файл: {file_name}")
-                print(f"Используется локальный файл: {file_name}")
-            else:
-                logging.error(f"Ошибка: Локальный файл не найден: {local_file_path}")
-                print(f"Ошибка: Локальный файл не найден: {local_file_path}")
-                return
-
-    if file_name:
-        if db.is_safe_csv_file(file_name):
-            try:
-                db.create_temp_table()
-                db.insert_csv_standart_data(file_name)
-                handle_data()
-            except Exception as e:
-                logging.error(f"Ошибка при работе с базой данных: {e}")
-                print(f"Ошибка при работе с базой данных: {e}")
-        else:
-            logging.error("CSV файл не прошел проверку на безопасность.")
-            print("CSV файл не прошел проверку на безопасность.")
-
-    user_input = input("Вы хотите запушить файл в Git? (y/n): ").strip().lower()
-    if user_input in ('y', 'yes'):
-        try:
-            git_upload.upload_to_git_via_ssh()
-        except Exception as e:
-            logging.error(f"Ошибка при загрузке файла в Git: {e}")
-            print(f"Ошибка при загрузке файла в Git: {e}")
+    if command == "watch":
+        from daemon import watch
+        watch(file_urls, local_file_path)
+        return
+    if command == "serve":
+        from lookup import serve
+        serve()
+        return
+
+    metrics.start_run()
+    try:
+        if command == "push":
+            push_to_git()
+            return
+
+        file_names = download_registry(file_urls, local_file_path)
+        if file_names is None or command == "download":
+            return
+
+        if file_names and process_registry(file_names):
+            for file_name in file_names:
+                if file_name != local_file_path:
+                    downloader.mark_processed(file_name)
+
+        if ask("Вы хотите запушить файл в Git? (y/n): ", "GIT_PUSH"):
+            push_to_git()
 
-    print("Загрузка завершена.")
+        print("Загрузка завершена.")
+    finally:
+        export_metrics()
 
 if __name__ == "__main__":
     main()
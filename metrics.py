@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+# Префикс имен метрик в формате Prometheus
+METRIC_PREFIX = 'rtk_prefix'
+
+_lock = threading.Lock()
+_run_started: Optional[float] = None
+_run_started_at: Optional[datetime] = None
+_stages: Dict[str, Dict[str, float]] = {}
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+
+
+class Stage:
+    """
+    Измеряемый этап обработки. Количество обработанных строк задается через rows.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.rows = 0
+
+
+def start_run() -> None:
+    """
+    Начинает новый запуск: сбрасывает длительности и объемы этапов.
+
+    Счетчики (например, обращения к базе данных) накапливаются за все время
+    работы процесса, поэтому не сбрасываются.
+    """
+    global _run_started, _run_started_at
+    with _lock:
+        _run_started = time.perf_counter()
+        _run_started_at = datetime.now()
+        _stages.clear()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Stage]:
+    """
+    Измеряет длительность этапа. Повторные измерения этапа в одном запуске суммируются.
+
+    Параметры:
+    name (str): Имя этапа (download, safety_scan, teasr_def_load, msisdn_fetch, lookup,
+    prefix_generation, insert, git_push и т.д.).
+
+    Возвращает:
+    Iterator[Stage]: Этап, в котором можно задать количество строк.
+    """
+    current = Stage(name)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            values = _stages.setdefault(name, {'duration_seconds': 0.0, 'rows': 0, 'calls': 0})
+            values['duration_seconds'] += elapsed
+            values['rows'] += current.rows
+            values['calls'] += 1
+
+
+def count(name: str, value: float = 1) -> None:
+    """
+    Увеличивает счетчик.
+
+    Параметры:
+    name (str): Имя счетчика.
+    value (float): Величина увеличения.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    """
+    Задает текущее значение показателя.
+
+    Параметры:
+    name (str): Имя показателя.
+    value (float): Значение.
+    """
+    with _lock:
+        _gauges[name] = value
+
+
+def set_hit_ratio(cache: str, hits: float, misses: float) -> None:
+    """
+    Задает долю попаданий кэша.
+
+    Параметры:
+    cache (str): Имя кэша.
+    hits (float): Количество попаданий.
+    misses (float): Количество промахов.
+    """
+    requests = hits + misses
+    set_gauge(f'{cache}_cache_hit_ratio', hits / requests if requests else 0.0)
+
+
+def summary() -> dict:
+    """
+    Возвращает сводку запуска.
+
+    Возвращает:
+    dict: Время начала и длительность запуска, показатели этапов (длительность,
+    строки, строк в секунду, количество измерений), счетчики и показатели.
+    """
+    with _lock:
+        stages = {}
+        for name, values in _stages.items():
+            duration = values['duration_seconds']
+            stages[name] = dict(values, rows_per_second=values['rows'] / duration if duration else 0.0)
+        return {
+            'started_at': _run_started_at.isoformat(timespec='seconds') if _run_started_at else None,
+            'duration_seconds': time.perf_counter() - _run_started if _run_started is not None else 0.0,
+            'stages': stages,
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+        }
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(run: Optional[dict] = None) -> str:
+    """
+    Формирует метрики в текстовом формате Prometheus.
+
+    Параметры:
+    run (Optional[dict]): Сводка запуска (см. summary). По умолчанию текущая.
+
+    Возвращает:
+    str: Текст метрик.
+    """
+    run = run or summary()
+    lines = [
+        f'# HELP {METRIC_PREFIX}_run_duration_seconds Длительность последнего запуска',
+        f'# TYPE {METRIC_PREFIX}_run_duration_seconds gauge',
+        f'{METRIC_PREFIX}_run_duration_seconds {run["duration_seconds"]:.6f}',
+        f'# HELP {METRIC_PREFIX}_last_run_timestamp_seconds Время завершения последнего запуска',
+        f'# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge',
+        f'{METRIC_PREFIX}_last_run_timestamp_seconds {time.time():.0f}',
+    ]
+    stage_metrics = [('duration_seconds', 'Длительность этапа'), ('rows', 'Количество строк, обработанных этапом'),
+                     ('rows_per_second', 'Скорость обработки строк этапом')]
+    for key, description in stage_metrics:
+        lines.append(f'# HELP {METRIC_PREFIX}_stage_{key} {description}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_stage_{key} gauge')
+        for name, values in sorted(run['stages'].items()):
+            lines.append(f'{METRIC_PREFIX}_stage_{key}{{stage="{_label(name)}"}} {values[key]:g}')
+    for name, value in sorted(run['counters'].items()):
+        lines.append(f'# TYPE {METRIC_PREFIX}_{name}_total counter')
+        lines.append(f'{METRIC_PREFIX}_{name}_total {value:g}')
+    for name, value in sorted(run['gauges'].items()):
+        lines.append(f'# TYPE {METRIC_PREFIX}_{name} gauge')
+        lines.append(f'{METRIC_PREFIX}_{name} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def _write_atomic(file_path: str, text: str) -> None:
+    """
+    Записывает файл через временный файл, чтобы читатель не увидел его частично записанным.
+
+    Параметры:
+    file_path (str): Путь к файлу.
+    text (str): Содержимое.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{file_path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(tmp_path, file_path)
+
+
+def export(textfile_path: Optional[str] = None, json_path: Optional[str] = None) -> dict:
+    """
+    Записывает метрики в текстовый файл Prometheus (для node_exporter textfile collector)
+    и сводку запуска в JSON. Пустой путь - файл не записывается.
+
+    Параметры:
+    textfile_path (Optional[str]): Путь к файлу .prom.
+    json_path (Optional[str]): Путь к файлу сводки JSON.
+
+    Возвращает:
+    dict: Сводка запуска.
+    """
+    run = summary()
+    try:
+        if textfile_path:
+            _write_atomic(textfile_path, render_prometheus(run))
+        if json_path:
+            _write_atomic(json_path, json.dumps(run, ensure_ascii=False, indent=2))
+    except OSError as e:
+        logging.error(f'Ошибка при записи метрик: {e}')
+    for name, values in run['stages'].items():
+        logging.info(f"Этап {name}: {values['duration_seconds']:.3f} с, строк {values['rows']:g} "
+                     f"({values['rows_per_second']:.0f} строк/с)")
+    return run
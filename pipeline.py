@@ -0,0 +1,218 @@
+import os
+import urllib.request
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+import downloader
+import metrics
+
+# Общие шаги команд main.py и режима watch (daemon.py)
+
+def url_file_name(file_url):
+    """
+    Имя файла, под которым сохраняется файл реестра по ссылке.
+
+    Параметры:
+    file_url (str): Прямая ссылка на файл.
+
+    Возвращает:
+    str: Имя файла.
+    """
+    return os.path.basename(urllib.parse.urlparse(file_url).path)
+
+def download_file(file_url):
+    """
+    Скачивание файла по указанной прямой ссылке.
+
+    Файл скачивается потоково с докачкой и условным запросом (см. downloader.download).
+
+    Параметры:
+    file_url (str): Прямая ссылка на файл.
+
+    Возвращает:
+    downloader.DownloadResult: Результат скачивания, если загрузка успешна, иначе None.
+    """
+    try:
+        file_name = url_file_name(file_url)
+
+        result = downloader.download(file_url, file_name)
+        if result.status == downloader.NOT_MODIFIED:
+            logging.info(f"Файл не изменился с предыдущего скачивания: {file_name}")
+            print(f"Файл не изменился с предыдущего скачивания: {file_name}")
+        else:
+            logging.info(f"Скачан файл: {file_name}")
+            print(f"Скачан файл: {file_name}")
+
+        return result
+
+    except urllib.error.URLError as e:
+        if hasattr(e, 'code') and e.code == 404:
+            logging.error(f"Ошибка: Файл не найден по указанному URL. [URLError] {e.reason}")
+            print("Ошибка: Файл не найден по указанному URL.")
+        elif isinstance(e.reason, ConnectionResetError):
+            logging.error(f"Ошибка: Нет подключения к интернету.[URLError] {e.reason}")
+            print("Ошибка: Нет подключения к интернету.")
+        elif 'EOF occurred in violation of protocol' in str(e.reason):
+            logging.error(f"Ошибка: Произошел разрыв соединения SSL. [URLError] {e.reason}")
+            print("Ошибка: Произошел разрыв соединения SSL.")
+        else:
+            logging.error(f"Ошибка: Ошибка сети. Проверьте интернет соединение [URLError] {e.reason}")
+            print(f"Ошибка: {e.reason}")
+    except urllib.error.HTTPError as e:
+        logging.error(f"HTTP ошибка: {e}")
+        print(f"HTTP ошибка: {e}")
+    except Exception as e:
+        logging.error(f"Ошибка при выполнении запроса: {e}")
+        print(f"Ошибка при выполнении запроса: {e}")
+
+    return None
+
+def download_files(file_urls):
+    """
+    Параллельное скачивание нескольких файлов реестра.
+
+    Параметры:
+    file_urls (list): Список прямых ссылок на файлы.
+
+    Возвращает:
+    list: Результаты скачивания (downloader.DownloadResult или None) в порядке ссылок.
+    """
+    workers = config("DOWNLOAD_WORKERS", default=4, cast=int)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(file_urls)))) as executor:
+        return list(executor.map(download_file, file_urls))
+
+def local_copy(file_name, local_file_path):
+    """
+    Локальная копия файла реестра из LOCAL_FILE_PATH.
+
+    LOCAL_FILE_PATH - папка с копиями файлов реестра или путь к копии одного
+    файла. Копия подходит только файлу с тем же именем, поэтому один
+    локальный файл не подставляется вместо другого реестра.
+
+    Параметры:
+    file_name (str): Имя файла реестра (см. url_file_name).
+    local_file_path (str): Значение LOCAL_FILE_PATH.
+
+    Возвращает:
+    str: Путь к копии или None, если копии нет.
+    """
+    if not local_file_path:
+        return None
+    if os.path.isdir(local_file_path):
+        path = os.path.join(local_file_path, file_name)
+    elif os.path.basename(local_file_path) == file_name:
+        path = local_file_path
+    else:
+        return None
+    return path if os.path.isfile(path) else None
+
+def registry_files(file_urls, download_results, local_file_path=None, interactive=True):
+    """
+    Файлы реестра для обработки: по одному на каждую ссылку.
+
+    Реестр загружается в TEASR_DEF целиком, поэтому обработка части файлов
+    удалила бы диапазоны нескачанных реестров. Для ссылки, которую не удалось
+    скачать, используется предыдущая скачанная версия файла (скачивание
+    заменяет файл только после полного получения), иначе - копия этого же
+    файла из LOCAL_FILE_PATH (с подтверждения USE_LOCAL_FILE). Если для
+    какой-либо ссылки файла нет, обработка не выполняется.
+
+    Параметры:
+    file_urls (list): Список прямых ссылок на файлы.
+    download_results (list): Результаты download_files в порядке ссылок.
+    local_file_path (str): Путь к папке или файлу с локальными копиями реестра (LOCAL_FILE_PATH).
+    interactive (bool): Запрашивать ли USE_LOCAL_FILE у пользователя, если настройка не задана.
+
+    Возвращает:
+    list: Файлы реестра в порядке ссылок или None, если для какой-либо ссылки файла нет.
+    """
+    file_names = []
+    for file_url, result in zip(file_urls, download_results):
+        if result:
+            file_names.append(result.file_name)
+            continue
+        file_name = url_file_name(file_url)
+        if os.path.isfile(file_name):
+            logging.warning(f"Не удалось скачать {file_url}, используется предыдущая версия файла {file_name}")
+            print(f"Не удалось скачать {file_url}, используется предыдущая версия файла {file_name}")
+            file_names.append(file_name)
+            continue
+        path = local_copy(file_name, local_file_path)
+        if path and ask(f"Не удалось скачать файл {file_name}. Хотите использовать локальный файл {path}? (y/n): ",
+                        "USE_LOCAL_FILE", interactive):
+            logging.info(f"Используется локальный файл: {path}")
+            print(f"Используется локальный файл: {path}")
+            file_names.append(path)
+            continue
+        logging.error(f"Файл {file_name} недоступен: не удалось скачать {file_url}, предыдущей версии и локальной копии нет")
+        print(f"Ошибка: файл {file_name} недоступен, обработка реестра отменена")
+        return None
+    return file_names
+
+def configure_proxy():
+    """
+    Настройка прокси для urllib на основе конфигурации в .env файле, с учетом логина и пароля.
+    """
+    use_proxy = config("USE_PROXY", default=False, cast=bool)
+    if use_proxy:
+        proxy_url = config("PROXY_URL", default="")
+        proxy_username = config("PROXY_USERNAME", default="")
+        proxy_password = config("PROXY_PASSWORD", default="")
+
+        if proxy_url:
+            try:
+                if proxy_username and proxy_password:
+                    proxy_handler = urllib.request.ProxyHandler({
+                        "http": f"http://{proxy_username}:{proxy_password}@{proxy_url}",
+                        "https": f"https://{proxy_username}:{proxy_password}@{proxy_url}",
+                    })
+                else:
+                    proxy_handler = urllib.request.ProxyHandler({
+                        "http": proxy_url,
+                        "https": proxy_url,
+                    })
+                opener = urllib.request.build_opener(proxy_handler)
+                urllib.request.install_opener(opener)
+                logging.info("Прокси настроен")
+            except Exception as e:
+                logging.error("Ошибка: Некорректные данные прокси.")
+                print("Ошибка: Некорректные данные прокси.")
+        else:
+            logging.error("Ошибка: URL прокси не указан в конфигурации.")
+            print("Ошибка: URL прокси не указан в конфигурации.")
+
+def ask(question, setting, interactive=True):
+    """
+    Ответ на вопрос "да/нет": берется из настройки, если она задана, иначе запрашивается у пользователя.
+
+    Параметры:
+    question (str): Текст вопроса.
+    setting (str): Имя настройки с ответом (например, USE_LOCAL_FILE или GIT_PUSH).
+    interactive (bool): Запрашивать ли ответ у пользователя, если настройка не задана.
+
+    Возвращает:
+    bool: True, если ответ положительный.
+    """
+    answer = config(setting, default="")
+    if not answer and interactive:
+        answer = input(question)
+    return answer.strip().lower() in ('y', 'yes', 'true', '1')
+
+def push_to_git():
+    """
+    Отправка файла FILE_FOR_PUSH_NAME в Git.
+    """
+    import git_upload
+
+    try:
+        with metrics.stage("git_push"):
+            git_upload.upload_to_git_via_ssh()
+    except Exception as e:
+        logging.error(f"Ошибка при загрузке файла в Git: {e}")
+        print(f"Ошибка при загрузке файла в Git: {e}")
+
+def export_metrics():
+    """
+    Запись метрик запуска в файлы METRICS_TEXTFILE (формат Prometheus) и METRICS_JSON.
+    """
+    metrics.export(config("METRICS_TEXTFILE", default=""), config("METRICS_JSON", default=""))
@@ -0,0 +1,310 @@
+import logging
+from array import array
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+import metrics
+
+# Виды конфликтов префиксов
+DUPLICATE = 'duplicate'  # такой же префикс уже есть
+COVERED = 'covered'      # префикс покрыт более коротким существующим префиксом
+OVERLAPS = 'overlaps'    # префикс покрывает более длинные существующие префиксы
+
+# Значение узла без данных
+NO_VALUE = -1
+
+
+def is_digits(value: str) -> bool:
+    """
+    Проверяет, что строка непустая и состоит только из цифр 0-9.
+
+    str.isdigit принимает и другие цифры Unicode (например, '²' или '٣'),
+    которые дали бы неверный номер дочернего узла.
+    """
+    return value.isascii() and value.isdigit()
+
+
+class PrefixConflict(NamedTuple):
+    """
+    Конфликт добавляемого префикса с уже добавленным.
+    """
+    kind: str
+    prefix: str
+    existing: str
+
+
+class PrefixTrie:
+    """
+    Десятичное префиксное дерево в массивах.
+
+    Узел i хранит 10 ссылок на дочерние узлы в children[10 * i:10 * i + 10]
+    (0 - нет узла, корень - узел 0), признак конца префикса в terminal и
+    значение префикса (например, DRCT_DRCT_ID) в values. Дерево из миллионов
+    префиксов занимает несколько массивов чисел вместо миллионов объектов
+    Python.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        """
+        Параметры:
+        capacity (int): Начальное количество узлов.
+        """
+        capacity = max(1, capacity)
+        self.children = array('i', bytes(4 * 10 * capacity))
+        self.terminal = bytearray(capacity)
+        self.values = array('q', [NO_VALUE]) * capacity
+        self.nodes = 1
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, prefix: str) -> bool:
+        node = self._find(prefix)
+        return node is not None and bool(self.terminal[node])
+
+    def _new_node(self) -> int:
+        if self.nodes == len(self.terminal):
+            grow = len(self.terminal)
+            self.children.extend(array('i', bytes(4 * 10 * grow)))
+            self.terminal.extend(bytes(grow))
+            self.values.extend(array('q', [NO_VALUE]) * grow)
+        node = self.nodes
+        self.nodes += 1
+        return node
+
+    def _find(self, prefix: str) -> Optional[int]:
+        if not is_digits(prefix):
+            return None
+        children = self.children
+        node = 0
+        for digit in prefix:
+            node = children[10 * node + ord(digit) - 48]
+            if not node:
+                return None
+        return node
+
+    def _first_below(self, node: int, path: str) -> str:
+        """
+        Возвращает первый префикс поддерева узла.
+        """
+        children = self.children
+        while not self.terminal[node]:
+            for digit in range(10):
+                child = children[10 * node + digit]
+                if child:
+                    node = child
+                    path += chr(48 + digit)
+                    break
+        return path
+
+    def insert(self, prefix: str, value: int = NO_VALUE) -> Optional[PrefixConflict]:
+        """
+        Добавляет префикс.
+
+        Дубликат и префикс, покрытый более коротким существующим префиксом,
+        не добавляются. Префикс, покрывающий более длинные существующие
+        префиксы, добавляется, но конфликт возвращается.
+
+        Параметры:
+        prefix (str): Префикс из цифр.
+        value (int): Значение префикса.
+
+        Возвращает:
+        Optional[PrefixConflict]: Конфликт или None, если префикс добавлен без конфликтов.
+
+        Raises:
+        ValueError: Если префикс пустой или содержит не только цифры.
+        """
+        if not is_digits(prefix):
+            raise ValueError(f"Префикс должен состоять из цифр: {prefix!r}")
+        children = self.children
+        node = 0
+        for position, digit in enumerate(prefix):
+            if node and self.terminal[node]:
+                return PrefixConflict(COVERED, prefix, prefix[:position])
+            slot = 10 * node + ord(digit) - 48
+            child = children[slot]
+            if not child:
+                child = self._new_node()
+                children = self.children
+                children[slot] = child
+            node = child
+        if self.terminal[node]:
+            return PrefixConflict(DUPLICATE, prefix, prefix)
+        existing = self._first_below(node, prefix) if any(children[10 * node:10 * node + 10]) else None
+        self.terminal[node] = 1
+        self.values[node] = value
+        self.count += 1
+        return PrefixConflict(OVERLAPS, prefix, existing) if existing else None
+
+    def check(self, prefix: str) -> Optional[PrefixConflict]:
+        """
+        Проверяет префикс на конфликт с добавленными, не изменяя дерево.
+
+        Параметры:
+        prefix (str): Префикс из цифр.
+
+        Возвращает:
+        Optional[PrefixConflict]: Конфликт, который вернул бы insert, или None.
+
+        Raises:
+        ValueError: Если префикс пустой или содержит не только цифры.
+        """
+        if not is_digits(prefix):
+            raise ValueError(f"Префикс должен состоять из цифр: {prefix!r}")
+        children = self.children
+        node = 0
+        for position, digit in enumerate(prefix):
+            if node and self.terminal[node]:
+                return PrefixConflict(COVERED, prefix, prefix[:position])
+            node = children[10 * node + ord(digit) - 48]
+            if not node:
+                return None
+        if self.terminal[node]:
+            return PrefixConflict(DUPLICATE, prefix, prefix)
+        return PrefixConflict(OVERLAPS, prefix, self._first_below(node, prefix))
+
+    def load(self, prefixes: Iterable[str], value: int = NO_VALUE) -> List[PrefixConflict]:
+        """
+        Загружает существующие префиксы.
+
+        Параметры:
+        prefixes (Iterable[str]): Префиксы.
+        value (int): Значение всех загружаемых префиксов.
+
+        Возвращает:
+        List[PrefixConflict]: Конфликты между загруженными префиксами.
+        """
+        conflicts = []
+        for prefix in prefixes:
+            conflict = self.insert(str(prefix), value)
+            if conflict:
+                conflicts.append(conflict)
+        return conflicts
+
+    def longest_match(self, number: str) -> Optional[Tuple[str, int]]:
+        """
+        Находит самый длинный префикс, с которого начинается номер.
+
+        Номер просматривается до первого символа, не являющегося цифрой 0-9.
+
+        Параметры:
+        number (str): Номер или префикс из цифр.
+
+        Возвращает:
+        Optional[Tuple[str, int]]: Префикс и его значение или None, если подходящего префикса нет.
+        """
+        children = self.children
+        terminal = self.terminal
+        node = 0
+        matched = None
+        for position, digit in enumerate(number):
+            code = ord(digit) - 48
+            if not 0 <= code <= 9:
+                break
+            node = children[10 * node + code]
+            if not node:
+                break
+            if terminal[node]:
+                matched = (position + 1, node)
+        if matched is None:
+            return None
+        length, node = matched
+        return number[:length], self.values[node]
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Перебирает префиксы в лексикографическом порядке.
+        """
+        stack = [(0, '')]
+        while stack:
+            node, path = stack.pop()
+            if self.terminal[node] and node:
+                yield path
+            for digit in range(9, -1, -1):
+                child = self.children[10 * node + digit]
+                if child:
+                    stack.append((child, path + chr(48 + digit)))
+
+
+def log_conflicts(conflicts: List[PrefixConflict], source: str, limit: int = 100) -> Dict[str, int]:
+    """
+    Записывает конфликты префиксов в лог и в метрики.
+
+    Параметры:
+    conflicts (List[PrefixConflict]): Конфликты.
+    source (str): Источник префиксов для сообщений в логе.
+    limit (int): Наибольшее количество конфликтов, выводимых по одному.
+
+    Возвращает:
+    Dict[str, int]: Количество конфликтов по видам.
+    """
+    counts: Dict[str, int] = {}
+    for conflict in conflicts:
+        counts[conflict.kind] = counts.get(conflict.kind, 0) + 1
+    for conflict in conflicts[:limit]:
+        logging.warning(f"Префикс {conflict.prefix} ({source}): {conflict.kind}, существующий префикс {conflict.existing}")
+    for kind, count in counts.items():
+        metrics.count(f'prefix_conflicts_{kind}', count)
+    if conflicts:
+        logging.warning(f"Конфликтов префиксов ({source}): {counts}")
+    return counts
+
+
+def validate_prefix_file(file_path: str, output_format: str = 'csv') -> List[PrefixConflict]:
+    """
+    Проверяет, что префиксы файла выгрузки не повторяются и не перекрывают друг друга.
+
+    Префиксы MERGE и DELETE проверяются по отдельности.
+
+    Параметры:
+    file_path (str): Путь к файлу, записанному writers.write_records.
+    output_format (str): Формат файла (см. writers.FORMATS).
+
+    Возвращает:
+    List[PrefixConflict]: Найденные конфликты.
+    """
+    from writers import read_prefix_actions
+
+    tries: Dict[str, PrefixTrie] = {}
+    conflicts = []
+    rows = 0
+    for prefix, action in read_prefix_actions(file_path, output_format):
+        trie = tries.setdefault(action, PrefixTrie())
+        conflict = trie.insert(str(prefix))
+        if conflict:
+            conflicts.append(conflict)
+        rows += 1
+    logging.info(f"Проверено префиксов в файле {file_path}: {rows}, конфликтов {len(conflicts)}")
+    return conflicts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Проверяет файлы выгрузки префиксов.
+
+    Параметры:
+    argv (Optional[List[str]]): Аргументы командной строки.
+
+    Возвращает:
+    int: 0, если конфликтов нет, иначе 1.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Проверка файла префиксов на повторы и перекрытия.")
+    parser.add_argument("files", nargs="+", help="файлы, записанные write_records")
+    parser.add_argument("--format", default="csv", help="формат файлов: csv, csv.gz, csv.zst, parquet")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    failed = False
+    for file_path in args.files:
+        conflicts = validate_prefix_file(file_path, args.format)
+        counts = log_conflicts(conflicts, f'файл {file_path}')
+        print(f"{file_path}: конфликтов {len(conflicts)} {counts if counts else ''}".rstrip())
+        failed = failed or bool(conflicts)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
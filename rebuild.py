@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import logging
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+import pandas as pd
+from decouple import config
+import metrics
+from tables import shard_rows_by_code
+from handlers import load_registry, log_prefix_report, range_to_prefixes, verify_prefixes
+
+# Количество частей на один процесс: мелкие части выравнивают загрузку процессов
+SHARDS_PER_WORKER = 4
+
+
+class ShardTiming(NamedTuple):
+    """
+    Результат обработки одной части реестра.
+    """
+    shard: int
+    codes: int
+    rows: int
+    prefixes: int
+    seconds: float
+    pid: int
+
+
+class RebuildResult(NamedTuple):
+    """
+    Результат полного построения префиксов.
+    """
+    prefixes: List[List[int]]
+    timings: List[ShardTiming]
+    seconds: float
+    workers: int
+
+
+def registry_rows(df: pd.DataFrame) -> List[Tuple[str, int, str, str]]:
+    """
+    Переводит реестр в компактные кортежи для передачи в процессы.
+
+    Вместо строк pandas (pd.Series) передаются кортежи из строк и чисел,
+    которые сериализуются в несколько раз быстрее и компактнее.
+
+    Параметры:
+    df (pd.DataFrame): Реестр.
+
+    Возвращает:
+    List[Tuple[str, int, str, str]]: Кортежи (код, позиция строки в реестре, От, До).
+    """
+    codes = df['АВС/ DEF'].astype(str).tolist()
+    return list(zip(codes, range(len(df)), df['От'].tolist(), df['До'].tolist()))
+
+
+def build_shard(shard: int, rows: List[Tuple[str, int, str, str]]) -> Tuple[array, array, array, ShardTiming]:
+    """
+    Строит префиксы строк одной части реестра (выполняется в дочернем процессе).
+
+    Префиксы возвращаются плоским массивом с количеством префиксов каждой
+    строки: array передается между процессами одним блоком памяти.
+
+    Параметры:
+    shard (int): Номер части.
+    rows (List[Tuple[str, int, str, str]]): Строки части (см. registry_rows).
+
+    Возвращает:
+    Tuple[array, array, array, ShardTiming]: Позиции строк, количество префиксов строк,
+    префиксы подряд и время обработки части.
+    """
+    started = time.perf_counter()
+    positions = array('q')
+    counts = array('q')
+    prefixes = array('q')
+    for code, position, low, high in rows:
+        row_prefixes = range_to_prefixes(code, low, high)
+        positions.append(position)
+        counts.append(len(row_prefixes))
+        prefixes.extend(row_prefixes)
+    timing = ShardTiming(shard, len({row[0] for row in rows}), len(rows), len(prefixes),
+                         time.perf_counter() - started, os.getpid())
+    return positions, counts, prefixes, timing
+
+
+def rebuild_prefixes(df: pd.DataFrame, workers: Optional[int] = None, shards: Optional[int] = None) -> RebuildResult:
+    """
+    Строит префиксы для всех строк реестра в нескольких процессах.
+
+    Строки распределяются по частям по коду АВС/DEF (shard_rows_by_code),
+    части обрабатываются в ProcessPoolExecutor, результаты собираются в
+    порядке строк реестра независимо от порядка завершения частей.
+
+    Параметры:
+    df (pd.DataFrame): Реестр.
+    workers (Optional[int]): Количество процессов. По умолчанию REBUILD_WORKERS или число ядер.
+    1 - построение в текущем процессе.
+    shards (Optional[int]): Количество частей. По умолчанию workers * SHARDS_PER_WORKER.
+
+    Возвращает:
+    RebuildResult: Префиксы каждой строки в порядке реестра, время обработки частей,
+    общее время и количество процессов.
+    """
+    workers = workers or config('REBUILD_WORKERS', default=os.cpu_count() or 1, cast=int)
+    started = time.perf_counter()
+    parts = shard_rows_by_code(registry_rows(df), shards or workers * SHARDS_PER_WORKER)
+    if workers == 1:
+        results = [build_shard(shard, rows) for shard, rows in enumerate(parts)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(build_shard, range(len(parts)), parts))
+
+    prefixes: List[List[int]] = [[] for _ in range(len(df))]
+    timings = []
+    for positions, counts, flat, timing in results:
+        offset = 0
+        for position, count in zip(positions, counts):
+            prefixes[position] = flat[offset:offset + count].tolist()
+            offset += count
+        timings.append(timing)
+    return RebuildResult(prefixes, timings, time.perf_counter() - started, workers)
+
+
+def log_rebuild_report(result: RebuildResult) -> None:
+    """
+    Записывает в лог время обработки частей и итоговую скорость построения.
+
+    Параметры:
+    result (RebuildResult): Результат построения.
+    """
+    for timing in result.timings:
+        logging.info(f"Часть {timing.shard} (процесс {timing.pid}): кодов {timing.codes}, строк {timing.rows}, "
+                     f"префиксов {timing.prefixes}, {timing.seconds:.3f} с")
+    busy = sum(timing.seconds for timing in result.timings)
+    rows = sum(timing.rows for timing in result.timings)
+    efficiency = busy / (result.seconds * result.workers) if result.seconds else 0.0
+    metrics.set_gauge('rebuild_parallel_efficiency', efficiency)
+    logging.info(f"Построение префиксов: строк {rows} за {result.seconds:.3f} с "
+                 f"({rows / result.seconds if result.seconds else 0:.0f} строк/с), процессов {result.workers}, "
+                 f"частей {len(result.timings)}, загрузка процессов {efficiency:.0%}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Полное построение префиксов для файлов реестра.
+
+    Параметры:
+    argv (Optional[List[str]]): Аргументы командной строки.
+
+    Возвращает:
+    int: 0, если все префиксы прошли проверку покрытия, иначе 1.
+    """
+    parser = argparse.ArgumentParser(description="Полное построение префиксов реестра в нескольких процессах.")
+    parser.add_argument("files", nargs="+", help="файлы реестра")
+    parser.add_argument("--workers", type=int, default=None, help="количество процессов (по умолчанию REBUILD_WORKERS)")
+    parser.add_argument("--shards", type=int, default=None, help="количество частей реестра")
+    parser.add_argument("--output", default=None, help="файл префиксов (по одному в строке, в порядке реестра)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    df = load_registry(args.files)
+    with metrics.stage('prefix_rebuild') as stage:
+        result = rebuild_prefixes(df, args.workers, args.shards)
+        stage.rows = len(df)
+    log_rebuild_report(result)
+    for timing in result.timings:
+        print(f"Часть {timing.shard:3d}: строк {timing.rows:8d}, префиксов {timing.prefixes:9d}, {timing.seconds:.3f} с")
+    print(f"Итого: {len(df)} строк за {result.seconds:.3f} с, процессов {result.workers}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            for row_prefixes in result.prefixes:
+                file.writelines(f'{prefix}\n' for prefix in row_prefixes)
+    return 0 if log_prefix_report(verify_prefixes(df, result.prefixes)) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+import os
+import json
+import shutil
+import logging
+import time
+from typing import Optional
+import numpy as np
+import pandas as pd
+import metrics
+from csv_scanner import file_digest
+
+# Версия формата кэша; при изменении формата старые кэши перестраиваются
+CACHE_VERSION = 1
+
+# Файл описания кэша
+MANIFEST_FILE = 'manifest.json'
+
+
+def cache_dir_for(file_path: str) -> str:
+    """
+    Возвращает папку кэша для файла реестра (рядом с исходным файлом).
+
+    Параметры:
+    file_path (str): Путь к CSV файлу реестра.
+
+    Возвращает:
+    str: Путь к папке кэша.
+    """
+    return f'{file_path}.cache'
+
+
+def parse_registry_file(file_path: str) -> pd.DataFrame:
+    """
+    Читает CSV файл реестра и сортирует его по коду и началу диапазона.
+
+    Параметры:
+    file_path (str): Путь к CSV файлу реестра.
+
+    Возвращает:
+    pd.DataFrame: Реестр.
+    """
+    df = pd.read_csv(file_path, delimiter=';', dtype={'От': str, 'До': str})
+    return df.sort_values(by=['АВС/ DEF', 'От'], kind='stable', ignore_index=True)
+
+
+def _read_manifest(cache_dir: str) -> dict:
+    """
+    Читает описание кэша.
+
+    Параметры:
+    cache_dir (str): Папка кэша.
+
+    Возвращает:
+    dict: Описание кэша или пустой словарь, если его нет или оно повреждено.
+    """
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_FILE), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(cache_dir: str, manifest: dict) -> None:
+    """
+    Записывает описание кэша через временный файл.
+
+    Параметры:
+    cache_dir (str): Папка кэша.
+    manifest (dict): Описание кэша.
+    """
+    with open(os.path.join(cache_dir, f'{MANIFEST_FILE}.tmp'), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False)
+    os.replace(os.path.join(cache_dir, f'{MANIFEST_FILE}.tmp'), os.path.join(cache_dir, MANIFEST_FILE))
+
+
+def _is_valid(manifest: dict, file_path: str, cache_dir: str) -> bool:
+    """
+    Проверяет, что кэш построен по текущему содержимому файла.
+
+    Если размер и время изменения файла совпадают с сохраненными, хэш не
+    пересчитывается. Иначе сравнивается SHA-256 содержимого; при совпадении
+    в описании кэша обновляются размер и время изменения, чтобы следующая
+    проверка снова обошлась без хэша (например, после повторного скачивания
+    того же файла).
+
+    Параметры:
+    manifest (dict): Описание кэша.
+    file_path (str): Путь к CSV файлу реестра.
+    cache_dir (str): Папка кэша.
+
+    Возвращает:
+    bool: True, если кэш можно использовать.
+    """
+    if manifest.get('version') != CACHE_VERSION:
+        return False
+    stat = os.stat(file_path)
+    if manifest.get('size') == stat.st_size and manifest.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    if manifest.get('sha256') != file_digest(file_path):
+        return False
+    try:
+        _write_manifest(cache_dir, dict(manifest, size=stat.st_size, mtime_ns=stat.st_mtime_ns))
+    except OSError as e:
+        logging.warning(f'Не удалось обновить описание кэша {cache_dir}: {e}')
+    return True
+
+
+def save_registry_cache(file_path: str, df: pd.DataFrame) -> None:
+    """
+    Сохраняет разобранный реестр в папку кэша: по файлу .npy на столбец.
+
+    Реестр сохраняется в порядке parse_registry_file (по коду и началу
+    диапазона), поэтому после загрузки из кэша не сортируется повторно.
+    Строковые столбцы сохраняются массивами фиксированной ширины с маской
+    пустых значений. Описание кэша записывается последним, поэтому
+    прерванная запись не приводит к использованию неполного кэша.
+
+    Параметры:
+    file_path (str): Путь к CSV файлу реестра.
+    df (pd.DataFrame): Разобранный реестр.
+    """
+    cache_dir = cache_dir_for(file_path)
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.makedirs(cache_dir)
+
+    columns = []
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        if values.dtype == object:
+            missing = values.isna().to_numpy()
+            np.save(os.path.join(cache_dir, f'{position}.npy'), values.fillna('').to_numpy(dtype=str))
+            np.save(os.path.join(cache_dir, f'{position}.mask.npy'), missing)
+            columns.append({'name': column, 'kind': 'str'})
+        else:
+            np.save(os.path.join(cache_dir, f'{position}.npy'), values.to_numpy())
+            columns.append({'name': column, 'kind': 'numeric'})
+
+    stat = os.stat(file_path)
+    manifest = {'version': CACHE_VERSION, 'sha256': file_digest(file_path), 'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns, 'rows': len(df), 'columns': columns}
+    _write_manifest(cache_dir, manifest)
+
+
+def load_registry_cache(file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Загружает реестр из кэша, если кэш соответствует текущему файлу.
+
+    Числовые столбцы отображаются в память (np.load с mmap_mode='r') и
+    передаются в DataFrame без копирования, поэтому их загрузка не зависит
+    от размера реестра. Строковые столбцы читаются в память целиком: pandas
+    хранит их как object, и перевод из массива фиксированной ширины требует копии.
+
+    Параметры:
+    file_path (str): Путь к CSV файлу реестра.
+
+    Возвращает:
+    Optional[pd.DataFrame]: Реестр или None, если кэша нет или он устарел.
+    """
+    cache_dir = cache_dir_for(file_path)
+    manifest = _read_manifest(cache_dir)
+    if not manifest or not _is_valid(manifest, file_path, cache_dir):
+        return None
+
+    data = {}
+    for position, column in enumerate(manifest['columns']):
+        if column['kind'] == 'str':
+            values = np.load(os.path.join(cache_dir, f'{position}.npy')).astype(object)
+            values[np.load(os.path.join(cache_dir, f'{position}.mask.npy'))] = np.nan
+        else:
+            values = np.load(os.path.join(cache_dir, f'{position}.npy'), mmap_mode='r')
+        data[column['name']] = values
+    # copy=False: столбцы не объединяются в общий блок и остаются отображенными в память
+    return pd.DataFrame(data, copy=False)
+
+
+def read_registry_file(file_path: str, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Читает файл реестра из кэша или разбирает CSV и обновляет кэш.
+
+    Параметры:
+    file_path (str): Путь к CSV файлу реестра.
+    use_cache (bool): Использовать ли кэш.
+
+    Возвращает:
+    pd.DataFrame: Реестр, отсортированный по коду и началу диапазона.
+    """
+    if not use_cache:
+        return parse_registry_file(file_path)
+
+    started = time.perf_counter()
+    df = load_registry_cache(file_path)
+    if df is not None:
+        metrics.count('registry_cache_hits')
+        logging.info(f'Реестр {file_path} загружен из кэша за {time.perf_counter() - started:.3f} с')
+        return df
+
+    metrics.count('registry_cache_misses')
+    df = parse_registry_file(file_path)
+    try:
+        save_registry_cache(file_path, df)
+        logging.info(f'Кэш реестра {file_path} обновлен за {time.perf_counter() - started:.3f} с')
+    except OSError as e:
+        logging.warning(f'Не удалось сохранить кэш реестра {file_path}: {e}')
+    return df
@@ -0,0 +1,127 @@
+import os
+import logging
+from typing import NamedTuple, Optional
+import numpy as np
+import pandas as pd
+
+# Столбцы, определяющие диапазон реестра
+KEY_COLUMNS = ['АВС/ DEF', 'От', 'До']
+
+# Имена файлов снимка
+REGISTRY_FILE = 'registry.csv.gz'
+MSISDN_FILE = 'msisdn.npy'
+
+
+class RegistrySnapshot(NamedTuple):
+    """
+    Снимок реестра и номеров, обработанных при предыдущем запуске.
+
+    registry (pd.DataFrame): Реестр со столбцом row_hash.
+    msisdns (np.ndarray): Обработанные номера.
+    """
+    registry: pd.DataFrame
+    msisdns: np.ndarray
+
+
+class RegistryDiff(NamedTuple):
+    """
+    Различия между снимком реестра и новым реестром.
+
+    added (np.ndarray): Маска строк нового реестра, отсутствовавших в снимке.
+    changed (np.ndarray): Маска строк нового реестра с тем же диапазоном, но другим содержимым.
+    removed (np.ndarray): Маска строк снимка, отсутствующих в новом реестре.
+    """
+    added: np.ndarray
+    changed: np.ndarray
+    removed: np.ndarray
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Вычисляет хэш содержимого каждой строки реестра.
+
+    Значения приводятся к строкам, поэтому хэш не зависит от типов,
+    с которыми реестр был прочитан.
+
+    Параметры:
+    df (pd.DataFrame): Реестр.
+
+    Возвращает:
+    np.ndarray: Хэши строк (uint64).
+    """
+    columns = [column for column in df.columns if column != 'row_hash']
+    return pd.util.hash_pandas_object(df[columns].astype(str), index=False).to_numpy()
+
+
+def diff_registry(old: pd.DataFrame, new: pd.DataFrame) -> RegistryDiff:
+    """
+    Классифицирует строки реестра как добавленные, измененные и удаленные.
+
+    Строки сопоставляются по диапазону (код, От, До), изменение содержимого
+    определяется по хэшу строки.
+
+    Параметры:
+    old (pd.DataFrame): Реестр из снимка (со столбцом row_hash).
+    new (pd.DataFrame): Новый реестр.
+
+    Возвращает:
+    RegistryDiff: Маски добавленных, измененных и удаленных строк.
+    """
+    old_keys = old[KEY_COLUMNS].astype(str).assign(old_position=np.arange(len(old)), old_hash=old['row_hash'].to_numpy())
+    new_keys = new[KEY_COLUMNS].astype(str).assign(new_position=np.arange(len(new)), new_hash=row_hashes(new))
+    merged = new_keys.merge(old_keys, on=KEY_COLUMNS, how='outer', indicator=True)
+
+    added = np.zeros(len(new), dtype=bool)
+    changed = np.zeros(len(new), dtype=bool)
+    removed = np.zeros(len(old), dtype=bool)
+    added[merged.loc[merged['_merge'] == 'left_only', 'new_position'].astype(np.int64)] = True
+    both = merged[merged['_merge'] == 'both']
+    changed[both.loc[both['new_hash'] != both['old_hash'], 'new_position'].astype(np.int64)] = True
+    removed[merged.loc[merged['_merge'] == 'right_only', 'old_position'].astype(np.int64)] = True
+
+    logging.info(f'Сравнение реестра со снимком: добавлено {added.sum()}, изменено {changed.sum()}, '
+                 f'удалено {removed.sum()}, без изменений {len(new) - added.sum() - changed.sum()}')
+    return RegistryDiff(added, changed, removed)
+
+
+def load_snapshot(snapshot_dir: str) -> Optional[RegistrySnapshot]:
+    """
+    Загружает снимок предыдущего запуска.
+
+    Параметры:
+    snapshot_dir (str): Папка снимка.
+
+    Возвращает:
+    Optional[RegistrySnapshot]: Снимок или None, если снимка нет.
+    """
+    registry_path = os.path.join(snapshot_dir, REGISTRY_FILE)
+    msisdn_path = os.path.join(snapshot_dir, MSISDN_FILE)
+    if not (os.path.isfile(registry_path) and os.path.isfile(msisdn_path)):
+        logging.info(f'Снимок реестра в папке {snapshot_dir} не найден')
+        return None
+    registry = pd.read_csv(registry_path, dtype={'От': str, 'До': str, 'row_hash': np.uint64})
+    msisdns = np.load(msisdn_path).astype(object)
+    logging.info(f'Загружен снимок реестра: {len(registry)} строк, {len(msisdns)} номеров')
+    return RegistrySnapshot(registry, msisdns)
+
+
+def save_snapshot(snapshot_dir: str, df: pd.DataFrame, msisdns: np.ndarray) -> None:
+    """
+    Сохраняет снимок обработанного реестра и номеров.
+
+    Файлы записываются во временные и затем атомарно переименовываются.
+
+    Параметры:
+    snapshot_dir (str): Папка снимка.
+    df (pd.DataFrame): Обработанный реестр.
+    msisdns (np.ndarray): Обработанные номера.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    registry_path = os.path.join(snapshot_dir, REGISTRY_FILE)
+    msisdn_path = os.path.join(snapshot_dir, MSISDN_FILE)
+    df.assign(row_hash=row_hashes(df)).to_csv(f'{registry_path}.tmp', index=False, compression='gzip')
+    with open(f'{msisdn_path}.tmp', 'wb') as file:
+        np.save(file, np.asarray(msisdns, dtype=str))
+    os.replace(f'{registry_path}.tmp', registry_path)
+    os.replace(f'{msisdn_path}.tmp', msisdn_path)
+    logging.info(f'Сохранен снимок реестра: {len(df)} строк, {len(msisdns)} номеров')
@@ -0,0 +1,415 @@
+import os
+import sqlite3
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from decouple import config
+import metrics
+import tables
+
+# Поддерживаемые значения DB_BACKEND
+BACKENDS = ('oracle', 'sqlite')
+
+# Формат хранения дат в SQLite (сортируется как строка)
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Схема встроенной базы данных: таблицы те же, что и в схеме BIS в Oracle
+SQLITE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS TEASR_DEF (
+           DEF TEXT NOT NULL, ST INTEGER NOT NULL, EN INTEGER NOT NULL, CO INTEGER, OP TEXT, DIR TEXT, INN TEXT)""",
+    "CREATE INDEX IF NOT EXISTS TEASR_DEF_IX ON TEASR_DEF (DEF, ST, EN)",
+    "CREATE TABLE IF NOT EXISTS TEASR_PREFIX_MSISDN (MSISDN_C TEXT PRIMARY KEY) WITHOUT ROWID",
+    """CREATE TABLE IF NOT EXISTS TEASR_PREFIX_DIRECTIONS (
+           NAME_CSV TEXT NOT NULL, DRCT_DRCT_ID INTEGER NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS TEASR_PREFIX_DIRECTIONS_IX ON TEASR_PREFIX_DIRECTIONS (NAME_CSV)",
+    "CREATE TABLE IF NOT EXISTS PREFIX_SETS (PSET_ID INTEGER PRIMARY KEY, PREFIX TEXT)",
+    f"""CREATE TABLE IF NOT EXISTS TEASR_PREFIX_SETS_EXP_CSV (
+           {', '.join(tables.PREFIX_SETS_COLUMNS)})""",
+    "CREATE INDEX IF NOT EXISTS TEASR_PREFIX_SETS_EXP_CSV_PSET_IX ON TEASR_PREFIX_SETS_EXP_CSV (PSET_ID)",
+    """CREATE INDEX IF NOT EXISTS TEASR_PREFIX_SETS_EXP_CSV_PREFIX_PSET_IX
+           ON TEASR_PREFIX_SETS_EXP_CSV (PREFIX, PSET_ID)""",
+]
+
+SQLITE_TEASR_DEF_INSERT_SQL = "INSERT INTO TEASR_DEF (DEF, ST, EN, CO, OP, DIR, INN) VALUES (?, ?, ?, ?, ?, ?, ?)"
+SQLITE_PREFIX_SETS_LATEST_SQL = """SELECT PREFIX, ACTION, DRCT_DRCT_ID FROM (
+                                       SELECT PREFIX, ACTION, DRCT_DRCT_ID,
+                                              ROW_NUMBER() OVER (PARTITION BY PREFIX ORDER BY PSET_ID DESC) AS RN
+                                       FROM TEASR_PREFIX_SETS_EXP_CSV)
+                                   WHERE RN = 1"""
+SQLITE_PREFIX_SETS_INSERT_SQL = (f"INSERT INTO TEASR_PREFIX_SETS_EXP_CSV ({', '.join(tables.PREFIX_SETS_COLUMNS)}) "
+                                 f"VALUES ({', '.join('?' * len(tables.PREFIX_SETS_COLUMNS))})")
+
+_backend: Optional['StorageBackend'] = None
+
+
+class StorageBackend(ABC):
+    """
+    Хранилище таблиц TEASR_DEF, TEASR_PREFIX_MSISDN, TEASR_PREFIX_DIRECTIONS,
+    PREFIX_SETS и TEASR_PREFIX_SETS_EXP_CSV.
+
+    Обработка данных (handlers, main, daemon) обращается к базе данных только
+    через эти методы, поэтому реализация выбирается настройкой DB_BACKEND.
+    """
+
+    name = ''
+
+    @abstractmethod
+    def open(self) -> None:
+        """
+        Подготавливает хранилище к работе.
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """
+        Освобождает подключения к хранилищу.
+        """
+
+    @abstractmethod
+    def load_teasr_def(self, file_paths: List[str]) -> bool:
+        """
+        Загружает файлы реестра в таблицу TEASR_DEF.
+
+        Параметры:
+        file_paths (List[str]): Пути к CSV файлам реестра.
+
+        Возвращает:
+        bool: True, если данные загружены.
+        """
+
+    @abstractmethod
+    def get_all_msisdn(self) -> List[Tuple]:
+        """
+        Возвращает номера из таблицы TEASR_PREFIX_MSISDN в формате [('9000000000',), ...].
+        """
+
+    @abstractmethod
+    def get_all_drct_ids(self) -> List[Tuple]:
+        """
+        Возвращает справочник регионов в формате [(NAME_CSV, DRCT_DRCT_ID), ...].
+        """
+
+    @abstractmethod
+    def get_max_pset_id(self) -> int:
+        """
+        Возвращает максимальный PSET_ID из таблиц PREFIX_SETS и TEASR_PREFIX_SETS_EXP_CSV.
+        """
+
+    @abstractmethod
+    def get_prefix_sets_prefixes(self) -> List[str]:
+        """
+        Возвращает префиксы таблицы PREFIX_SETS.
+        """
+
+    @abstractmethod
+    def insert_prefix_records(self, records: Iterable[tuple], source: str = "сформированных записей") -> bool:
+        """
+        Загружает записи префиксов в таблицу TEASR_PREFIX_SETS_EXP_CSV, пропуская записи,
+        совпадающие с последним выгруженным действием префикса.
+
+        Параметры:
+        records (Iterable[tuple]): Записи в порядке столбцов PREFIX_SETS_COLUMNS.
+        source (str): Источник записей для сообщений в логе.
+
+        Возвращает:
+        bool: True, если записи загружены.
+        """
+
+    def region_cache(self, ttl: Optional[float] = None) -> tables.RegionDirectoryCache:
+        """
+        Создает кэш справочника регионов, читающий справочник из этого хранилища.
+
+        Параметры:
+        ttl (Optional[float]): Время жизни справочника в секундах. None - без обновления.
+
+        Возвращает:
+        tables.RegionDirectoryCache: Кэш справочника регионов.
+        """
+        return tables.RegionDirectoryCache(self.get_all_drct_ids, ttl=ttl)
+
+
+class OracleBackend(StorageBackend):
+    """
+    Хранилище в Oracle (схема BIS): функции db.py с пулом подключений.
+
+    Модуль db (и драйвер oracledb) импортируется при создании хранилища,
+    поэтому запуск с хранилищем SQLite не требует драйвера Oracle.
+    """
+
+    name = 'oracle'
+
+    def __init__(self) -> None:
+        import db
+        self.db = db
+
+    def open(self) -> None:
+        self.db.set_cfg_ora_clnt()
+
+    def close(self) -> None:
+        self.db.close_pool()
+
+    def load_teasr_def(self, file_paths: List[str]) -> bool:
+        return self.db.load_teasr_def(file_paths)
+
+    def get_all_msisdn(self) -> List[Tuple]:
+        return self.db.get_all_msisdn()
+
+    def get_all_drct_ids(self) -> List[Tuple]:
+        return self.db.get_all_drct_ids()
+
+    def get_max_pset_id(self) -> int:
+        return self.db.execute_max_pset_id_query()
+
+    def get_prefix_sets_prefixes(self) -> List[str]:
+        return self.db.get_prefix_sets_prefixes()
+
+    def insert_prefix_records(self, records: Iterable[tuple], source: str = "сформированных записей") -> bool:
+        return self.db.insert_prefix_records(records, source)
+
+
+def _sqlite_value(value):
+    """
+    Приводит значение записи к типу, который хранится в SQLite (даты - строками).
+    """
+    return value.strftime(SQLITE_DATETIME_FORMAT) if isinstance(value, datetime) else value
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Встроенное хранилище в файле SQLite для запуска без Oracle.
+
+    База данных открывается в режиме WAL (чтение не блокируется записью),
+    загрузка выполняется пакетами executemany в одной транзакции, поэтому
+    TEASR_DEF подменяется атомарно, а при ошибке остается прежней.
+
+    Одно подключение используется из нескольких потоков (сервис поиска,
+    запись выгрузки), поэтому транзакции и запросы выполняются под
+    блокировкой: запрос другого потока не попадает внутрь чужой транзакции.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str) -> None:
+        """
+        Параметры:
+        path (str): Путь к файлу базы данных (':memory:' - база в памяти процесса).
+        """
+        self.path = path
+        self.connection: Optional[sqlite3.Connection] = None
+        # Повторно входимая: запросы выполняются и внутри transaction()
+        self.lock = threading.RLock()
+
+    def open(self) -> None:
+        with self.lock:
+            if self.connection is None:
+                self._connect()
+
+    def _connect(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if self.path != ':memory:':
+            os.makedirs(directory, exist_ok=True)
+        # Транзакции открываются явно в transaction()
+        self.connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA temp_store=MEMORY")
+        for statement in SQLITE_SCHEMA:
+            self.connection.execute(statement)
+        logging.info(f"Открыта база данных SQLite {self.path}")
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def query(self, sql: str) -> List[Tuple]:
+        """
+        Выполняет запрос под блокировкой подключения.
+
+        Параметры:
+        sql (str): Текст запроса.
+
+        Возвращает:
+        List[Tuple]: Строки результата.
+        """
+        with self.lock:
+            self.open()
+            return self.connection.execute(sql).fetchall()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Выполняет блок в транзакции: фиксирует ее при успехе и откатывает при ошибке.
+
+        Возвращает:
+        Iterator[sqlite3.Connection]: Подключение к базе данных.
+        """
+        with self.lock:
+            self.open()
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def load_teasr_def(self, file_paths: List[str]) -> bool:
+        batch_size = config('BATCH_SIZE', cast=int)
+        rejects = []
+        try:
+            with metrics.stage("teasr_def_load") as stage, self.transaction() as connection:
+                connection.execute("DELETE FROM TEASR_DEF")
+                for file_path in file_paths:
+                    rows = tables.read_registry_rows(file_path, rejects)
+                    for start in range(0, len(rows), batch_size):
+                        connection.executemany(SQLITE_TEASR_DEF_INSERT_SQL, rows[start:start + batch_size])
+                    stage.rows += len(rows)
+                    logging.info(f"Данные из файла {file_path} загружены в TEASR_DEF: {len(rows)} строк")
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"Ошибка при загрузке TEASR_DEF: {e}, таблица не изменена")
+            print(f"Ошибка при загрузке TEASR_DEF: {e}")
+            return False
+        if rejects:
+            metrics.count("teasr_def_rejected_rows", len(rejects))
+            logging.warning(f"Отклонено строк реестра: {len(rejects)}")
+        return True
+
+    def get_all_msisdn(self) -> List[Tuple]:
+        logging.info("Получение всех строк из таблицы TEASR_PREFIX_MSISDN")
+        return self.query(
+            "SELECT MSISDN_C FROM TEASR_PREFIX_MSISDN WHERE LENGTH(MSISDN_C) = 10 AND MSISDN_C NOT GLOB '*[^0-9]*'")
+
+    def get_all_drct_ids(self) -> List[Tuple]:
+        logging.info("Получение справочника регионов TEASR_PREFIX_DIRECTIONS")
+        return self.query("SELECT NAME_CSV, DRCT_DRCT_ID FROM TEASR_PREFIX_DIRECTIONS")
+
+    def get_max_pset_id(self) -> int:
+        max_pset_id = self.query(
+            "SELECT MAX(m) FROM (SELECT MAX(PSET_ID) AS m FROM PREFIX_SETS "
+            "UNION ALL SELECT MAX(PSET_ID) FROM TEASR_PREFIX_SETS_EXP_CSV)")[0][0] or 0
+        logging.info(f"Максимальное значение PSET_ID: {max_pset_id}")
+        return max_pset_id
+
+    def get_prefix_sets_prefixes(self) -> List[str]:
+        return [str(row[0]) for row in self.query("SELECT PREFIX FROM PREFIX_SETS WHERE PREFIX IS NOT NULL")]
+
+    def get_existing_prefixes(self) -> Dict[str, Tuple[str, str]]:
+        """
+        Возвращает последнее выгруженное действие каждого префикса PREFIX -> (ACTION, DRCT_DRCT_ID),
+        как db.get_existing_prefixes.
+        """
+        return tables.latest_prefix_actions(self.query(SQLITE_PREFIX_SETS_LATEST_SQL))
+
+    def insert_prefix_records(self, records: Iterable[tuple], source: str = "сформированных записей") -> bool:
+        batch_size = config('BATCH_SIZE', cast=int)
+        started = time.perf_counter()
+        try:
+            skipped = 0
+            inserted = 0
+            with self.transaction() as connection:
+                # Последние действия читаются в той же транзакции, что и вставка
+                existing_prefixes = self.get_existing_prefixes()
+                data = []
+                for record in records:
+                    prefix, drct_drct_id, action = str(record[3]), record[8], record[16]
+                    latest_action = (action, '' if drct_drct_id is None else str(drct_drct_id))
+                    if existing_prefixes.get(prefix) == latest_action:
+                        logging.warning(f"Значение PREFIX '{prefix}' ({action}) уже существует в таблице. Строка пропущена.")
+                        skipped += 1
+                        continue
+                    data.append(tuple(_sqlite_value(value) for value in record[:3] + (prefix,) + record[4:]))
+                    existing_prefixes[prefix] = latest_action
+                    if len(data) == batch_size:
+                        connection.executemany(SQLITE_PREFIX_SETS_INSERT_SQL, data)
+                        inserted += len(data)
+                        data = []
+                if data:
+                    connection.executemany(SQLITE_PREFIX_SETS_INSERT_SQL, data)
+                    inserted += len(data)
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка базы данных: {e}")
+            print(f"Ошибка базы данных: {e}")
+            return False
+        logging.info(f"Пропущено строк с существующим PREFIX: {skipped}")
+        logging.info(f"Данные из {source} успешно загружены в базу данных: {inserted} строк "
+                     f"за {time.perf_counter() - started:.3f} с")
+        print(f"Данные из {source} успешно загружены в базу данных")
+        return True
+
+    def replace_msisdns(self, phone_numbers: Iterable[str]) -> None:
+        """
+        Заменяет содержимое таблицы TEASR_PREFIX_MSISDN (наполнение встроенной базы данных).
+
+        Параметры:
+        phone_numbers (Iterable[str]): Номера.
+        """
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM TEASR_PREFIX_MSISDN")
+            connection.executemany("INSERT OR IGNORE INTO TEASR_PREFIX_MSISDN (MSISDN_C) VALUES (?)",
+                                   ((phone_number,) for phone_number in phone_numbers))
+
+    def replace_directions(self, directions: Iterable[Tuple[str, int]]) -> None:
+        """
+        Заменяет содержимое справочника регионов TEASR_PREFIX_DIRECTIONS.
+
+        Параметры:
+        directions (Iterable[Tuple[str, int]]): Пары (NAME_CSV, DRCT_DRCT_ID).
+        """
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM TEASR_PREFIX_DIRECTIONS")
+            connection.executemany("INSERT INTO TEASR_PREFIX_DIRECTIONS (NAME_CSV, DRCT_DRCT_ID) VALUES (?, ?)",
+                                   directions)
+
+
+def create_backend(name: str) -> StorageBackend:
+    """
+    Создает хранилище по имени.
+
+    Параметры:
+    name (str): oracle или sqlite (путь к файлу - настройка SQLITE_PATH).
+
+    Возвращает:
+    StorageBackend: Хранилище (не открытое).
+
+    Raises:
+    ValueError: Если имя хранилища не поддерживается.
+    """
+    if name == 'oracle':
+        return OracleBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(config('SQLITE_PATH', default='prefixes.sqlite3'))
+    raise ValueError(f"Неизвестное хранилище DB_BACKEND={name}, допустимые значения: {', '.join(BACKENDS)}")
+
+
+def get_backend() -> StorageBackend:
+    """
+    Возвращает хранилище, выбранное настройкой DB_BACKEND (по умолчанию oracle).
+
+    Хранилище создается и открывается при первом обращении.
+
+    Возвращает:
+    StorageBackend: Открытое хранилище.
+    """
+    global _backend
+    if _backend is None:
+        backend = create_backend(config('DB_BACKEND', default='oracle').strip().lower())
+        backend.open()
+        _backend = backend
+        logging.info(f"Используется хранилище {backend.name}")
+    return _backend
+
+
+def close_backend() -> None:
+    """
+    Закрывает хранилище; следующий вызов get_backend откроет его заново.
+    """
+    global _backend
+    if _backend is not None:
+        _backend.close()
+        _backend = None
@@ -0,0 +1,204 @@
+import random
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+
+# Столбцы файла реестра
+REGISTRY_COLUMNS = ['АВС/ DEF', 'От', 'До', 'Емкость', 'Оператор', 'Регион', 'Территория ГАР', 'ИНН']
+
+# Операторы и регионы синтетического реестра
+OPERATORS = [('ПАО "МегаФон"', '7812014560'), ('ПАО "МТС"', '7740000076'), ('ПАО "ВымпелКом"', '7713076301'),
+             ('ООО "Т2 Мобайл"', '7743895280')]
+REGIONS = ['г. Москва', 'Московская обл.', 'Республика Татарстан', 'г. Санкт-Петербург', 'Новосибирская обл.']
+
+# Количество номеров внутри кода АВС/DEF
+CODE_CAPACITY = 10 ** 7
+
+
+def generate_registry(codes: int = 20, rows_per_code: int = 500, seed: int = 1, first_code: int = 900) -> pd.DataFrame:
+    """
+    Формирует синтетический реестр с диапазонами разной ширины и выравнивания.
+
+    Диапазоны идут подряд внутри кода с пропусками. Примерно половина
+    диапазонов - выровненные блоки из 10^k номеров (покрываются одним
+    префиксом), остальные имеют произвольные границы.
+
+    Параметры:
+    codes (int): Количество кодов АВС/DEF.
+    rows_per_code (int): Количество диапазонов в коде (не больше, чем помещается в код).
+    seed (int): Начальное значение генератора случайных чисел.
+    first_code (int): Первый код.
+
+    Возвращает:
+    pd.DataFrame: Реестр в том виде, в котором его возвращает pd.read_csv для DEF-9xx.csv.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for code in range(first_code, first_code + codes):
+        start = 0
+        for _ in range(rows_per_code):
+            if rng.random() < 0.5:
+                width = 10 ** rng.randint(1, 4)
+                start = -(-start // width) * width
+            else:
+                width = rng.randint(1, 10 ** rng.randint(1, 4))
+            end = start + width - 1
+            if end >= CODE_CAPACITY:
+                break
+            operator, inn = rng.choice(OPERATORS)
+            rows.append((code, f'{start:07d}', f'{end:07d}', width, operator, rng.choice(REGIONS), float('nan'),
+                         int(inn)))
+            start = end + 1 + (rng.randint(1, 1000) if rng.random() < 0.2 else 0)
+    return pd.DataFrame(rows, columns=REGISTRY_COLUMNS)
+
+
+def write_registry_csv(df: pd.DataFrame, file_path: str) -> None:
+    """
+    Записывает реестр в CSV файл в формате DEF-9xx.csv.
+
+    Параметры:
+    df (pd.DataFrame): Реестр.
+    file_path (str): Путь к файлу.
+    """
+    df.to_csv(file_path, sep=';', index=False, encoding='utf-8')
+
+
+def generate_msisdns(df: pd.DataFrame, count: int = 2000, seed: int = 1, miss_ratio: float = 0.05) -> List[Tuple[str]]:
+    """
+    Формирует синтетическую таблицу номеров TEASR_PREFIX_MSISDN.
+
+    Параметры:
+    df (pd.DataFrame): Реестр, из диапазонов которого выбираются номера.
+    count (int): Количество номеров.
+    seed (int): Начальное значение генератора случайных чисел.
+    miss_ratio (float): Доля номеров вне диапазонов реестра.
+
+    Возвращает:
+    List[Tuple[str]]: Номера в формате get_all_msisdn: [('9000000000',), ...].
+    """
+    rng = random.Random(seed)
+    codes = df['АВС/ DEF'].to_numpy()
+    starts = df['От'].astype(int).to_numpy()
+    ends = df['До'].astype(int).to_numpy()
+    msisdns = []
+    for _ in range(count):
+        if rng.random() < miss_ratio:
+            msisdns.append((f'8{rng.randint(0, 10 ** 9 - 1):09d}',))
+        else:
+            row = rng.randrange(len(df))
+            msisdns.append((f'{codes[row]:03d}{rng.randint(starts[row], ends[row]):07d}',))
+    return msisdns
+
+
+class FakeBatchError:
+    """
+    Ошибка строки пакета executemany(batcherrors=True).
+    """
+
+    def __init__(self, offset: int, message: str) -> None:
+        self.offset = offset
+        self.message = message
+
+
+class FakeDatabase:
+    """
+    База данных в памяти процесса для запуска функций db.py без Oracle.
+
+    Все обращения к базе данных (execute, executemany, commit) записываются в
+    calls, вставленные строки - в inserted. Ответы на запросы SELECT задаются
+    в results по началу текста запроса.
+    """
+
+    def __init__(self, results: Optional[Dict[str, List[tuple]]] = None, reject=None) -> None:
+        """
+        Параметры:
+        results (Optional[Dict[str, List[tuple]]]): Строки ответа по началу текста запроса.
+        reject: Функция (строка) -> текст ошибки или None для отклонения строк executemany(batcherrors=True).
+        """
+        self.results = results or {}
+        self.reject = reject
+        self.calls: List[tuple] = []
+        self.inserted: List[tuple] = []
+        self.lock = threading.Lock()
+
+    @property
+    def round_trips(self) -> int:
+        """
+        Количество обращений к базе данных.
+        """
+        return len(self.calls)
+
+    def record(self, *call) -> None:
+        with self.lock:
+            self.calls.append(call)
+
+    @contextmanager
+    def pooled_connection(self) -> Iterator[Tuple['FakeConnection', 'FakeCursor']]:
+        """
+        Замена db.pooled_connection.
+        """
+        cursor = FakeCursor(self)
+        yield FakeConnection(self), cursor
+        cursor.close()
+
+
+class FakeConnection:
+    """
+    Подключение к FakeDatabase.
+    """
+
+    def __init__(self, database: FakeDatabase) -> None:
+        self.database = database
+
+    def commit(self) -> None:
+        self.database.record('commit')
+
+    def rollback(self) -> None:
+        self.database.record('rollback')
+
+
+class FakeCursor:
+    """
+    Курсор FakeDatabase с интерфейсом курсора oracledb, используемым в db.py.
+    """
+
+    def __init__(self, database: FakeDatabase) -> None:
+        self.database = database
+        self.arraysize = 100
+        self.prefetchrows = 2
+        self.rows: List[tuple] = []
+        self.errors: List[FakeBatchError] = []
+
+    def setinputsizes(self, *sizes) -> None:
+        pass
+
+    def execute(self, statement: str, parameters=None) -> None:
+        self.database.record('execute', ' '.join(statement.split()))
+        text = statement.strip()
+        self.rows = next((list(rows) for start, rows in self.database.results.items() if text.startswith(start)), [])
+
+    def executemany(self, statement: str, parameters: List[tuple], batcherrors: bool = False) -> None:
+        self.database.record('executemany', len(parameters))
+        self.errors = []
+        if batcherrors and self.database.reject:
+            for offset, row in enumerate(parameters):
+                message = self.database.reject(row)
+                if message:
+                    self.errors.append(FakeBatchError(offset, message))
+        rejected = {error.offset for error in self.errors}
+        with self.database.lock:
+            self.database.inserted.extend(row for offset, row in enumerate(parameters) if offset not in rejected)
+
+    def getbatcherrors(self) -> List[FakeBatchError]:
+        return self.errors
+
+    def fetchall(self) -> List[tuple]:
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchone(self) -> Optional[tuple]:
+        return self.rows.pop(0) if self.rows else None
+
+    def close(self) -> None:
+        pass
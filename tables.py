@@ -0,0 +1,182 @@
+import csv
+import time
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import metrics
+
+# Столбцы таблицы TEASR_PREFIX_SETS_EXP_CSV в порядке записи
+PREFIX_SETS_COLUMNS = ['PSET_ID', 'NUMBER_HISTORY', 'OPER_OPER_ID', 'PREFIX', 'START_DATE', 'END_DATE', 'NAVI_USER',
+                       'NAVI_DATE', 'DRCT_DRCT_ID', 'CIT_CIT_ID', 'COU_COU_ID', 'PSET_COMMENT', 'ODRC_ODRC_ID',
+                       'ZONE_ZONE_ID', 'AOB_AOB_ID', 'RTCM_RTCM_ID', 'ACTION']
+
+# Форматы дат в CSV файле префиксов
+CSV_DATE_FORMAT = '%d-%m-%Y'
+CSV_DATETIME_FORMAT = '%d-%m-%Y %H:%M:%S'
+
+
+def read_registry_rows(file_path: str, rejects: List[Tuple[list, str]]) -> List[tuple]:
+    """
+    Читает строки реестра из CSV файла и приводит диапазоны и емкость к числам.
+
+    Строки с менее чем восемью полями отклоняются, из более длинных строк берутся первые восемь полей.
+
+    Параметры:
+    file_path (str): Путь к CSV файлу.
+    rejects (List[Tuple[list, str]]): Список отклоненных строк с причиной. Пополняется.
+
+    Returns:
+    List[tuple]: Строки для вставки в TEASR_DEF.
+    """
+    rows = []
+    with open(file_path, newline='', encoding='utf-8') as csvfile:
+        csv_reader = csv.reader(csvfile, delimiter=';')
+        next(csv_reader)  # Пропускаем заголовок, если он есть
+        for line in csv_reader:
+            if len(line) < 8:
+                rejects.append((line, "Неверное количество полей"))
+                continue
+            # Лишние поля (например, после завершающего разделителя) не загружаются
+            prefix, start_range, end_range, capacity, operator, region, _, inn = line[:8]
+            try:
+                rows.append((prefix, int(start_range), int(end_range), int(capacity), operator, region, inn))
+            except ValueError:
+                logging.warning(f"Неверный формат данных в строке: {line}")
+                rejects.append((line, "Неверный формат данных"))
+    return rows
+
+
+def shard_rows_by_code(rows: List[tuple], shards: int) -> List[List[tuple]]:
+    """
+    Распределяет строки реестра по частям так, чтобы строки одного кода АВС/DEF попали в одну часть.
+
+    Коды раздаются от крупных к мелким в наименее загруженную часть.
+
+    Параметры:
+    rows (List[tuple]): Строки реестра.
+    shards (int): Количество частей.
+
+    Returns:
+    List[List[tuple]]: Непустые части.
+    """
+    by_code: Dict[str, List[tuple]] = {}
+    for row in rows:
+        by_code.setdefault(row[0], []).append(row)
+    parts: List[List[tuple]] = [[] for _ in range(max(1, shards))]
+    for code_rows in sorted(by_code.values(), key=len, reverse=True):
+        min(parts, key=len).extend(code_rows)
+    return [part for part in parts if part]
+
+
+def latest_prefix_actions(rows: Iterable[tuple]) -> Dict[str, Tuple[str, str]]:
+    """
+    Переводит строки (PREFIX, ACTION, DRCT_DRCT_ID) последних действий в словарь.
+
+    Параметры:
+    rows (Iterable[tuple]): Строки выборки PREFIX_SETS_LATEST_SQL.
+
+    Returns:
+    Dict[str, Tuple[str, str]]: PREFIX -> (ACTION, DRCT_DRCT_ID).
+    """
+    return {str(prefix): (action, '' if drct_drct_id is None else str(drct_drct_id))
+            for prefix, action, drct_drct_id in rows}
+
+
+class RegionDirectoryCache:
+    """
+    Кэш справочника регионов NAME_CSV -> DRCT_DRCT_ID.
+
+    Справочник загружается целиком одной выборкой, после чего поиск региона
+    выполняется по словарю без обращения к базе данных. При заданном ttl
+    справочник перечитывается по истечении указанного времени.
+    """
+
+    def __init__(self, loader: Callable[[], List[Tuple]], ttl: Optional[float] = None) -> None:
+        """
+        Параметры:
+        loader (Callable[[], List[Tuple]]): Функция чтения справочника [(NAME_CSV, DRCT_DRCT_ID), ...]
+        (см. StorageBackend.get_all_drct_ids).
+        ttl (Optional[float]): Время жизни справочника в секундах. None - без обновления.
+        """
+        self.ttl = ttl
+        self.loader = loader
+        self.directory: Dict[str, int] = {}
+        self.loaded_at: Optional[float] = None
+        self.hits = 0
+        self.misses: Dict[str, int] = {}
+
+    def load(self) -> None:
+        """
+        Загружает справочник регионов из хранилища.
+
+        Если справочник не удалось обновить, используется прежний справочник,
+        а следующая попытка выполняется по истечении ttl. Если справочник ни
+        разу не загружался, запуск прерывается: без справочника все строки
+        реестра были бы пропущены, и версия реестра считалась бы обработанной.
+
+        Raises:
+        RuntimeError: Если справочник ни разу не загружался.
+        """
+        try:
+            rows = self.loader()
+        except Exception as e:
+            metrics.count("region_directory_load_errors")
+            if self.loaded_at is None:
+                logging.error(f"Не удалось загрузить справочник регионов: {e}")
+                raise RuntimeError(f"Не удалось загрузить справочник регионов: {e}") from e
+            logging.warning(f"Не удалось обновить справочник регионов, используется прежний справочник: {e}")
+            self.loaded_at = time.monotonic()
+            return
+        directory = {}
+        for name_csv, drct_id in rows:
+            directory.setdefault(name_csv, drct_id)
+        self.directory = directory
+        self.loaded_at = time.monotonic()
+        logging.info(f"Справочник регионов загружен: {len(directory)} записей")
+
+    def is_expired(self) -> bool:
+        """
+        Проверяет, требуется ли перечитать справочник.
+
+        Returns:
+        bool: True, если справочник не загружен или истек ttl.
+        """
+        if self.loaded_at is None:
+            return True
+        return self.ttl is not None and time.monotonic() - self.loaded_at >= self.ttl
+
+    def get(self, name_csv: str) -> Optional[int]:
+        """
+        Возвращает DRCT_DRCT_ID для заданного NAME_CSV.
+
+        Параметры:
+        name_csv (str): Значение NAME_CSV для поиска.
+
+        Returns:
+        Optional[int]: DRCT_DRCT_ID или None, если регион отсутствует в справочнике.
+
+        Raises:
+        RuntimeError: Если справочник ни разу не загружался (см. load).
+        """
+        if self.is_expired():
+            self.load()
+        drct_id = self.directory.get(name_csv)
+        if drct_id is None:
+            self.misses[name_csv] = self.misses.get(name_csv, 0) + 1
+        else:
+            self.hits += 1
+        return drct_id
+
+    def log_stats(self) -> None:
+        """
+        Записывает в лог статистику обращений и список отсутствующих регионов.
+
+        Статистика сбрасывается, поэтому при повторном использовании кэша
+        (режим watch) каждый вызов отражает только обращения после предыдущего.
+        """
+        missed = sum(self.misses.values())
+        metrics.set_hit_ratio("region", self.hits, missed)
+        logging.info(f"Кэш регионов: попаданий {self.hits}, промахов {missed}")
+        for name_csv, count in self.misses.items():
+            logging.warning(f"Регион {name_csv} отсутствует в справочнике (обращений: {count})")
+        self.hits = 0
+        self.misses = {}
@@ -1,10 +1,57 @@
+import os
+import sys
+import logging
+import contextlib
+import json
+import gzip
+import http.client
+import random
+import subprocess
+import tempfile
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
 import pandas as pd
-from handlers import form_prefix
+import downloader
+from handlers import (form_prefix, bin_search, batch_lookup, range_to_prefixes, compress_str, compress_numbers,
+                      verify_prefixes, form_tuple, load_registry, cached_range_prefixes, add_row_records)
+import csv_scanner
+from csv_scanner import scan_csv_file
+from snapshot import diff_registry, row_hashes
+from writers import write_records
+import metrics
+from registry_cache import read_registry_file, load_registry_cache, parse_registry_file
+from synthetic import generate_registry, write_registry_csv
+from storage import SQLiteBackend, StorageBackend
+from tables import RegionDirectoryCache
+from lookup import LookupService, start_servers
+from rebuild import rebuild_prefixes
+from prefix_trie import COVERED, DUPLICATE, OVERLAPS, PrefixTrie, validate_prefix_file
+
+# Временная папка синтетического реестра, удаляется при завершении тестов
+_registry_dir = None
+
+def registry_file():
+    """
+    Возвращает реестр для тестов: DEF-9xx.csv, если он скачан, иначе синтетический реестр.
+
+    Синтетический реестр создается один раз во временной папке.
+    """
+    global _registry_dir
+    if os.path.exists('DEF-9xx.csv'):
+        return 'DEF-9xx.csv'
+    if _registry_dir is None:
+        _registry_dir = tempfile.TemporaryDirectory()
+        write_registry_csv(generate_registry(), os.path.join(_registry_dir.name, 'DEF-synthetic.csv'))
+    return os.path.join(_registry_dir.name, 'DEF-synthetic.csv')
+
 def TestCaseAllLines():
-    file_path = 'DEF-9xx.csv'
+    file_path = registry_file()
     df = pd.read_csv(file_path, delimiter=';', dtype={'От': str, 'До': str})
     arr = []
     sett = set()
+    lines = []
     for index, line in df.iterrows():
         prefix = str(line['АВС/ DEF'])
         low = line['От']
@@ -13,8 +60,738 @@ def TestCaseAllLines():
         new_prefix = form_prefix(prefix, low, high, capacity)
         arr.extend(new_prefix)
         sett.update(new_prefix)
+        lines.append(new_prefix)
     assert len(sett) == len(arr)
+    assert verify_prefixes(df, lines)['ok'].all()
+
+def TestCaseRangeToPrefixes():
+    for _ in range(5000):
+        width = random.randint(1, 4)
+        low = random.randrange(10 ** width)
+        high = random.randrange(low, 10 ** width)
+        low, high = str(low).zfill(width), str(high).zfill(width)
+        if low == '0' * width and high == '9' * width:
+            continue
+        numbers = compress_str('9', low, high)
+        for _ in range(10):
+            numbers = compress_numbers(numbers)
+        assert range_to_prefixes('9', low, high) == numbers
+    assert range_to_prefixes('900', '0000000', '9999999') == [900]
+    assert range_to_prefixes('900', '0000000', '0012345') == [900000, 9000010, 9000011, 90000120, 90000121,
+                                                             90000122, 900001230, 900001231, 900001232,
+                                                             900001233, 9000012340, 9000012341, 9000012342,
+                                                             9000012343, 9000012344, 9000012345]
+
+def TestCaseCachedRangePrefixes():
+    cached_range_prefixes.cache_clear()
+    ranges = [('900', '0000000', '0012345'), ('901', '1000000', '1999999'), ('902', '0000500', '0000599')]
+    for _ in range(2):
+        for code, low, high in ranges:
+            assert list(cached_range_prefixes(code, low, high)) == range_to_prefixes(code, low, high)
+    info = cached_range_prefixes.cache_info()
+    assert info.misses == len(ranges) and info.hits == len(ranges)
+
+def TestCaseVerifyPrefixes():
+    rows = pd.DataFrame({'АВС/ DEF': [900] * 5, 'От': ['0000000', '0000100', '0000100', '0000100', '0000100'],
+                         'До': ['0000099', '0000299', '0000299', '0000299', '0000299'], 'Емкость': [100, 200, 200, 200, 200]})
+    prefixes = [[90000000], [90000001, 90000002], [90000002, 90000001], [90000001, 9000001, 90000002],
+                [90000001, 9000000201]]
+    report = verify_prefixes(rows, prefixes)
+    assert report['ok'].tolist() == [True, True, False, False, False]
+    assert report['unsorted'].tolist() == [0, 0, 1, 1, 0]
+    assert report['overlaps'].tolist() == [0, 0, 1, 1, 0]
+    assert report['holes'].tolist() == [0, 0, 0, 1, 1]
+    assert report['covered'].tolist() == [100, 200, 200, 1200, 101]
+    assert report['end_ok'].tolist() == [True, True, False, True, False]
+
+def TestCaseRegistryDiff():
+    old = pd.DataFrame({'АВС/ DEF': [900, 900, 901], 'От': ['0000000', '0000100', '0000000'],
+                        'До': ['0000099', '0000199', '0009999'], 'Регион': ['г. Москва', 'г. Москва', 'г. Москва']})
+    old['row_hash'] = row_hashes(old)
+    new = pd.DataFrame({'АВС/ DEF': [900, 900, 902], 'От': ['0000000', '0000100', '0000000'],
+                        'До': ['0000099', '0000199', '0009999'], 'Регион': ['г. Москва', 'Московская обл.', 'г. Москва']})
+    diff = diff_registry(old, new)
+    assert diff.added.tolist() == [False, False, True]
+    assert diff.changed.tolist() == [False, True, False]
+    assert diff.removed.tolist() == [False, False, True]
+
+def TestCaseBatchLookup():
+    file_path = registry_file()
+    df = pd.read_csv(file_path, delimiter=';', dtype={'От': str, 'До': str})
+    phone_numbers = [str(random.randint(9000000000, 9999999999)) for _ in range(1000)]
+    phone_numbers.extend(str(line['АВС/ DEF']) + line['От'] for _, line in df.head(100).iterrows())
+    phone_numbers.extend(str(line['АВС/ DEF']) + line['До'] for _, line in df.tail(100).iterrows())
+    phone_numbers.append('abc')
+    row_indices, matched = batch_lookup(df, phone_numbers)
+    for phone_number, row_index, found in zip(phone_numbers, row_indices, matched):
+        expected = bin_search(df, phone_number) if phone_number.isdigit() else None
+        if expected is None:
+            assert not found and row_index == -1
+        else:
+            assert found and df.index[row_index] == expected.name
+
+def TestCaseCsvScanner():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'scan.csv')
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write('АВС/ DEF;От;До;Регион\n')
+            file.write('900;0000000;0000099;г. Москва\n')
+            file.write('901;0000000;0000099;Москва; drop table x\n')
+            file.write('902;0000000;0000099;Выборка SELECTов\n')
+        result = scan_csv_file(file_path)
+        assert not result.safe and not result.cached
+        assert [(f.row, f.column, f.match) for f in result.findings] == [(3, 29, 'drop')]
+        assert scan_csv_file(file_path).cached
+
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write('АВС/ DEF;От;До;Регион\n900;0000000;0000099;Республика Татарстан\n')
+        result = scan_csv_file(file_path)
+        assert result.safe and not result.cached
+
+        # Кэши проверок и хэшей не растут с числом версий файла
+        for version in range(csv_scanner.CACHE_SIZE + 10):
+            with open(file_path, 'w', encoding='utf-8') as file:
+                file.write(f'АВС/ DEF;От;До;Регион\n900;{version:07d};0000099;г. Москва\n')
+            scan_csv_file(file_path)
+        assert len(csv_scanner._verdicts) == len(csv_scanner._digests) == csv_scanner.CACHE_SIZE
+        assert scan_csv_file(file_path).cached
+
+def TestCaseWriters():
+    from handlers import form_tuple
+    records = [form_tuple(i, str(prefix), 608, 'test') for i, prefix in enumerate(random.sample(range(900, 100000), 500))]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'prefixes.csv')
+        stats = write_records(records, file_path, 'csv')
+        with open(file_path, encoding='utf-8') as file:
+            expected = file.read()
+        assert stats.rows == 500 and stats.runs == 0 and stats.size == len(expected.encode('utf-8'))
+        prefixes = pd.read_csv(file_path)['PREFIX'].tolist()
+        assert prefixes == sorted(int(record[3]) for record in records)
+
+        stats = write_records(iter(records), file_path, 'csv.gz', chunk_rows=32)
+        assert stats.rows == 500 and stats.runs == 16
+        with gzip.open(file_path, 'rt', encoding='utf-8') as file:
+            assert file.read() == expected
+        assert os.listdir(tmp_dir) == ['prefixes.csv']
+
+def TestCaseRegistryCache():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'DEF-9xx.csv')
+        with open(registry_file(), encoding='utf-8') as source, open(file_path, 'w', encoding='utf-8') as file:
+            file.write(source.read())
+        assert load_registry_cache(file_path) is None
+        expected = read_registry_file(file_path)
+        cached = load_registry_cache(file_path)
+        assert cached is not None and cached.equals(expected)
+        numeric = [column for column in cached.columns if cached[column].dtype != object]
+        assert numeric and all(isinstance(cached[column].to_numpy().base, np.memmap) for column in numeric)
+
+        # Тот же файл с новым временем изменения: кэш проверяется по SHA-256, описание кэша обновляется
+        os.utime(file_path, ns=(0, 10 ** 9))
+        assert load_registry_cache(file_path).equals(expected)
+        with open(os.path.join(f'{file_path}.cache', 'manifest.json'), encoding='utf-8') as file:
+            assert json.load(file)['mtime_ns'] == 10 ** 9
+
+        with open(file_path, 'a', encoding='utf-8') as file:
+            file.write('999;9999990;9999999;10;ПАО "МТС";г. Москва;;7740000076\n')
+        assert load_registry_cache(file_path) is None
+        assert read_registry_file(file_path).equals(parse_registry_file(file_path))
+
+def TestCaseMetrics():
+    metrics.start_run()
+    for rows in (10, 30):
+        with metrics.stage('lookup') as stage:
+            stage.rows = rows
+    metrics.count('db_round_trips', 2)
+    metrics.set_hit_ratio('prefix', 3, 1)
+    run = metrics.summary()
+    assert run['stages']['lookup']['rows'] == 40 and run['stages']['lookup']['calls'] == 2
+    assert run['gauges']['prefix_cache_hit_ratio'] == 0.75
+    text = metrics.render_prometheus(run)
+    assert 'rtk_prefix_stage_rows{stage="lookup"} 40\n' in text
+    assert 'rtk_prefix_db_round_trips_total' in text and 'rtk_prefix_prefix_cache_hit_ratio 0.75\n' in text
+
+def TestCaseSQLiteBackend():
+    os.environ.setdefault('BATCH_SIZE', '1000')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry_path = os.path.join(tmp_dir, 'DEF-9xx.csv')
+        write_registry_csv(generate_registry(codes=2, rows_per_code=50), registry_path)
+        backend = SQLiteBackend(os.path.join(tmp_dir, 'prefixes.sqlite3'))
+        backend.open()
+        assert backend.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert backend.load_teasr_def([registry_path]) and backend.load_teasr_def([registry_path])
+        assert backend.connection.execute('SELECT COUNT(*) FROM TEASR_DEF').fetchone()[0] == 100
+        backend.replace_msisdns(['9000000001', '900000000', '90000000x1'])
+        assert backend.get_all_msisdn() == [('9000000001',)]
+        backend.replace_directions([('г. Москва', 77)])
+        assert backend.region_cache().get('г. Москва') == 77
+        assert backend.get_max_pset_id() == 0
+        records = [form_tuple(pset_id, prefix, 77, 'tester') for pset_id, prefix in enumerate(['900', '9010'], 1)]
+        assert backend.insert_prefix_records(records) and backend.insert_prefix_records(records)
+        assert backend.connection.execute('SELECT COUNT(*) FROM TEASR_PREFIX_SETS_EXP_CSV').fetchone()[0] == 2
+        assert backend.get_max_pset_id() == 2
+        # Префикс снова добавляется после удаления: сравнение идет с последним действием префикса
+        assert backend.insert_prefix_records([form_tuple(3, '900', 77, 'tester', 'DELETE')])
+        assert backend.insert_prefix_records([form_tuple(4, '900', 77, 'tester')])
+        assert backend.insert_prefix_records([form_tuple(5, '900', 77, 'tester')])
+        assert backend.get_existing_prefixes() == {'900': ('MERGE', '77'), '9010': ('MERGE', '77')}
+        assert backend.connection.execute('SELECT COUNT(*) FROM TEASR_PREFIX_SETS_EXP_CSV').fetchone()[0] == 4
+        # Одно подключение из нескольких потоков: транзакции не пересекаются
+        threads = [threading.Thread(target=backend.insert_prefix_records,
+                                    args=([form_tuple(100 * i + j, str(9100 + 10 * i + j), 77, 'tester')
+                                           for j in range(10)],))
+                   for i in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert backend.connection.execute('SELECT COUNT(*) FROM TEASR_PREFIX_SETS_EXP_CSV').fetchone()[0] == 84
+        backend.close()
+    try:
+        StorageBackend()
+        assert False, 'StorageBackend is abstract'
+    except TypeError:
+        pass
+
+def TestCaseLookupService():
+    file_path = registry_file()
+    service = LookupService([file_path], lambda: [('г. Москва', 77)])
+    assert service.reload() and service.status()['version'] == 1
+    df = load_registry([file_path])
+    numbers = [str(9000000000 + i * 9973) for i in range(5000)] + ['123', '90000000x0']
+    row_indices, matched = batch_lookup(df, numbers)
+    results = service.lookup_many(numbers)
+    for number, row_index, found, result in zip(numbers, row_indices, matched, results):
+        assert service.lookup(number) == result and (result is not None) == found
+        if found:
+            assert (result.operator, result.region) == (df.iloc[row_index]['Оператор'], df.iloc[row_index]['Регион'])
+            assert result.drct_id == (77 if result.region == 'г. Москва' else None)
+    index = service.index
+    assert service.reload() and service.index is not index and service.status()['version'] == 2
+    servers = start_servers(service, '127.0.0.1', 0, None)
+    try:
+        number = numbers[int(matched.argmax())]
+        url = f'http://127.0.0.1:{servers[0].server_address[1]}/lookup?msisdn={number}'
+        with urllib.request.urlopen(url) as response:
+            assert json.loads(response.read())['operator'] == results[int(matched.argmax())].operator
+        for body, length in ((b'[1, 2]', None), (b'"msisdns"', None), (b'{}', '-1'), (b'{}', 'abc')):
+            connection = http.client.HTTPConnection('127.0.0.1', servers[0].server_address[1])
+            connection.putrequest('POST', '/lookup')
+            connection.putheader('Content-Length', length or str(len(body)))
+            connection.endheaders(body)
+            assert connection.getresponse().status == 400
+            connection.close()
+        # Цифры Unicode, отличные от 0-9, не принимаются за номер
+        assert service.lookup('999999999²') is None and service.lookup_many(['999999999²', '٩٠٠٠٠٠٠٠٠٠']) == [None, None]
+        for path, body in (('/lookup?msisdn=999999999%C2%B2', None),
+                           ('/lookup', json.dumps({'msisdns': [number, '999999999²']}).encode())):
+            connection = http.client.HTTPConnection('127.0.0.1', servers[0].server_address[1])
+            connection.request('GET' if body is None else 'POST', path, body)
+            assert connection.getresponse().status == 400
+            connection.close()
+        connection = http.client.HTTPConnection('127.0.0.1', servers[0].server_address[1])
+        connection.putrequest('POST', '/lookup')
+        connection.putheader('Content-Length', str(10 ** 12))
+        connection.endheaders()
+        assert connection.getresponse().status == 413
+        connection.close()
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+def TestCaseParallelRebuild():
+    df = generate_registry(codes=6, rows_per_code=200)
+    result = rebuild_prefixes(df, workers=2, shards=4)
+    assert result.prefixes == [range_to_prefixes(str(code), low, high)
+                               for code, low, high in zip(df['АВС/ DEF'], df['От'], df['До'])]
+    assert sum(timing.rows for timing in result.timings) == len(df) and len(result.timings) == 4
+    assert verify_prefixes(df, result.prefixes)['ok'].all()
+
+def TestCasePrefixTrie():
+    trie = PrefixTrie(capacity=1)
+    assert trie.load(['900', '9012', '90130']) == []
+    assert trie.insert('9001').kind == COVERED and trie.insert('900').kind == DUPLICATE
+    conflict = trie.insert('901', 5)
+    assert conflict.kind == OVERLAPS and conflict.existing == '9012'
+    assert trie.longest_match('9012345678') == ('9012', -1) and trie.longest_match('9019999999') == ('901', 5)
+    assert trie.longest_match('9100000000') is None and trie.check('9001').kind == COVERED
+    assert list(trie) == ['900', '901', '9012', '90130'] and len(trie) == 4
+    assert trie.longest_match('9012-345') == ('9012', -1) and '9x' not in trie and '90²' not in trie
+    for invalid in ('', '90x', '90²', '٩٠'):
+        for method in (trie.insert, trie.check):
+            try:
+                method(invalid)
+                assert False, invalid
+            except ValueError:
+                pass
+
+    # Покрытый префикс MERGE пропускается независимо от порядка строк реестра
+    rows = pd.DataFrame({'АВС/ DEF': [900, 900], 'От': ['0000000', '0000000'], 'До': ['0999999', '0099999'],
+                         'Регион': ['г. Москва', 'г. Москва']})
+    region_cache = RegionDirectoryCache(loader=lambda: [('г. Москва', 77)])
+    for order in ([0, 1], [1, 0]):
+        arr, conflicts = set(), []
+        add_row_records(rows, np.array(order), 'MERGE', region_cache, 'tester', 1, PrefixTrie(), arr, conflicts)
+        assert [record[3] for record in arr] == [9000] and [conflict.kind for conflict in conflicts] == [COVERED]
+
+    df = generate_registry(codes=2, rows_per_code=100)
+    prefixes = [prefix for code, low, high in zip(df['АВС/ DEF'], df['От'], df['До'])
+                for prefix in range_to_prefixes(str(code), low, high)]
+    records = [form_tuple(pset_id, prefix, 77, 'tester') for pset_id, prefix in enumerate(prefixes)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'out.csv')
+        write_records(records, file_path)
+        assert validate_prefix_file(file_path) == []
+        write_records(records + [form_tuple(len(records), prefixes[0] // 10, 77, 'tester')], file_path)
+        conflicts = validate_prefix_file(file_path)
+        assert conflicts and {conflict.kind for conflict in conflicts} <= {OVERLAPS, COVERED}
+
+def TestCaseRegionDirectoryCache():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('ORA-03113')
+        return [('г. Москва', 77)]
+
+    cache = RegionDirectoryCache(loader=loader)
+    try:
+        cache.get('г. Москва')
+        assert False
+    except RuntimeError:
+        pass
+    assert cache.loaded_at is None and cache.is_expired() and len(calls) == 1
+    assert cache.get('г. Москва') == 77 and len(calls) == 2
+    assert cache.get('г. Москва') == 77 and len(calls) == 2
+
+    # Ошибка обновления: используется прежний справочник, следующая попытка - по истечении ttl
+    def failing_loader():
+        calls.append(1)
+        raise RuntimeError('ORA-03113')
+
+    errors = metrics.summary()['counters'].get('region_directory_load_errors', 0)
+    cache.loader, cache.ttl, cache.loaded_at = failing_loader, 60, cache.loaded_at - 60
+    assert cache.get('г. Москва') == 77 and cache.get('г. Москва') == 77 and len(calls) == 3
+    assert metrics.summary()['counters']['region_directory_load_errors'] == errors + 1
+    assert not cache.is_expired()
+
+    # Статистика обращений сбрасывается после записи в лог
+    cache.get('Тверская обл.')
+    cache.log_stats()
+    assert cache.hits == 0 and cache.misses == {}
+    cache.get('Тверская обл.')
+    assert cache.hits == 0 and cache.misses == {'Тверская обл.': 1}
+
+def TestCaseTeasrDefSwap():
+    import db
+    from synthetic import FakeDatabase
+    os.environ.setdefault('BATCH_SIZE', '1000')
+    os.environ['TEASR_DEF_LOAD_MODE'] = 'swap'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry_path = os.path.join(tmp_dir, 'DEF-9xx.csv')
+        write_registry_csv(generate_registry(codes=2, rows_per_code=50), registry_path)
+        pooled_connection = db.pooled_connection
+        try:
+            for active_table, staging_table in (('TEASR_DEF_A', 'TEASR_DEF_B'), (None, 'TEASR_DEF_A')):
+                database = FakeDatabase({'SELECT "TABLE_NAME" FROM "ALL_SYNONYMS"': [(active_table,)] if active_table else [],
+                                         'SELECT "GRANTEE", "PRIVILEGE", "GRANTABLE" FROM "ALL_TAB_PRIVS"':
+                                             [('REPORTS', 'SELECT', 'NO'), ('PUBLIC', 'SELECT', 'YES')]})
+                db.pooled_connection = database.pooled_connection
+                assert db.load_teasr_def([registry_path]) and len(database.inserted) == 100
+                statements = [call[1] for call in database.calls if call[0] == 'execute']
+                assert f'GRANT SELECT ON "BIS"."{staging_table}" TO "REPORTS"' in statements
+                assert f'GRANT SELECT ON "BIS"."{staging_table}" TO PUBLIC WITH GRANT OPTION' in statements
+                assert statements.index(f'GRANT SELECT ON "BIS"."{staging_table}" TO "REPORTS"') < len(statements) - 2
+                assert f'CREATE TABLE "BIS"."{staging_table}" (' in statements[2]
+                assert statements[-2] == f'CREATE OR REPLACE SYNONYM "BIS"."TEASR_DEF" FOR "BIS"."{staging_table}"'
+                assert statements[-1] == f'ALTER INDEX "BIS"."{staging_table}_IX" LOGGING'
+                assert ('DROP TABLE "BIS"."TEASR_DEF" PURGE' in statements[-3]) == (active_table is None)
+                assert not any('RENAME' in statement for statement in statements)
+
+            # Ошибка перевода индекса в LOGGING после переключения синонима не отменяет загрузку
+            database = FakeDatabase()
+
+            @contextlib.contextmanager
+            def failing_alter():
+                with database.pooled_connection() as (connection, cursor):
+                    execute = cursor.execute
+
+                    def alter_fails(statement, parameters=None):
+                        if statement.startswith('ALTER INDEX'):
+                            raise RuntimeError('ORA-01418')
+                        execute(statement, parameters)
+
+                    cursor.execute = alter_fails
+                    yield connection, cursor
+
+            db.pooled_connection = failing_alter
+            assert db.swap_staging_table('TEASR_DEF_B', 'TEASR_DEF_A')
+            assert database.calls[-1] == ('execute', 'CREATE OR REPLACE SYNONYM "BIS"."TEASR_DEF" FOR "BIS"."TEASR_DEF_B"')
+        finally:
+            db.pooled_connection = pooled_connection
+            del os.environ['TEASR_DEF_LOAD_MODE']
+
+def TestCaseParallelLoad():
+    import db
+    from synthetic import FakeDatabase
+    os.environ.setdefault('BATCH_SIZE', '1000')
+    rows = [(str(code), start, start + 99, 100, 'op', 'г. Москва', '1') for code in (900, 901, 902, 903, 904)
+            for start in range(0, 1000 * (code - 899), 100)]
+    shards = db.shard_rows_by_code(rows, 3)
+    assert len(shards) == 3 and sorted(row for shard in shards for row in shard) == sorted(rows)
+    assert all(len({row[0] for row in shard} & {row[0] for row in other}) == 0
+               for i, shard in enumerate(shards) for other in shards[i + 1:])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry_path = os.path.join(tmp_dir, 'DEF-9xx.csv')
+        write_registry_csv(generate_registry(codes=3, rows_per_code=50), registry_path)
+        with open(registry_path, 'a', encoding='utf-8') as file:
+            file.write('900;abc;0000099;100;op;г. Москва;;1\n')
+            file.write('905;0000100;0000199;100;op;г. Москва;;1;\n')
+            file.write('905;0000200;0000299;100;op;г. Москва;;1;extra\n')
+            file.write('905;0000300;0000399;100;op\n')
+        pooled_connection = db.pooled_connection
+        try:
+            database = FakeDatabase(reject=lambda row: 'ORA-12899' if row[1] == 0 else None)
+            db.pooled_connection = database.pooled_connection
+            assert db.insert_csv_standart_data_parallel(registry_path, workers=3)
+            with open(os.path.join(tmp_dir, 'DEF-9xx_reject.csv'), encoding='utf-8') as file:
+                rejects = file.read().splitlines()
+            assert len(rejects) == 5 and sum(line.endswith('ORA-12899') for line in rejects) == 3
+            assert len(database.inserted) == 149 and database.calls.count(('commit',)) == 3
+
+            def fail(row):
+                raise RuntimeError('ORA-03113')
+
+            os.environ['TEASR_DEF_LOAD_MODE'] = 'recreate'
+            database = FakeDatabase(reject=fail)
+            db.pooled_connection = database.pooled_connection
+            assert not db.load_teasr_def([registry_path])
+            assert database.calls[-1] == ('execute', 'TRUNCATE TABLE "BIS"."TEASR_DEF"')
+        finally:
+            db.pooled_connection = pooled_connection
+            os.environ.pop('TEASR_DEF_LOAD_MODE', None)
+
+def TestCaseWatchDaemon():
+    import functools
+    from http.server import SimpleHTTPRequestHandler
+    import storage
+    from daemon import WatchDaemon
+    cwd = os.getcwd()
+    environ = {'DB_BACKEND': 'sqlite', 'EXPORT_CSV': 'False', 'BATCH_SIZE': '1000', 'INCREMENTAL': 'False'}
+    saved = {name: os.environ.get(name) for name in list(environ) + ['SQLITE_PATH']}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        served = os.path.join(tmp_dir, 'srv')
+        os.makedirs(served)
+        write_registry_csv(generate_registry(codes=2, rows_per_code=50), os.path.join(served, 'DEF-9xx.csv'))
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(SimpleHTTPRequestHandler, directory=served))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ.update(environ, SQLITE_PATH=os.path.join(tmp_dir, 'watch.sqlite3'))
+        os.chdir(tmp_dir)
+        try:
+            storage.close_backend()
+            daemon = WatchDaemon([f'http://127.0.0.1:{server.server_port}/DEF-9xx.csv'], None, 'tester', 0)
+            registry = load_registry([os.path.join(served, 'DEF-9xx.csv')])
+            daemon.backend.replace_directions([(region, 77) for region in set(registry['Регион'])])
+            numbers = [str(code) + low for code, low in zip(registry['АВС/ DEF'], registry['От'])]
+            daemon.backend.replace_msisdns(numbers[:10])
+
+            def exported():
+                return daemon.backend.connection.execute('SELECT COUNT(*) FROM TEASR_PREFIX_SETS_EXP_CSV').fetchone()[0]
+
+            # Ошибка справочника регионов прерывает цикл, и версия реестра не считается обработанной
+            loader = daemon.region_cache.loader
+
+            def failing_loader():
+                raise RuntimeError('ORA-03113')
+
+            daemon.region_cache.loader = failing_loader
+            try:
+                daemon.run_cycle()
+                assert False
+            except SystemExit:
+                pass
+            assert daemon.processed is None and not downloader.is_processed('DEF-9xx.csv') and exported() == 0
+            daemon.region_cache.loader = loader
+            daemon.run_cycle()
+            first = exported()
+            assert first > 0 and downloader.is_processed('DEF-9xx.csv')
+            daemon.run_cycle()
+            assert exported() == first
+            daemon.backend.replace_msisdns(numbers[:20])
+            daemon.run_cycle()
+            second = exported()
+            assert second > first
+
+            # Реестр, который не скачался и не скачивался раньше: цикл пропускается, прежний реестр остается в памяти
+            warm_registry, warm_digests = daemon.registry, dict(daemon.digests)
+            daemon.file_urls = daemon.file_urls + [f'http://127.0.0.1:{server.server_port}/ABC-3xx.csv']
+            daemon.backend.replace_msisdns(numbers[:30])
+            daemon.run_cycle()
+            assert daemon.registry is warm_registry and daemon.digests == warm_digests and exported() == second
+        finally:
+            storage.close_backend()
+            os.chdir(cwd)
+            server.shutdown()
+            server.server_close()
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+def TestCasePartialRegistryDownload():
+    import functools
+    from http.server import SimpleHTTPRequestHandler
+    import main
+    import storage
+    cwd = os.getcwd()
+    root_handlers = list(logging.getLogger().handlers)
+    environ = {'DB_BACKEND': 'sqlite', 'EXPORT_CSV': 'False', 'BATCH_SIZE': '1000', 'GIT_PUSH': 'n', 'USE_LOCAL_FILE': 'y'}
+    saved = {name: os.environ.get(name) for name in list(environ) + ['SQLITE_PATH', 'LOG_FOLDER', 'FILE_URLS',
+                                                                     'LOCAL_FILE_PATH']}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        served = os.path.join(tmp_dir, 'srv')
+        os.makedirs(served)
+        write_registry_csv(generate_registry(codes=2, rows_per_code=50), os.path.join(served, 'DEF-9xx.csv'))
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(SimpleHTTPRequestHandler, directory=served))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        file_urls = [f'http://127.0.0.1:{server.server_port}/DEF-9xx.csv',
+                     f'http://127.0.0.1:{server.server_port}/ABC-3xx.csv']
+        # Локальная копия другого реестра не подставляется вместо нескачанного ABC-3xx
+        os.environ.update(environ, SQLITE_PATH=os.path.join(tmp_dir, 'run.sqlite3'), LOG_FOLDER=os.path.join(tmp_dir, 'logs'),
+                          FILE_URLS=','.join(file_urls), LOCAL_FILE_PATH=os.path.join(served, 'DEF-9xx.csv'))
+        os.chdir(tmp_dir)
+        try:
+            storage.close_backend()
+            previous = os.path.join(tmp_dir, 'previous.csv')
+            write_registry_csv(generate_registry(codes=1, rows_per_code=30), previous)
+            assert storage.get_backend().load_teasr_def([previous])
+
+            def teasr_def_rows():
+                return storage.get_backend().query('SELECT COUNT(*) FROM TEASR_DEF')[0][0]
+
+            main.main(['run'])
+            assert teasr_def_rows() == 30 and not downloader.is_processed('DEF-9xx.csv')
+
+            # Для нескачанного файла используется его предыдущая версия или копия из папки LOCAL_FILE_PATH
+            write_registry_csv(generate_registry(codes=1, rows_per_code=30), 'ABC-3xx.csv')
+            assert main.download_registry(file_urls) == ['DEF-9xx.csv', 'ABC-3xx.csv']
+            local_dir = os.path.join(tmp_dir, 'local')
+            os.makedirs(local_dir)
+            os.rename('ABC-3xx.csv', os.path.join(local_dir, 'ABC-3xx.csv'))
+            assert main.download_registry(file_urls, local_dir) == ['DEF-9xx.csv', os.path.join(local_dir, 'ABC-3xx.csv')]
+            assert main.download_registry(file_urls, os.path.join(served, 'DEF-9xx.csv')) is None
+        finally:
+            storage.close_backend()
+            os.chdir(cwd)
+            server.shutdown()
+            server.server_close()
+            for handler in logging.getLogger().handlers:
+                if handler not in root_handlers:
+                    logging.getLogger().removeHandler(handler)
+                    handler.close()
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+def TestCaseStartupTime():
+    budget_us = 500000
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        _, _, times = line.partition('import time:')
+        fields = [field.strip() for field in times.split('|')]
+        if len(fields) == 3 and fields[1].isdigit():
+            cumulative[fields[2]] = int(fields[1])
+    assert not {'pandas', 'numpy', 'oracledb', 'git'} & set(cumulative)
+    assert cumulative['main'] < budget_us, cumulative['main']
+
+    # Запись файлов, построение префиксов, режим watch и хранилище SQLite не требуют драйвера Oracle
+    result = subprocess.run([sys.executable, '-c', 'import sys, writers, rebuild, storage, handlers, daemon; '
+                                                   'storage.create_backend("sqlite"); print("oracledb" in sys.modules)'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0 and result.stdout.strip() == 'False', result.stderr
+
+class RegistryRequestHandler(BaseHTTPRequestHandler):
+    body = '\n'.join(f'900;{i:07d};{i:07d};1' for i in range(50000)).encode('utf-8')
+    etag = '"v1"'
+    # Количество байт в конце ответа, которые сервер не отправляет (обрыв соединения)
+    truncated = 0
+
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == self.etag:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(self.body) - 1}/{len(self.body)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.body) - start))
+        self.end_headers()
+        self.wfile.write(self.body[start:len(self.body) - self.truncated])
+
+    def log_message(self, *args):
+        pass
+
+def TestCaseDownload():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RegistryRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    file_url = f'http://127.0.0.1:{server.server_port}/DEF-9xx.csv'
+    body = RegistryRequestHandler.body
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, 'DEF-9xx.csv')
+            result = downloader.download(file_url, file_name, chunk_size=4096)
+            assert result.status == downloader.DOWNLOADED and result.size == len(body)
+            assert downloader.download(file_url, file_name).status == downloader.NOT_MODIFIED
+            # 304 без успешной обработки не отменяет обработку
+            assert not downloader.is_processed(file_name)
+            downloader.mark_processed(file_name)
+            assert downloader.is_processed(file_name)
+
+            os.remove(file_name)
+            os.remove(f'{file_name}.processed.json')
+            os.rename(f'{file_name}.meta.json', f'{file_name}.part.meta.json')
+            with open(f'{file_name}.part', 'wb') as file:
+                file.write(body[:1000])
+            result = downloader.download(file_url, file_name)
+            assert result.status == downloader.RESUMED and result.size == len(body) - 1000
+            with open(file_name, 'rb') as file:
+                assert file.read() == body
+            assert not os.path.exists(f'{file_name}.part')
+
+            # Ответ короче Content-Length: файл не заменяется, .part докачивается при следующем запуске
+            os.remove(file_name)
+            os.remove(f'{file_name}.meta.json')
+            RegistryRequestHandler.truncated = 1000
+            try:
+                downloader.download(file_url, file_name)
+                assert False
+            except urllib.error.URLError:
+                pass
+            assert not os.path.exists(file_name) and os.path.getsize(f'{file_name}.part') == len(body) - 1000
+            try:
+                downloader.download(file_url, file_name)
+                assert False
+            except urllib.error.URLError:
+                pass
+            assert not os.path.exists(file_name) and os.path.getsize(f'{file_name}.part') == len(body) - 1000
+            RegistryRequestHandler.truncated = 0
+            result = downloader.download(file_url, file_name)
+            assert result.status == downloader.RESUMED and result.size == 1000
+            with open(file_name, 'rb') as file:
+                assert file.read() == body
+    finally:
+        RegistryRequestHandler.truncated = 0
+        server.shutdown()
+
+def TestCaseGitUpload():
+    import datetime
+    import types
+    import git
+    import git_upload
+    cwd = os.getcwd()
+    environ = {'SRC_REMOTE_BRANCH': 'main', 'GIT_FETCH_DEPTH': '1',
+               'GIT_AUTHOR_NAME': 'tester', 'GIT_AUTHOR_EMAIL': 'tester@example.com',
+               'GIT_COMMITTER_NAME': 'tester', 'GIT_COMMITTER_EMAIL': 'tester@example.com'}
+    saved = {name: os.environ.get(name) for name in
+             list(environ) + ['FILE_FOR_PUSH_NAME', 'GIT_URL', 'NEW_REMOTE_BRANCH', 'GIT_MIRROR_PATH']}
+    saved_datetime, saved_prepare_worktree = git_upload.datetime, git_upload.prepare_worktree
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        origin_path = os.path.join(tmp_dir, 'origin.git')
+        git.Repo.init(origin_path, bare=True, initial_branch='main')
+        source = git.Repo.init(os.path.join(tmp_dir, 'source'), initial_branch='main')
+        for path in ('README.md', 'components/base/202401011200/old.csv', 'components/base/202301010000/a.csv'):
+            os.makedirs(os.path.join(source.working_dir, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(source.working_dir, path), 'w', encoding='utf-8') as file:
+                file.write(path)
+        source.git.add('-A')
+        source.git.commit(m='initial')
+        source.git.push(origin_path, 'main')
+        with open(os.path.join(tmp_dir, 'prefixes.csv'), 'w', encoding='utf-8') as file:
+            file.write('7900;1\n')
+        os.environ.update(environ, FILE_FOR_PUSH_NAME='prefixes.csv', GIT_URL=f'file://{origin_path}',
+                          NEW_REMOTE_BRANCH='prefixes-1', GIT_MIRROR_PATH='mirror')
+
+        # Время запуска фиксируется, чтобы папка нового файла уже была в удаленном репозитории
+        git_upload.datetime = types.SimpleNamespace(
+            datetime=types.SimpleNamespace(now=lambda: datetime.datetime(2024, 1, 1, 12, 0)))
+        checked_out = []
+
+        def prepare_worktree(mirror, settings, sparse_path):
+            target_repo = saved_prepare_worktree(mirror, settings, sparse_path)
+            checked_out.append(sorted(os.path.relpath(os.path.join(root, name), target_repo.working_dir)
+                                      for root, dirs, files in os.walk(target_repo.working_dir)
+                                      for name in files if name != '.git'))
+            return target_repo
+
+        git_upload.prepare_worktree = prepare_worktree
+        os.chdir(tmp_dir)
+        try:
+            git_upload.upload_to_git_via_ssh()
+            assert checked_out == [[os.path.join('components', 'base', '202401011200', 'old.csv')]]
+            assert os.path.isdir('mirror') and not os.path.exists('tmp')
+            origin = git.Repo(origin_path)
+            pushed = origin.git.ls_tree('-r', '--name-only', 'prefixes-1').split()
+            assert 'components/base/202401011200/prefixes.csv' in pushed and 'README.md' in pushed
+
+            # Повторный запуск использует зеркало и получает из удаленного репозитория только новый коммит
+            with open(os.path.join('mirror', 'marker'), 'w', encoding='utf-8') as file:
+                file.write('mirror')
+            with open(os.path.join(source.working_dir, 'README.md'), 'a', encoding='utf-8') as file:
+                file.write('update')
+            source.git.commit('-am', 'update')
+            source.git.push(origin_path, 'main')
+            os.environ['NEW_REMOTE_BRANCH'] = 'prefixes-2'
+            git_upload.upload_to_git_via_ssh()
+            assert os.path.exists(os.path.join('mirror', 'marker')) and not os.path.exists('tmp')
+            assert len(checked_out) == 2 and checked_out[1] == checked_out[0]
+            assert origin.git.rev_parse('prefixes-2~1') == origin.git.rev_parse('main')
+            origin.close()
+            source.close()
+        finally:
+            git_upload.datetime, git_upload.prepare_worktree = saved_datetime, saved_prepare_worktree
+            os.chdir(cwd)
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
 
 if __name__ == '__main__':
    TestCaseAllLines()
+   TestCaseRangeToPrefixes()
+   TestCaseCachedRangePrefixes()
+   TestCaseVerifyPrefixes()
+   TestCaseRegistryDiff()
+   TestCaseBatchLookup()
+   TestCaseCsvScanner()
+   TestCaseWriters()
+   TestCaseRegistryCache()
+   TestCaseDownload()
+   TestCaseMetrics()
+   TestCaseSQLiteBackend()
+   TestCaseLookupService()
+   TestCaseParallelRebuild()
+   TestCasePrefixTrie()
+   TestCaseRegionDirectoryCache()
+   TestCaseTeasrDefSwap()
+   TestCaseParallelLoad()
+   TestCaseWatchDaemon()
+   TestCasePartialRegistryDownload()
+   TestCaseGitUpload()
+   TestCaseStartupTime()
 
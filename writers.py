@@ -0,0 +1,284 @@
+import os
+import csv
+import gzip
+import heapq
+import pickle
+import logging
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from tables import PREFIX_SETS_COLUMNS as COLUMNS, CSV_DATE_FORMAT, CSV_DATETIME_FORMAT
+
+# Форматы столбцов с датами
+DATE_COLUMNS = {'START_DATE': CSV_DATE_FORMAT, 'END_DATE': CSV_DATE_FORMAT, 'NAVI_DATE': CSV_DATETIME_FORMAT}
+PREFIX_INDEX = COLUMNS.index('PREFIX')
+
+# Количество записей, сортируемых в памяти за один раз
+DEFAULT_CHUNK_ROWS = 500000
+
+# Поддерживаемые форматы вывода
+FORMATS = ('csv', 'csv.gz', 'csv.zst', 'parquet')
+
+
+class WriteStats(NamedTuple):
+    """
+    Результат записи файла.
+
+    rows (int): Количество записанных строк.
+    size (int): Размер файла в байтах.
+    seconds (float): Время записи.
+    runs (int): Количество отсортированных частей, слитых при записи.
+    """
+    rows: int
+    size: int
+    seconds: float
+    runs: int
+
+
+def _sort_key(record: tuple) -> int:
+    return int(record[PREFIX_INDEX])
+
+
+def _spill(chunk: List[tuple], tmp_dir: str) -> str:
+    """
+    Сохраняет отсортированную часть записей во временный файл.
+
+    Параметры:
+    chunk (List[tuple]): Отсортированные записи.
+    tmp_dir (str): Папка для временных файлов.
+
+    Возвращает:
+    str: Путь к временному файлу.
+    """
+    fd, path = tempfile.mkstemp(suffix='.run', dir=tmp_dir)
+    with os.fdopen(fd, 'wb') as file:
+        pickler = pickle.Pickler(file, protocol=pickle.HIGHEST_PROTOCOL)
+        for record in chunk:
+            pickler.dump(record)
+    return path
+
+
+def _read_run(path: str) -> Iterator[tuple]:
+    """
+    Читает записи из временного файла отсортированной части.
+
+    Параметры:
+    path (str): Путь к временному файлу.
+    """
+    with open(path, 'rb') as file:
+        unpickler = pickle.Unpickler(file)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+
+def sorted_records(records: Iterable[tuple], chunk_rows: int, tmp_dir: str, runs: List[str]) -> Iterator[tuple]:
+    """
+    Сортирует записи по PREFIX с ограниченным потреблением памяти.
+
+    Если записей не больше chunk_rows, они сортируются в памяти. Иначе
+    записи сортируются частями по chunk_rows, части сохраняются во временные
+    файлы и сливаются (внешняя сортировка слиянием).
+
+    Параметры:
+    records (Iterable[tuple]): Записи в порядке столбцов COLUMNS.
+    chunk_rows (int): Размер части.
+    tmp_dir (str): Папка для временных файлов.
+    runs (List[str]): Пути к временным файлам частей. Пополняется.
+
+    Возвращает:
+    Iterator[tuple]: Отсортированные записи.
+    """
+    chunk: List[tuple] = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_rows:
+            chunk.sort(key=_sort_key)
+            runs.append(_spill(chunk, tmp_dir))
+            chunk = []
+    chunk.sort(key=_sort_key)
+    if not runs:
+        return iter(chunk)
+    if chunk:
+        runs.append(_spill(chunk, tmp_dir))
+    return heapq.merge(*(_read_run(path) for path in runs), key=_sort_key)
+
+
+def format_row(record: tuple) -> list:
+    """
+    Приводит запись к значениям строки CSV: даты форматируются, None записывается пустой строкой.
+
+    Параметры:
+    record (tuple): Запись в порядке столбцов COLUMNS.
+
+    Возвращает:
+    list: Значения строки.
+    """
+    row = []
+    for column, value in zip(COLUMNS, record):
+        if value is None:
+            row.append('')
+        elif isinstance(value, datetime):
+            row.append(value.strftime(DATE_COLUMNS[column]))
+        else:
+            row.append(value)
+    return row
+
+
+def _open_text(file_path: str, output_format: str, mode: str = 'w'):
+    """
+    Открывает файл для записи или чтения текста с учетом сжатия.
+
+    Параметры:
+    file_path (str): Путь к файлу.
+    output_format (str): 'csv', 'csv.gz' или 'csv.zst'.
+    mode (str): 'w' - запись, 'r' - чтение.
+    """
+    if output_format == 'csv.gz':
+        return gzip.open(file_path, f'{mode}t', newline='', encoding='utf-8')
+    if output_format == 'csv.zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Для формата csv.zst требуется пакет zstandard")
+        return zstandard.open(file_path, f'{mode}t', newline='', encoding='utf-8')
+    return open(file_path, mode, newline='', encoding='utf-8')
+
+
+def write_csv(records: Iterable[tuple], file_path: str, output_format: str = 'csv') -> int:
+    """
+    Записывает записи в CSV файл построчно, при необходимости со сжатием.
+
+    Параметры:
+    records (Iterable[tuple]): Отсортированные записи.
+    file_path (str): Путь к файлу.
+    output_format (str): 'csv', 'csv.gz' или 'csv.zst'.
+
+    Возвращает:
+    int: Количество записанных строк.
+    """
+    rows = 0
+    with _open_text(file_path, output_format) as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(COLUMNS)
+        for record in records:
+            writer.writerow(format_row(record))
+            rows += 1
+    return rows
+
+
+def write_parquet(records: Iterable[tuple], file_path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> int:
+    """
+    Записывает записи в файл Parquet группами строк по chunk_rows.
+
+    Параметры:
+    records (Iterable[tuple]): Отсортированные записи.
+    file_path (str): Путь к файлу.
+    chunk_rows (int): Размер группы строк.
+
+    Возвращает:
+    int: Количество записанных строк.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для формата parquet требуется пакет pyarrow")
+
+    types = {column: pa.int64() for column in COLUMNS}
+    types.update({'PREFIX': pa.string(), 'NAVI_USER': pa.string(), 'PSET_COMMENT': pa.string(), 'ACTION': pa.string()})
+    types.update({column: pa.timestamp('s') for column in DATE_COLUMNS})
+    schema = pa.schema([(column, types[column]) for column in COLUMNS])
+
+    rows = 0
+    with pq.ParquetWriter(file_path, schema) as writer:
+        batch: List[tuple] = []
+        for record in records:
+            batch.append(record[:PREFIX_INDEX] + (str(record[PREFIX_INDEX]),) + record[PREFIX_INDEX + 1:])
+            if len(batch) >= chunk_rows:
+                writer.write_table(pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in batch], schema=schema))
+                rows += len(batch)
+                batch = []
+        if batch or not rows:
+            writer.write_table(pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in batch], schema=schema))
+            rows += len(batch)
+    return rows
+
+
+def read_prefix_actions(file_path: str, output_format: str = 'csv') -> Iterator[Tuple[str, str]]:
+    """
+    Читает PREFIX и ACTION из файла, записанного write_records.
+
+    Параметры:
+    file_path (str): Путь к файлу.
+    output_format (str): Один из FORMATS.
+
+    Возвращает:
+    Iterator[Tuple[str, str]]: Пары (PREFIX, ACTION) в порядке файла.
+    """
+    action_index = COLUMNS.index('ACTION')
+    if output_format == 'parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Для формата parquet требуется пакет pyarrow")
+        for batch in pq.ParquetFile(file_path).iter_batches(columns=['PREFIX', 'ACTION']):
+            yield from zip(batch.column(0).to_pylist(), batch.column(1).to_pylist())
+        return
+    with _open_text(file_path, output_format, 'r') as file:
+        reader = csv.reader(file)
+        next(reader, None)  # Пропускаем заголовок
+        for row in reader:
+            yield row[PREFIX_INDEX], row[action_index]
+
+
+def get_writer(output_format: str) -> Callable[[Iterable[tuple], str, int], int]:
+    """
+    Возвращает функцию записи для формата вывода.
+
+    Параметры:
+    output_format (str): Один из FORMATS.
+
+    Возвращает:
+    Callable[[Iterable[tuple], str, int], int]: Функция (записи, путь, размер части) -> количество строк.
+    """
+    if output_format == 'parquet':
+        return write_parquet
+    if output_format in ('csv', 'csv.gz', 'csv.zst'):
+        return lambda records, file_path, chunk_rows: write_csv(records, file_path, output_format)
+    raise ValueError(f"Неизвестный формат вывода: {output_format}. Допустимые значения: {', '.join(FORMATS)}")
+
+
+def write_records(records: Iterable[tuple], file_path: str, output_format: str = 'csv',
+                  chunk_rows: Optional[int] = None) -> WriteStats:
+    """
+    Записывает записи, отсортированные по PREFIX, в файл выбранного формата.
+
+    Параметры:
+    records (Iterable[tuple]): Записи в порядке столбцов COLUMNS.
+    file_path (str): Путь к файлу.
+    output_format (str): Один из FORMATS.
+    chunk_rows (Optional[int]): Количество записей, сортируемых в памяти за один раз.
+
+    Возвращает:
+    WriteStats: Количество строк, размер файла, время записи и число слитых частей.
+    """
+    writer = get_writer(output_format)
+    chunk_rows = chunk_rows or DEFAULT_CHUNK_ROWS
+    started = time.perf_counter()
+    runs: List[str] = []
+    tmp_dir = os.path.dirname(os.path.abspath(file_path))
+    try:
+        rows = writer(sorted_records(records, chunk_rows, tmp_dir, runs), file_path, chunk_rows)
+    finally:
+        for path in runs:
+            os.remove(path)
+    seconds = time.perf_counter() - started
+    stats = WriteStats(rows, os.path.getsize(file_path), seconds, len(runs))
+    logging.info(f"Записан файл {file_path} ({output_format}): {stats.rows} строк, {stats.size} байт, "
+                 f"{stats.seconds:.3f} с ({stats.rows / seconds if seconds else 0:.0f} строк/с, "
+                 f"{stats.size / seconds / 1024 / 1024 if seconds else 0:.1f} МБ/с), частей сортировки {stats.runs}")
+    return stats